@@ -0,0 +1,192 @@
+from __future__ import annotations
+from typing import Generator, List
+import marshal
+
+
+# Nodes of the abstract syntax tree. A node keeps the index of its first token
+# in the TokenBuffer it was parsed from, so that diagnostics can point at the
+# source, and identifier ids from the same buffer.
+
+class Node:
+    __slots__ = ("tok",)
+
+    tok: int  # Token index
+
+    def __init__(self, tok: int, *fields):
+        self.tok = tok
+        for name, value in zip(self.fields(), fields):
+            setattr(self, name, value)
+
+    @classmethod
+    def fields(cls) -> List[str]:
+        # Slots of the subclass, in the order of the constructor
+        return cls.__slots__
+
+    def __eq__(self, __o: object) -> bool:
+        return type(__o) is type(self) and __o.tok == self.tok and \
+            all(getattr(__o, f) == getattr(self, f) for f in self.fields())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.fields())
+        return f"{type(self).__name__}(tok={self.tok}, {fields})"
+
+
+# Expressions
+
+class Num(Node):
+    __slots__ = ("value",)
+
+
+class Designator(Node):
+    # tok is the identifier
+    __slots__ = ("id", "indices")  # indices: expressions, empty for scalars
+
+
+class BinOp(Node):
+    __slots__ = ("op", "left", "right")  # op: token type of the operator
+
+
+class Call(Node):
+    # tok is the function name. Also a statement.
+    __slots__ = ("id", "args")
+
+
+class Relation(Node):
+    __slots__ = ("op", "left", "right")  # op: token type of the operator
+
+
+# Statements
+
+class Assign(Node):
+    __slots__ = ("target", "value")
+
+
+class If(Node):
+    __slots__ = ("cond", "then", "orelse", "end")  # end: token index of "fi"
+
+
+class While(Node):
+    __slots__ = ("cond", "body", "end")  # end: token index of "od"
+
+
+class Return(Node):
+    __slots__ = ("value",)  # None without a value
+
+
+# Declarations
+
+class VarDecl(Node):
+    # idents: token indices of the identifiers
+    __slots__ = ("dims", "idents")  # dims: None for scalars
+
+
+class FuncDecl(Node):
+    # tok is the function name. params: token indices of the parameters.
+    __slots__ = ("id", "is_void", "params", "decls", "body")
+
+
+class Computation(Node):
+    __slots__ = ("decls", "funcs", "body")
+
+
+NODES = [Num, Designator, BinOp, Call, Relation, Assign, If, While, Return,
+         VarDecl, FuncDecl, Computation]
+_TAGS = {cls: tag for tag, cls in enumerate(NODES)}
+
+VERSION = 2
+
+
+def encode(node: Node) -> list:
+    # A flat list of records (tag, tok, *fields), the children of a node
+    # before it and the root last. A node in a field is the tuple (index,) of
+    # its record, so a tree of any depth stays within the nesting marshal
+    # allows. The tree is walked with a stack for the same reason.
+    records = []
+    index = {}  # id(node): index of its record
+    stack = [(node, False)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            index[id(node)] = len(records)
+            records.append((_TAGS[type(node)], node.tok,
+                            *(_ref(getattr(node, f), index)
+                              for f in node.fields())))
+            continue
+
+        stack.append((node, True))
+        for f in reversed(node.fields()):
+            value = getattr(node, f)
+            for child in reversed(value if isinstance(value, list)
+                                  else [value]):
+                if isinstance(child, Node):
+                    stack.append((child, False))
+    return records
+
+
+def _ref(value, index: dict):
+    # A field of a record. Lists of nodes become lists of references.
+    if isinstance(value, Node):
+        return (index[id(value)],)
+    elif isinstance(value, list):
+        return [(index[id(item)],) if isinstance(item, Node) else item
+                for item in value]
+    return value
+
+
+def decode(records: list) -> Node:
+    nodes = []
+    for tag, tok, *fields in records:
+        nodes.append(NODES[tag](tok, *(_deref(value, nodes)
+                                       for value in fields)))
+    return nodes[-1]
+
+
+def _deref(value, nodes: List[Node]):
+    if isinstance(value, tuple):
+        return nodes[value[0]]
+    elif isinstance(value, list):
+        return [nodes[item[0]] if isinstance(item, tuple) else item
+                for item in value]
+    return value
+
+
+def dumps(node: Node) -> bytes:
+    return marshal.dumps((VERSION, encode(node)))
+
+
+def loads(data: bytes) -> Node:
+    version, value = marshal.loads(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported AST version {version}")
+    return decode(value)
+
+
+def run_nested(nonterminal: Generator):
+    # Run a parsing or lowering method that is a generator. It yields the
+    # generator of each statement nested in it, and is sent back its result.
+    # The nested ones are kept on a list rather than on the Python stack, so
+    # that statements can be nested as deep as memory allows. An exception is
+    # thrown into each enclosing generator in turn, as if they were calls.
+    stack = [nonterminal]
+    value = error = None
+    while True:
+        try:
+            if error is None:
+                nested = stack[-1].send(value)
+            else:
+                nested = stack[-1].throw(error)
+        except StopIteration as e:
+            stack.pop()
+            value, error = e.value, None
+        except Exception as e:
+            stack.pop()
+            error = e
+        else:
+            stack.append(nested)
+            value = None
+            continue
+
+        if not stack:
+            if error is not None:
+                raise error
+            return value
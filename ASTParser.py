@@ -0,0 +1,542 @@
+from __future__ import annotations
+from typing import Generator, List
+from Tokenizer import SliceTokenizer, Token
+from TokenBuffer import TokenBuffer
+from Function import PREDEFINED_FUNCTIONS
+import AST
+from AST import run_nested
+
+
+# What an expression is nested in, see ASTParser.expression()
+_TOP, _PAREN, _INDEX, _ARGS = range(4)
+
+
+class ASTParser:
+    # The grammar of SmplCompiler, producing an AST instead of emitting SSA.
+    # Parses a scanned TokenBuffer by token index, so no Token objects are
+    # created unless a diagnostic needs one. Semantic checks are left to the
+    # lowering pass.
+
+    buffer: TokenBuffer
+    idx: int  # Index of the current token
+    type: int  # Type of the current token
+
+    STATEMENTS = [Token.LET, Token.CALL, Token.IF, Token.WHILE, Token.RETURN]
+    FACTORS = [Token.IDENT, Token.NUMBER, Token.OPENPAREN, Token.CALL]
+
+    def __init__(self, buffer: TokenBuffer, skip_bodies: bool = False):
+        self.buffer = buffer
+        self.types = buffer.types
+        self.values = buffer.values
+        self.last = len(buffer) - 1  # EOF or ERROR, repeated at the end
+        self.idx = 0
+        self.type = self.types[0]
+
+        # A pre-scan of the declarations leaves the statements of function
+        # and main bodies out, and keeps the index of their "{"
+        self.skip_bodies = skip_bodies
+        self.skipped = []
+
+    @classmethod
+    def from_file(cls, file: str, use_mmap: bool = False,
+                  source=None) -> ASTParser:
+        # The predefined functions come first, as in SmplCompiler, so that
+        # identifiers get the same ids
+        tokenizer = SliceTokenizer(file, use_mmap=use_mmap, source=source)
+        for func in PREDEFINED_FUNCTIONS:
+            tokenizer.add_name(func)
+        return cls(TokenBuffer.scan(tokenizer))
+
+    @property
+    def inputSym(self) -> Token:
+        return self.buffer.token(self.idx)
+
+    def seek(self, idx: int) -> None:
+        self.idx = idx
+        self.type = self.types[idx]
+
+    def _next(self) -> None:
+        if self.idx < self.last:
+            self.idx += 1
+            self.type = self.types[self.idx]
+
+    def _check_token(self, token: int, msg: str) -> None:
+        # msg is formatted with the current token only on failure
+        assert self.type == token, msg.format(self.inputSym)
+
+    def _check_tokens(self, tokens: List[int], msg: str) -> None:
+        assert self.type in tokens, msg.format(self.inputSym)
+
+    def _skip_body(self) -> None:
+        # Statements have no braces, so the body ends at the next "}"
+        self.skipped.append(self.idx)
+        while self.type != Token.END and self.idx < self.last:
+            self._next()
+
+    def _ident(self) -> int:
+        # Identifier id of the current token
+        return self.values[self.idx]
+
+    def _num(self) -> int:
+        num = self.values[self.idx]
+        if num == TokenBuffer.NO_VALUE:
+            num = self.inputSym.value  # Too large for the buffer
+        return num
+
+    def designator(self) -> AST.Designator:
+        # designator = ident{ "[" expression "]" }
+
+        self._check_token(Token.IDENT, 'Expecting identifier at the beginning '
+                          'of designator, found {}')
+        node = AST.Designator(self.idx, self._ident(), [])
+        self._next()
+
+        while self.type == Token.OPENBRACKET:
+            self._next()
+
+            # Get array dimension(s)
+            node.indices.append(self.expression())
+
+            self._check_token(Token.CLOSEBRACKET, 'Expecting "]", found {}')
+            self._next()
+
+        return node
+
+    def expression(self) -> AST.Node:
+        # expression = term {("+" | "-") term}
+        # term = factor { ("*" | "/") factor}
+        # factor = designator | number | "(" expression ")" | funcCall
+        #
+        # Parsed in a loop, as in SmplCompiler.expression(), so that deeply
+        # nested expressions don't hit the recursion limit. An expression in
+        # parentheses, an array index or a call argument saves the state of
+        # the expression around it on a stack.
+
+        stack = []  # State of the expressions around this one
+        kind = _TOP
+        info = None  # Designator or call an index or argument belongs to
+        expr = expr_op = term = term_op = None
+
+        while True:
+            # A factor, or the beginning of an expression nested in it
+            if self.type == Token.IDENT:
+                node = AST.Designator(self.idx, self._ident(), [])
+                self._next()
+
+                if self.type == Token.OPENBRACKET:
+                    self._next()
+                    stack.append((kind, info, expr, expr_op, term, term_op))
+                    kind, info = _INDEX, node
+                    expr = expr_op = term = term_op = None
+                    continue
+
+            elif self.type == Token.NUMBER:
+                node = AST.Num(self.idx, self._num())
+                self._next()
+
+            elif self.type == Token.OPENPAREN:
+                self._next()
+                stack.append((kind, info, expr, expr_op, term, term_op))
+                kind, info = _PAREN, None
+                expr = expr_op = term = term_op = None
+                continue
+
+            elif self.type == Token.CALL:
+                self._next()
+                self._check_token(Token.IDENT, 'Expecting function name, '
+                                  'found {}')
+                node = AST.Call(self.idx, self._ident(), [])
+                self._next()
+
+                if self.type == Token.OPENPAREN:
+                    self._next()
+                    if self.type != Token.CLOSEPAREN:
+                        stack.append((kind, info, expr, expr_op, term,
+                                      term_op))
+                        kind, info = _ARGS, node
+                        expr = expr_op = term = term_op = None
+                        continue
+                    self._next()
+
+            else:
+                raise Exception(
+                    f"Factor starts with unexpected token {self.inputSym}")
+
+            # The factor ends, and maybe the expressions it ends
+            while True:
+                if term_op is None:
+                    term = node
+                else:
+                    term = AST.BinOp(term.tok, term_op, term, node)
+                    term_op = None
+
+                if self.type == Token.TIMES or self.type == Token.DIV:
+                    term_op = self.type
+                    self._next()
+                    break
+
+                # The term ends
+                if expr_op is None:
+                    expr = term
+                else:
+                    expr = AST.BinOp(expr.tok, expr_op, expr, term)
+                    expr_op = None
+
+                if self.type == Token.PLUS or self.type == Token.MINUS:
+                    expr_op = self.type
+                    self._next()
+                    break
+
+                # The expression ends
+                node = expr
+                if kind == _TOP:
+                    return node
+
+                if kind == _PAREN:
+                    self._check_token(Token.CLOSEPAREN,
+                                      "Unmatched parentheses in factor!")
+                    self._next()
+
+                elif kind == _INDEX:
+                    info.indices.append(node)
+                    self._check_token(Token.CLOSEBRACKET,
+                                      'Expecting "]", found {}')
+                    self._next()
+                    if self.type == Token.OPENBRACKET:
+                        self._next()
+                        expr = None
+                        break
+                    node = info
+
+                else:
+                    info.args.append(node)
+                    if self.type == Token.COMMA:
+                        self._next()
+                        assert self.type != Token.CLOSEPAREN
+                    if self.type != Token.CLOSEPAREN:
+                        expr = None
+                        break
+                    self._next()
+                    node = info
+
+                # The factor it is nested in ends next
+                kind, info, expr, expr_op, term, term_op = stack.pop()
+
+    def relation(self) -> AST.Relation:
+        # relation = expression relOp expression
+
+        left = self.expression()
+
+        self._check_tokens(Token.RELOPS, 'Expecting relation operator, found '
+                           '{}')
+        op = self.type
+        self._next()
+
+        return AST.Relation(left.tok, op, left, self.expression())
+
+    def assignment(self) -> AST.Assign:
+        # assignment = "let" designator "<-" expression
+
+        tok = self.idx
+        self._check_token(Token.LET, 'Expecting keyword "let", found {}')
+        self._next()
+
+        target = self.designator()
+
+        self._check_token(Token.BECOMES, 'Expecting "<-" after variable name, '
+                          'found {}')
+        self._next()
+
+        return AST.Assign(tok, target, self.expression())
+
+    def funcCall(self) -> AST.Call:
+        # funcCall = "call" ident [ "(" [expression { "," expression } ] ")" ]
+
+        self._check_token(Token.CALL, 'Expecting keyword "call" at the '
+                          'begining of funcCall, found {}')
+        self._next()
+
+        self._check_token(Token.IDENT, 'Expecting function name, found {}')
+        node = AST.Call(self.idx, self._ident(), [])
+        self._next()
+
+        if self.type == Token.OPENPAREN:
+            self._next()
+
+            while self.type != Token.CLOSEPAREN:
+                node.args.append(self.expression())
+
+                if self.type == Token.COMMA:
+                    self._next()
+                    assert self.type != Token.CLOSEPAREN
+
+            self._check_token(Token.CLOSEPAREN, 'Expecting ")", found {}')
+            self._next()
+
+        return node
+
+    def ifStatement(self) -> Generator[Generator, None, AST.If]:
+        # ifStatement = "if" relation "then" statSequence [ "else" statSequence ] "fi"
+
+        tok = self.idx
+        self._check_token(Token.IF, 'Expecting "if" at the begining of '
+                          'ifStatement, found {}')
+        self._next()
+        cond = self.relation()
+
+        self._check_token(Token.THEN, 'Expecting "then" in ifStatement, found '
+                          '{}')
+        self._next()
+        then = yield self.statSequence()
+
+        orelse = None
+        if self.type == Token.ELSE:
+            self._next()
+            orelse = yield self.statSequence()
+
+        self._check_token(Token.FI, 'Expecting "fi" at the end of ifStatement, '
+                          'found {}')
+        end = self.idx
+        self._next()
+
+        return AST.If(tok, cond, then, orelse, end)
+
+    def whileStatement(self) -> Generator[Generator, None, AST.While]:
+        # whileStatement = "while" relation "do" StatSequence "od"
+
+        tok = self.idx
+        self._check_token(Token.WHILE, 'Expecting "while" at the begining of '
+                          'whileStatement, found {}')
+        self._next()
+        cond = self.relation()
+
+        self._check_token(Token.DO, 'Expecting "do" in whileStatement, found '
+                          '{}')
+        self._next()
+        body = yield self.statSequence()
+
+        self._check_token(Token.OD, 'Expecting "od" at the end of '
+                          'whileStatement, found {}')
+        end = self.idx
+        self._next()
+
+        return AST.While(tok, cond, body, end)
+
+    def returnStatement(self) -> AST.Return:
+        # returnStatement = "return" [ expression ]
+
+        tok = self.idx
+        self._check_token(Token.RETURN, 'Expecting "return" at the begining of '
+                          'returnStatement, found {}')
+        self._next()
+
+        value = None
+        if self.type in self.FACTORS:
+            value = self.expression()
+
+        return AST.Return(tok, value)
+
+    def statement(self) -> Generator[Generator, None, AST.Node]:
+        # statement = assignment | funcCall | ifStatement | whileStatement | returnStatement
+
+        if self.type == Token.LET:
+            return self.assignment()
+        elif self.type == Token.CALL:
+            return self.funcCall()
+        elif self.type == Token.IF:
+            return (yield self.ifStatement())
+        elif self.type == Token.WHILE:
+            return (yield self.whileStatement())
+        elif self.type == Token.RETURN:
+            return self.returnStatement()
+        else:
+            raise Exception(f'Expecting statment, found {self.inputSym}')
+
+    def statSequence(self) -> Generator[Generator, None, List[AST.Node]]:
+        # statSequence = statement { ";" statement } [ ";" ]
+
+        # Statements are nested in ifs and whiles as deep as the source goes,
+        # so these methods are generators, run by run_nested(). Each yields
+        # the statement method it would call.
+
+        # Check for the first assignment
+        self._check_tokens(self.STATEMENTS, 'Expecting statement, found {}')
+
+        statements = []
+        while self.type in self.STATEMENTS:
+            statements.append((yield self.statement()))
+
+            if self.type == Token.SEMI:
+                self._next()
+            else:
+                break
+
+        return statements
+
+    def typeDecl(self) -> List[int]:
+        # typeDecl = "var" | "array" "[" number "]" { "[" number "]" }
+
+        # Return the dimensions of an array, None for a scalar
+        if self.type == Token.VAR:
+            self._next()
+            return None
+
+        elif self.type == Token.ARR:
+            self._next()
+
+            # Check for the first open bracket
+            self._check_token(Token.OPENBRACKET, 'Expecting "[", found {}')
+
+            dims = []
+            while self.type == Token.OPENBRACKET:
+                self._next()
+
+                self._check_token(Token.NUMBER, 'Expecting number, found {}')
+                dims.append(self._num())
+                self._next()
+
+                self._check_token(Token.CLOSEBRACKET, 'Expecting "]", found {}')
+                self._next()
+            return dims
+
+        else:
+            raise Exception('Excepting "var" or "array" at the beginning of '
+                            f'typeDecl, found {self.inputSym}')
+
+    def varDecl(self) -> AST.VarDecl:
+        # varDecl = typeDecl ident { "," ident } ";"
+
+        node = AST.VarDecl(self.idx, self.typeDecl(), [])
+
+        while True:
+            self._check_token(Token.IDENT, 'Expecting identifier, found {}')
+            node.idents.append(self.idx)
+            self._next()
+
+            if self.type == Token.COMMA:
+                self._next()
+            elif self.type == Token.SEMI:
+                self._next()
+                break
+            else:
+                raise Exception(f'Excepting "," or ";", found {self.inputSym}')
+
+        return node
+
+    def funcDecl(self) -> AST.FuncDecl:
+        # funcDecl = [ "void" ] "function" ident formalParam ";" funcBody ";"
+
+        is_void = False
+
+        if self.type == Token.VOID:
+            self._next()
+            is_void = True
+
+        self._check_token(Token.FUNC, 'Expecting keyword "function" at the '
+                          'beginning of funcDecl, found {}')
+        self._next()
+
+        self._check_token(Token.IDENT, 'Expecting identifier after keyword '
+                          '"function", found {}')
+        node = AST.FuncDecl(self.idx, self._ident(), is_void, None, None, None)
+        self._next()
+
+        node.params = self.formalParam()
+
+        self._check_token(Token.SEMI, 'Expecting ";" after formalParam, '
+                          'found {}')
+        self._next()
+
+        node.decls, node.body = self.funcBody()
+
+        self._check_token(Token.SEMI, 'Expecting ";" after funcBody, '
+                          'found {}')
+        self._next()
+
+        return node
+
+    def formalParam(self) -> List[int]:
+        # formalParam = "(" [ident { "," ident }] ")"
+
+        self._check_token(Token.OPENPAREN, 'Expecting "(" at the begining of '
+                          'formalParam, found {}')
+        self._next()
+
+        params = []
+        while self.type == Token.IDENT:
+            params.append(self.idx)
+            self._next()
+
+            if self.type == Token.COMMA:
+                self._next()
+                self._check_token(Token.IDENT, 'Expecting identifier after '
+                                  'comma, found {}')
+            else:
+                break
+
+        self._check_token(Token.CLOSEPAREN, 'Expecting ")" at the end of '
+                          'formalParam, found {}')
+        self._next()
+        return params
+
+    def funcBody(self):
+        # funcBody = { varDecl } "{" [ statSequence ] "}"
+
+        decls = []
+        while self.type in [Token.VAR, Token.ARR]:
+            decls.append(self.varDecl())
+
+        self._check_token(Token.BEGIN, 'Expecting "{{" at the begining of '
+                          'funcBody, found {}')
+        body = []
+        if self.skip_bodies:
+            self._skip_body()
+            body = None
+        else:
+            self._next()
+            if self.type != Token.END:
+                body = run_nested(self.statSequence())
+
+        self._check_token(Token.END, 'Expecting "}}" at the end of '
+                          'funcBody, found {}')
+        self._next()
+        return decls, body
+
+    def body(self, begin: int) -> List[AST.Node]:
+        # The main body left out by a pre-scan, begin is the index of its "{"
+        self.seek(begin)
+        self._next()
+        body = run_nested(self.statSequence())
+        self._check_token(Token.END, 'Expecting "}}", found {}')
+        return body
+
+    def computation(self) -> AST.Computation:
+        # computation = "main" { varDecl } { funcDecl } "{" statSequence "}" "."
+
+        self._check_token(Token.MAIN, 'Expecting keyword "main" at the start '
+                          'of computation, found {}')
+        node = AST.Computation(self.idx, [], [], None)
+        self._next()
+
+        while self.type == Token.VAR or self.type == Token.ARR:
+            node.decls.append(self.varDecl())
+
+        # Create functions
+        while self.type == Token.VOID or self.type == Token.FUNC:
+            node.funcs.append(self.funcDecl())
+
+        self._check_token(Token.BEGIN, 'Expecting "{{", found {}')
+        if self.skip_bodies:
+            self._skip_body()
+        else:
+            self._next()
+            node.body = run_nested(self.statSequence())
+
+        self._check_token(Token.END, 'Expecting "}}", found {}')
+        self._next()
+
+        self._check_token(Token.PERIOD, 'Expecting "." at the end of '
+                          'computation, found {}')
+        self._next()
+
+        return node
@@ -0,0 +1,162 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, TextIO, Tuple
+import contextlib
+import io
+import os
+import sys
+import time
+
+from SmplCompiler import SmplCompiler, SmplCDebug, TraceWriter, \
+    JsonTraceWriter
+
+
+# Compiles many files in a pool of worker processes, so that the interpreter
+# and the compiler modules are loaded once per worker instead of once per file.
+
+
+class BatchResult:
+    file: str  # As given, or found in a directory
+    name: str  # Relative to the directory it was found in
+    ok: bool
+    ir: str  # Text dump of the IR, None on an error
+    diagnostics: str  # Warnings and the error
+    elapsed: float  # Seconds
+    trace: str  # Parse trace, if asked for
+    dot: str  # Graphviz source of the IR, if asked for
+
+    def __init__(self, file: str, name: str):
+        self.file = file
+        self.name = name
+        self.ok = False
+        self.ir = None
+        self.diagnostics = ""
+        self.elapsed = 0.0
+        self.trace = None
+        self.dot = None
+
+    def __str__(self) -> str:
+        status = "ok" if self.ok else "FAILED"
+        warnings = self.diagnostics.count("WARNING:")
+        s = f"{status:<6} {self.file} {self.elapsed * 1000:.1f} ms"
+        if warnings:
+            s += f", {warnings} warning{'s' if warnings > 1 else ''}"
+        return s
+
+
+def find_sources(paths: List[str]) -> List[Tuple[str, str]]:
+    # (file, name) of the given files, and of the .smpl files in the given
+    # directories, recursively and sorted
+    sources = []
+    for path in paths:
+        if not os.path.isdir(path):
+            sources.append((path, os.path.basename(path)))
+            continue
+        found = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith(".smpl"):
+                    file = os.path.join(root, file)
+                    found.append((file, os.path.relpath(file, path)))
+        sources.extend(found)
+    return sources
+
+
+def compile_file(file: str, name: str, use_mmap: bool = False, source=None,
+                 trace: str = None, dot: bool = False,
+                 verbose: bool = False) -> BatchResult:
+    # source: compile it instead of reading file. trace: "text", "json" or
+    # "tree", as the --trace-format of smpl.py. dot: also keep the graph of
+    # the IR, with all instructions if verbose, see IRVis.
+    result = BatchResult(file, name)
+    debug = None
+    trace_out = io.StringIO()
+    if trace:
+        # A tree is written as the text trace, so it is streamed the same way
+        writer_cls = JsonTraceWriter if trace == "json" else TraceWriter
+        debug = SmplCDebug(writer=writer_cls(trace_out), tree=False)
+
+    out = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            if source is not None:
+                smplCompiler = SmplCompiler.from_source(source, name=file,
+                                                        debug=debug)
+            else:
+                smplCompiler = SmplCompiler(file, debug=debug,
+                                            use_mmap=use_mmap)
+            # A process of the batch or the server compiles many files, so the
+            # mapping of each is released when it is done
+            with smplCompiler:
+                smplCompiler.computation()
+                result.ir = smplCompiler.dump()
+                if dot:
+                    from IRVis import IRVis
+                    vis = IRVis(debug=verbose)
+                    smplCompiler.vis(vis)
+                    result.dot = vis.source()
+        result.ok = True
+    except Exception as e:
+        # Errors are reported with the file, the batch goes on
+        print(e if str(e) else type(e).__name__, file=out)
+    result.elapsed = time.perf_counter() - start
+    result.diagnostics = out.getvalue()
+    if trace:
+        result.trace = trace_out.getvalue()
+    return result
+
+
+def compile_batch(sources: List[Tuple[str, str]], jobs: int = None,
+                  use_mmap: bool = False) -> Iterator[BatchResult]:
+    # Results in the order of sources, as they are done
+    jobs = jobs if jobs else os.cpu_count()
+    if jobs == 1 or len(sources) < 2:
+        for file, name in sources:
+            yield compile_file(file, name, use_mmap)
+        return
+
+    files = [file for file, _ in sources]
+    names = [name for _, name in sources]
+    chunksize = max(1, len(sources) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(sources))) as executor:
+        yield from executor.map(compile_file, files, names,
+                                [use_mmap] * len(sources), chunksize=chunksize)
+
+
+def write_result(result: BatchResult, out_dir: str) -> None:
+    # <name>.ir, and <name>.log with the diagnostics if there are any
+    base = os.path.join(out_dir, os.path.splitext(result.name)[0])
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    if result.ir is not None:
+        with open(base + ".ir", "w") as f:
+            f.write(result.ir)
+    if result.diagnostics:
+        with open(base + ".log", "w") as f:
+            f.write(result.diagnostics)
+
+
+def run(paths: List[str], jobs: int = None, out_dir: str = None,
+        use_mmap: bool = False, verbose: bool = False,
+        log: TextIO = None) -> int:
+    # Compile all, report each file and a summary to log, stdout by default.
+    # Return the number of files that failed.
+    log = log if log else sys.stdout
+    sources = find_sources(paths)
+    failed = 0
+    start = time.perf_counter()
+    for result in compile_batch(sources, jobs, use_mmap):
+        if out_dir:
+            write_result(result, out_dir)
+        print(result, file=log)
+        if not result.ok:
+            failed += 1
+        if result.diagnostics and (verbose or not result.ok):
+            print(result.diagnostics, end="", file=log)
+    elapsed = time.perf_counter() - start
+
+    rate = len(sources) / elapsed if elapsed > 0 else 0.0
+    print(f"{len(sources)} files, {failed} failed in {elapsed:.3f}s "
+          f"({rate:.1f} files/s)", file=log)
+    return failed
@@ -1,14 +1,16 @@
 from __future__ import annotations
 from typing import List, Dict, Set
 import copy
+import contextlib
 import SSA
+from CompilationContext import CompilationContext
 
 
 class CSTable:
     table: Dict[SSA.OP, SSA.Inst]
 
     BLACK_LIST = SSA.OP.IO_OP | SSA.OP.BRANCH_OP | SSA.OP.FUNC_OP | \
-        {SSA.OP.PHI}
+        {SSA.OP.PHI, SSA.OP.NOP}
 
     def __init__(self):
         self.table = {op: None for op in set(SSA.OP) - CSTable.BLACK_LIST}
@@ -31,9 +33,11 @@ class CSTable:
 
 class ValueTable:
     table: Dict[int, SSA.Inst]
+    replaced: List[SSA.Inst]
 
     def __init__(self):
         self.table = {}  # {identifier id: SSA inst}
+        self.replaced = []  # Values set before, which may have been copied
 
     def has(self, ident: int) -> bool:
         if ident in self.table:
@@ -44,6 +48,9 @@ class ValueTable:
     def set(self, ident: int, inst: SSA.Inst) -> None:
         _inst = copy.copy(inst)
         _inst.identifier = ident
+        _inst.copied_from = inst
+        if ident in self.table:
+            self.replaced.append(self.table[ident])
         self.table[ident] = _inst
 
     def get(self, ident: int) -> SSA.Inst:
@@ -69,8 +76,12 @@ class Block:
         self.next = None
 
         # Unique block id
-        self.id = Block.CNT
-        Block.CNT += 1
+        ctx = CompilationContext.current()
+        if ctx:
+            self.id = ctx.add_block()
+        else:
+            self.id = Block.CNT
+            Block.CNT += 1
 
     def __eq__(self, __o: object) -> bool:
         return isinstance(__o, Block) and __o.id == self.id
@@ -141,11 +152,6 @@ class Block:
             block = block.prev
         return None
 
-    def replace_operand(self, _from: SSA.Inst, _from_ident: int,
-                        _to: SSA.Inst) -> None:
-        # Change all usages of _from to _to. This is for loop statements
-        raise Exception("Unimplemented!")
-
     def dot_name(self) -> str:
         return f"Block{self.id}"
 
@@ -166,10 +172,12 @@ class BasicBlock(Block):
     insts: List[SSA.Inst]
     bbid: int
     killStores: Set[SSA.Inst]
+    ctx: CompilationContext
+    unreachable: bool
 
     ALL_BB: List[BasicBlock]
 
-    # Global count of all basic blocks
+    # Global count of all basic blocks, used outside of a CompilationContext
     CNT = 0
     ALL_BB = []
 
@@ -180,11 +188,19 @@ class BasicBlock(Block):
         self.cs_table = CSTable()
         self.insts = []
         self.killStores = set()
+        # Set by a pass that found no path from the entry to this block
+        self.unreachable = False
 
         # Unique basic block id
-        self.bbid = BasicBlock.CNT
-        BasicBlock.CNT += 1
-        BasicBlock.ALL_BB.append(self)
+        ctx = CompilationContext.current()
+        # Kept for instructions created after the compilation, see add_nop()
+        self.ctx = ctx
+        if ctx:
+            self.bbid = ctx.add_bb(self)
+        else:
+            self.bbid = BasicBlock.CNT
+            BasicBlock.CNT += 1
+            BasicBlock.ALL_BB.append(self)
 
     def get_prev_cs_bb(self) -> BasicBlock:
         # If returns None, means this is the first block
@@ -245,14 +261,25 @@ class BasicBlock(Block):
         ssa.bb = self
 
     def add_nop(self) -> SSA.Inst:
-        nop = SSA.Inst(SSA.OP.NOP)
+        # Can be called lazily, e.g. when printing a branch to an empty block
+        with self.ctx or contextlib.nullcontext():
+            nop = SSA.Inst(SSA.OP.NOP)
         self.add_inst(nop)
         return nop
 
-    def replace_operand(self, _from: SSA.Inst, _from_ident: int,
-                        _to: SSA.Inst) -> None:
+    def remove_insts(self, ids: Set[int]) -> None:
+        # Remove the instructions with these ids, e.g. that a pass found to be
+        # constant or dead. They no longer use their operands and have no
+        # block.
+        insts = []
         for inst in self.insts:
-            inst.replace_operand(_from, _from_ident, _to)
+            if inst.id in ids:
+                if isinstance(inst, SSA.Inst):
+                    inst.drop_operands()
+                inst.bb = None
+            else:
+                insts.append(inst)
+        self.insts = insts
 
     def _get_all_insts(self) -> List[SSA.Inst]:
         return self.insts
@@ -320,6 +347,17 @@ class JoinBB(BasicBlock):
                 return self.joiningBlock
         return None
 
+    def remove_insts(self, ids: Set[int]) -> None:
+        phiInsts = []
+        for phi in self.phiInsts:
+            if phi.id in ids:
+                phi.drop_operands()
+                phi.bb = None
+            else:
+                phiInsts.append(phi)
+        self.phiInsts = phiInsts
+        super().remove_insts(ids)
+
     def _get_all_insts(self) -> List[SSA.Inst]:
         return self.phiInsts + self.insts
 
@@ -330,25 +368,35 @@ class SuperBlock(Block):
     head: Block  # First block in the super block.
     tail: Block  # Last block in the super block. Can be the same as head.
     name: str    # Describe the super block, e.g. "while statement"
+    # Kept once the super block is finished, see finish()
+    value_table: ValueTable
+    stores: Set[SSA.Inst]
 
     def __init__(self, name: str = ""):
         super().__init__()
         self.head = None
         self.tail = None
         self.name = name
+        self.value_table = None
+        self.stores = None
 
     def __str__(self) -> str:
         return f"SuperBlock b{self.id}"
 
+    # Super blocks can be nested as deep as statements, so they are traversed
+    # in loops rather than recursively
+
     def get_firstbb(self) -> BasicBlock:
-        if isinstance(self.head, SuperBlock):
-            return self.head.get_firstbb()
-        return self.head
+        block = self.head
+        while isinstance(block, SuperBlock):
+            block = block.head
+        return block
 
     def get_lastbb(self) -> BasicBlock:
-        if isinstance(self.tail, SuperBlock):
-            return self.tail.get_lastbb()
-        return self.tail
+        block = self.tail
+        while isinstance(block, SuperBlock):
+            block = block.tail
+        return block
 
     def set_prev(self, block: Block) -> None:
         super().set_prev(block)
@@ -362,8 +410,8 @@ class SuperBlock(Block):
         if lastbb:
             lastbb.next = block
 
-    def get_value_table(self) -> ValueTable:
-        # Merge value table from head to tail
+    def _value_table_blocks(self) -> List[Block]:
+        # The blocks of get_value_table() from tail to head
         blocks = []
         block = self.tail
         while block != self.head:
@@ -374,17 +422,30 @@ class SuperBlock(Block):
                 blocks.append(block.joiningBlock)
             block = block.prev
         blocks.append(self.head)
+        return blocks
+
+    def get_value_table(self) -> ValueTable:
+        # Merge value table from head to tail. The blocks of a nested super
+        # block are merged in its place, unless it is finished.
+        if self.value_table is not None:
+            return self.value_table
+        blocks = self._value_table_blocks()
 
         value_table = ValueTable()
         while blocks:
             block = blocks.pop()
-            value_table.update(block.get_value_table())
+            if isinstance(block, SuperBlock) and block.value_table is None:
+                blocks.extend(block._value_table_blocks())
+            else:
+                value_table.update(block.get_value_table())
         return value_table
 
-    def replace_operand(self, _from: SSA.Inst, _from_ident: int,
-                        _to: SSA.Inst) -> None:
-        for bb in self.get_bbs():
-            bb.replace_operand(_from, _from_ident, _to)
+    def finish(self) -> None:
+        # No assignment or store is added to the blocks in this super block
+        # any more, e.g. it is a body that was parsed. Keep its value table and
+        # stores, so that the super blocks around it don't merge them again.
+        self.value_table = self.get_value_table()
+        self.stores = self.get_stores()
 
     def dot_name(self) -> str:
         return f"cluster_{self.id}"
@@ -393,33 +454,48 @@ class SuperBlock(Block):
         label = self.name if self.name else f"super block {self.id}"
         return f"<<I>{label}</I>>"
 
-    def get_bbs(self) -> Set[BasicBlock]:
+    def _blocks(self, finished: bool = False) -> Set[Block]:
+        # The basic blocks within this block. With finished, a finished super
+        # block within it instead of its basic blocks.
         ret = set()
 
-        block = self.head
-        if block is None:
-            return ret
-        ret.update(block.get_bbs())
-
-        while block != self.tail:
-            if isinstance(block, BranchBB):
-                assert(block.branchBlock)
-                ret.update(block.branchBlock.get_bbs())
-
-            block = block.next
+        # Super blocks whose blocks are still to be added
+        superBlocks = [self]
+        while superBlocks:
+            superBlock = superBlocks.pop()
+            block = superBlock.head
             if block is None:
-                assert(self.tail is None)
-            else:
-                ret.update(block.get_bbs())
-
-        if isinstance(block, BranchBB):
-            assert(block.branchBlock)
-            ret.update(block.branchBlock.get_bbs())
+                continue
+
+            while True:
+                children = [block]
+                if isinstance(block, BranchBB):
+                    assert(block.branchBlock)
+                    children.append(block.branchBlock)
+                for child in children:
+                    if not isinstance(child, SuperBlock):
+                        ret.add(child)
+                    elif finished and child.stores is not None:
+                        ret.add(child)
+                    else:
+                        superBlocks.append(child)
+
+                if block == superBlock.tail:
+                    break
+                block = block.next
+                if block is None:
+                    assert(superBlock.tail is None)
+                    break
 
         return ret
 
+    def get_bbs(self) -> Set[BasicBlock]:
+        return self._blocks()
+
     def get_stores(self) -> Set(SSA.Inst):
+        if self.stores is not None:
+            return self.stores
         stores = set()
-        for bb in self.get_bbs():
-            stores.update(bb.get_stores())
+        for block in self._blocks(finished=True):
+            stores.update(block.get_stores())
         return stores
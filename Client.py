@@ -0,0 +1,96 @@
+from __future__ import annotations
+import json
+import os
+import socket
+import struct
+import tempfile
+
+
+# Talks to a compile server (see Server.py) over a Unix domain socket. Only the
+# standard library is imported, so that a client starts quickly.
+#
+# Every message is a JSON object, prefixed with its length as a 4 byte
+# unsigned integer in network order. A compile request is
+#   {"op": "compile", "name": file name for diagnostics, "source": code,
+#    "trace": null, "text", "json" or "tree", "dot": bool, "verbose": bool,
+#    "timeout": seconds or null}
+# and answered with
+#   {"ok": bool, "ir": text dump or null, "diagnostics": str,
+#    "elapsed": seconds, "trace": str or null, "dot": str or null}
+# {"op": "ping"} is answered with {"ok": true}, and {"op": "shutdown"} stops
+# the server after answering.
+
+HEADER = struct.Struct("!I")
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(),
+                              f"smpl-{os.getuid()}.sock")
+
+
+def send_message(sock: socket.socket, message: dict) -> None:
+    data = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes | None:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> dict | None:
+    # None when the other side closed the connection
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, HEADER.unpack(header)[0])
+    if data is None:
+        raise ConnectionError("Connection closed in the middle of a message")
+    return json.loads(data)
+
+
+class Client:
+    # One connection, for any number of requests
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def request(self, message: dict) -> dict:
+        send_message(self.sock, message)
+        reply = recv_message(self.sock)
+        if reply is None:
+            raise ConnectionError("The compile server closed the connection")
+        return reply
+
+    def compile(self, source, name: str, trace: str = None,
+                dot: bool = False, verbose: bool = False,
+                timeout: float = None) -> dict:
+        if not isinstance(source, str):
+            source = bytes(source).decode(errors="replace")
+        return self.request({"op": "compile", "name": name, "source": source,
+                             "trace": trace, "dot": dot, "verbose": verbose,
+                             "timeout": timeout})
+
+    def ping(self) -> bool:
+        return self.request({"op": "ping"})["ok"]
+
+    def shutdown(self) -> None:
+        self.request({"op": "shutdown"})
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> Client:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from contextvars import ContextVar, Token
+from typing import List
+
+
+class CompilationContext:
+    # Numbering and registries of the SSA instructions and blocks created by
+    # one compilation. While a context is active (with ctx: ...), new
+    # instructions and blocks are numbered from 0 and kept here instead of in
+    # the class-level globals of BaseSSA and Block, so the memory of a
+    # compilation is released with its context, and compilations in different
+    # threads or interleaved in one thread do not share ids.
+
+    ssa_cnt: int
+    all_ssa: List  # List[BaseSSA], ordered by id
+    block_cnt: int
+    bb_cnt: int
+    all_bb: List  # List[BasicBlock], ordered by bbid
+    frame_pointer: object  # FramePointer, created on first use
+
+    def __init__(self):
+        self.ssa_cnt = 0
+        self.all_ssa = []
+        self.block_cnt = 0
+        self.bb_cnt = 0
+        self.all_bb = []
+        self.frame_pointer = None
+        self._tokens: List[Token] = []
+
+    @staticmethod
+    def current() -> CompilationContext:
+        # None outside of any context, then the class-level globals are used
+        return _current.get()
+
+    def add_ssa(self, ssa) -> int:
+        id = self.ssa_cnt
+        self.ssa_cnt += 1
+        self.all_ssa.append(ssa)
+        return id
+
+    def add_block(self) -> int:
+        id = self.block_cnt
+        self.block_cnt += 1
+        return id
+
+    def add_bb(self, bb) -> int:
+        bbid = self.bb_cnt
+        self.bb_cnt += 1
+        self.all_bb.append(bb)
+        return bbid
+
+    def __enter__(self) -> CompilationContext:
+        # Reentrant: the compiler enters its context in every phase
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _current.reset(self._tokens.pop())
+
+
+_current: ContextVar[CompilationContext] = ContextVar("compilation",
+                                                      default=None)
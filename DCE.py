@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import List, Set
+import SSA
+from Block import BasicBlock, BranchBB, JoinBB, SimpleBB, SuperBlock
+from Function import FuncContext
+
+
+class DCE:
+    # Dead code elimination over the finished IR of main or of a function, by
+    # mark and sweep. The instructions with an effect are live: stores, I/O,
+    # calls, returns, the end and branches. So are the values they use, and
+    # the values those use, and so on. Everything else is removed: values
+    # never used, phis of variables never read after their join, unused
+    # constants and arguments.
+    #
+    # A common subexpression stands for its instructions, so their uses use
+    # it instead and they are removed too. A nop is only kept in a block it
+    # would leave empty, as the target of a branch.
+    #
+    # Empty simple blocks are dropped when nothing points at them: no branch
+    # targets them, no join has them as a predecessor, and they are neither
+    # the head nor the tail of a super block. Then the blocks around them are
+    # linked together instead.
+
+    ROOTS = {SSA.OP.STORE, SSA.OP.WRITE, SSA.OP.WRITENL, SSA.OP.READ,
+             SSA.OP.CALL, SSA.OP.RET, SSA.OP.END} | SSA.OP.BRANCH_OP
+
+    superBlock: SuperBlock
+    funcCtx: FuncContext
+    bbs: List[BasicBlock]
+    live: Set[int]  # Ids of the live values
+
+    def __init__(self, superBlock: SuperBlock, funcCtx: FuncContext):
+        self.superBlock = superBlock
+        self.funcCtx = funcCtx
+        self.bbs = sorted(superBlock.get_bbs(), key=lambda bb: bb.bbid)
+        self.live = set()
+        self.before = 0  # Instructions
+        self.after = 0
+        self.dropped = 0  # Blocks
+
+    def run(self) -> int:
+        # Returns the number of instructions removed
+        self.before = self.count()
+        self.mark()
+        self.sweep()
+        self.drop_blocks()
+        self.after = self.count()
+        return self.before - self.after
+
+    def count(self) -> int:
+        return sum(len(bb.get_insts(cse=False)) for bb in self.bbs)
+
+    # Marking
+
+    @staticmethod
+    def leader(inst: SSA.Inst) -> SSA.Inst:
+        # The common subexpression that the instruction and its own common
+        # subexpressions stand for
+        cs = inst.get_cs()
+        while cs is not None:
+            inst = cs
+            cs = inst.get_cs()
+        return inst
+
+    @staticmethod
+    def operands(inst: SSA.Inst) -> List[SSA.BaseSSA]:
+        if isinstance(inst, SSA.CallInst):
+            return inst.call_args
+        return [inst.x, inst.y]
+
+    def mark(self) -> None:
+        work = []
+        for bb in self.bbs:
+            for inst in bb.get_insts(cse=False):
+                if isinstance(inst, SSA.Inst) and inst.op in self.ROOTS and \
+                        self.leader(inst) is inst:
+                    self.live.add(inst.id)
+                    work.append(inst)
+        while work:
+            inst = work.pop()
+            for operand in self.operands(inst):
+                if not isinstance(operand, SSA.SSAValue):
+                    continue
+                value = operand.original
+                if isinstance(value, SSA.Inst):
+                    value = self.leader(value)
+                if value.id not in self.live:
+                    self.live.add(value.id)
+                    if isinstance(value, SSA.Inst):
+                        work.append(value)
+
+    # Sweeping
+
+    def sweep(self) -> None:
+        # Uses of the common subexpressions found before, then the dead
+        for bb in self.bbs:
+            for inst in bb.get_insts(cse=False):
+                if isinstance(inst, SSA.Inst):
+                    leader = self.leader(inst)
+                    if leader is not inst:
+                        inst.replace_all_uses(leader)
+        for bb in self.bbs:
+            insts = bb.get_insts(cse=False)
+            removed = set(inst.id for inst in insts if self.dead(inst))
+            nops = [inst for inst in insts if isinstance(inst, SSA.Inst) and
+                    inst.op == SSA.OP.NOP]
+            if nops and len(removed) == len(insts):
+                removed.discard(nops[0].id)
+            if removed:
+                bb.remove_insts(removed)
+        self.funcCtx.consts = [const for const in self.funcCtx.consts
+                               if const.id in self.live]
+
+    def dead(self, value: SSA.SSAValue) -> bool:
+        # The frame pointer is kept with the frame
+        return value.id not in self.live and \
+            not isinstance(value, SSA.FramePointer)
+
+    # Dropping blocks
+
+    def anchors(self) -> Set[BasicBlock]:
+        # The blocks that something points at, other than the blocks next to
+        # them
+        anchors = set()
+        for bb in self.bbs:
+            if isinstance(bb, BranchBB):
+                anchors.add(bb.next_bb_branch())
+            if isinstance(bb, JoinBB):
+                anchors.add(bb.last_bb_join())
+                anchors.add(bb.prev_bb())
+            for inst in bb.get_insts(cse=False):
+                if isinstance(inst, SSA.Inst) and \
+                        inst.op in SSA.OP.BRANCH_OP:
+                    anchors.update(self.target(operand)
+                                   for operand in (inst.x, inst.y))
+        superBlocks = [self.superBlock]
+        while superBlocks:
+            superBlock = superBlocks.pop()
+            anchors.add(superBlock.get_firstbb())
+            anchors.add(superBlock.get_lastbb())
+            block = superBlock.head
+            while block is not None:
+                children = [block]
+                if isinstance(block, BranchBB):
+                    children.append(block.branchBlock)
+                superBlocks.extend(child for child in children
+                                   if isinstance(child, SuperBlock))
+                if block == superBlock.tail:
+                    break
+                block = block.next
+        return anchors
+
+    @staticmethod
+    def target(operand: SSA.BaseSSA) -> BasicBlock:
+        if isinstance(operand, SSA.NextBlockFirstSSA):
+            return operand.block.next_bb()
+        if isinstance(operand, SSA.BlockFirstSSA):
+            block = operand.block
+            return block.get_firstbb() if isinstance(block, SuperBlock) \
+                else block
+        return None
+
+    def drop_blocks(self) -> None:
+        anchors = self.anchors()
+        dropped = set()
+        for bb in self.bbs:
+            prev, next = bb.prev, bb.next
+            if not isinstance(bb, SimpleBB) or bb.get_insts(cse=False) or \
+                    bb in anchors or prev is bb or \
+                    not isinstance(prev, BasicBlock) or prev.next is not bb or \
+                    not isinstance(next, BasicBlock) or next.prev is not bb:
+                continue
+            prev.next = next
+            next.prev = prev
+            dropped.add(bb)
+        if not dropped:
+            return
+        # Common subexpressions are looked up in the blocks before instead
+        for bb in self.bbs:
+            cs_bb = bb.last_cs_block
+            while cs_bb in dropped:
+                cs_bb = cs_bb.get_prev_cs_bb()
+            bb.last_cs_block = cs_bb
+        self.bbs = [bb for bb in self.bbs if bb not in dropped]
+        self.dropped = len(dropped)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from typing import Dict, List, Set
+from Block import BasicBlock, BranchBB, JoinBB, SuperBlock
+
+
+class Dominance:
+    # Control flow graph, dominator tree and dominance frontiers of the basic
+    # blocks of main or of a function, for the optimization passes.
+    #
+    # Successors are the next block and the branch block of a BranchBB.
+    # Predecessors are the previous block and the joining block of a JoinBB,
+    # the joining block first, as the operands of its phis are.
+    #
+    # The dominators are found with the iterative algorithm of Cooper, Harvey
+    # and Kennedy over the reverse postorder, the frontiers from the
+    # predecessors of each join. Blocks not reachable from the entry are left
+    # out of everything but the edges.
+
+    entry: BasicBlock
+    succs: Dict[BasicBlock, List[BasicBlock]]
+    preds: Dict[BasicBlock, List[BasicBlock]]
+    rpo: List[BasicBlock]  # Reachable blocks in reverse postorder
+    order: Dict[BasicBlock, int]  # Index in rpo
+    idom: Dict[BasicBlock, BasicBlock]  # The entry is its own
+    children: Dict[BasicBlock, List[BasicBlock]]  # Of the dominator tree
+    frontiers: Dict[BasicBlock, Set[BasicBlock]]
+    # Preorder and postorder numbers in the dominator tree
+    pre: Dict[BasicBlock, int]
+    post: Dict[BasicBlock, int]
+
+    def __init__(self, superBlock: SuperBlock):
+        self.entry = superBlock.get_firstbb()
+        self.succs = {}
+        self.preds = {}
+        for bb in superBlock.get_bbs():
+            self.succs[bb] = self._succs(bb)
+            self.preds[bb] = self._preds(bb)
+
+        self.rpo = self._reverse_postorder()
+        self.order = {bb: i for i, bb in enumerate(self.rpo)}
+        self.idom = self._idoms()
+
+        self.children = {bb: [] for bb in self.rpo}
+        for bb in self.rpo[1:]:
+            self.children[self.idom[bb]].append(bb)
+        self.pre = {}
+        self.post = {}
+        self._number_tree()
+
+        self.frontiers = self._frontiers()
+
+    @staticmethod
+    def _succs(bb: BasicBlock) -> List[BasicBlock]:
+        succs = []
+        next = bb.next_bb()
+        if next is not None:
+            succs.append(next)
+        if isinstance(bb, BranchBB):
+            branch = bb.next_bb_branch()
+            if branch is not None and branch not in succs:
+                succs.append(branch)
+        return succs
+
+    @staticmethod
+    def _preds(bb: BasicBlock) -> List[BasicBlock]:
+        preds = []
+        if isinstance(bb, JoinBB):
+            join = bb.last_bb_join()
+            if join is not None:
+                preds.append(join)
+        prev = bb.prev_bb()
+        if prev is not None and prev not in preds:
+            preds.append(prev)
+        return preds
+
+    def _reverse_postorder(self) -> List[BasicBlock]:
+        postorder = []
+        visited = {self.entry}
+        # (block, index of the next successor to visit)
+        stack = [(self.entry, 0)]
+        while stack:
+            bb, i = stack.pop()
+            if i < len(self.succs[bb]):
+                stack.append((bb, i + 1))
+                succ = self.succs[bb][i]
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, 0))
+            else:
+                postorder.append(bb)
+        postorder.reverse()
+        return postorder
+
+    def _intersect(self, idom: Dict[BasicBlock, BasicBlock],
+                   a: BasicBlock, b: BasicBlock) -> BasicBlock:
+        # The nearest common dominator of a and b, going up from the later
+        # one in the reverse postorder
+        while a is not b:
+            while self.order[a] > self.order[b]:
+                a = idom[a]
+            while self.order[b] > self.order[a]:
+                b = idom[b]
+        return a
+
+    def _idoms(self) -> Dict[BasicBlock, BasicBlock]:
+        idom = {self.entry: self.entry}
+        changed = True
+        while changed:
+            changed = False
+            for bb in self.rpo[1:]:
+                new = None
+                for pred in self.preds[bb]:
+                    if pred not in idom:
+                        continue
+                    new = pred if new is None else \
+                        self._intersect(idom, pred, new)
+                if idom.get(bb) is not new:
+                    idom[bb] = new
+                    changed = True
+        return idom
+
+    def _number_tree(self) -> None:
+        cnt = 0
+        stack = [(self.entry, False)]
+        while stack:
+            bb, done = stack.pop()
+            if done:
+                self.post[bb] = cnt
+            else:
+                self.pre[bb] = cnt
+                stack.append((bb, True))
+                stack.extend((child, False)
+                             for child in reversed(self.children[bb]))
+            cnt += 1
+
+    def _frontiers(self) -> Dict[BasicBlock, Set[BasicBlock]]:
+        frontiers = {bb: set() for bb in self.rpo}
+        for bb in self.rpo:
+            preds = [pred for pred in self.preds[bb] if pred in self.order]
+            if len(preds) < 2:
+                continue
+            for pred in preds:
+                runner = pred
+                while runner is not self.idom[bb]:
+                    frontiers[runner].add(bb)
+                    runner = self.idom[runner]
+        return frontiers
+
+    def get_idom(self, bb: BasicBlock) -> BasicBlock:
+        # None for the entry and unreachable blocks
+        if bb is self.entry:
+            return None
+        return self.idom.get(bb)
+
+    def dominates(self, a: BasicBlock, b: BasicBlock) -> bool:
+        # Whether every path from the entry to b goes through a, also if a is
+        # b
+        if a not in self.pre or b not in self.pre:
+            return False
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def tree_preorder(self) -> List[BasicBlock]:
+        # The reachable blocks, each after its immediate dominator
+        return sorted(self.rpo, key=lambda bb: self.pre[bb])
@@ -1,15 +1,19 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from Block import SuperBlock, SimpleBB
 from SSA import Const, OP, FramePointer, SSAValue
 import copy
 from Types import *
-from IRVis import IRVis
+
+if TYPE_CHECKING:
+    from IRVis import IRVis
 
 
 PREDEFINED_FUNCTIONS = {
-    # Name: (OP, arg_num, id)
-    "InputNum": [OP.READ, 0, -1],
-    "OutputNum": [OP.WRITE, 1, -1],
-    "OutputNewLine": [OP.WRITENL, 0, -1]
+    # Name: (OP, arg_num)
+    "InputNum": (OP.READ, 0),
+    "OutputNum": (OP.WRITE, 1),
+    "OutputNewLine": (OP.WRITENL, 0)
 }
 
 
@@ -17,21 +21,18 @@ class FuncContext:
     identType: Dict[int, IdentType]
     constBlock: SimpleBB
     consts: List[Const]
+    predefined: Dict[int, str]  # Ids of the predefined functions
 
-    def __init__(self) -> None:
+    def __init__(self, predefined: Dict[int, str] = None) -> None:
         self.identType = {}
         self.constBlock = None
         self.consts = []
+        # Shared by the contexts of a compilation, as the ids are given by
+        # its tokenizer
+        self.predefined = predefined if predefined is not None else {}
 
     def identDefined(self, id: int) -> bool:
-        if id in self.identType:
-            return True
-        else:
-            for _, v in PREDEFINED_FUNCTIONS.items():
-                assert v[2] != -1
-                if id == v[2]:
-                    return True
-            return False
+        return id in self.identType or id in self.predefined
 
     def getIdent(self, id: int) -> IdentType:
         assert isinstance(id, int)
@@ -68,10 +69,11 @@ class FuncType(IdentType):
 
     superBlock: SuperBlock
 
-    def __init__(self, func_name: str, is_void: bool) -> None:
+    def __init__(self, func_name: str, is_void: bool,
+                 predefined: Dict[int, str] = None) -> None:
         self.func_name = func_name
         self.is_void = is_void
-        self.funcCtx = FuncContext()
+        self.funcCtx = FuncContext(predefined)
         self.args = []
 
         # Create blocks
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import SSA
+from Block import BasicBlock, CSTable
+
+
+class GVN:
+    # Global value numbering of the finished IR of a compilation. Finds the
+    # same common subexpression for every instruction as Inst.get_cs(), which
+    # walks back the instructions of the same op one by one, in one pass.
+    #
+    # The blocks of main and of each function form a tree by get_prev_cs_bb(),
+    # and the instructions of a tree are created in a preorder of it, though
+    # main's are split by the functions. Visiting them by id, tree by tree, a
+    # hash table keyed by the op and the value numbers of the operands holds
+    # the last instruction of each key in the blocks from the root to the
+    # current one. What a block adds is logged, and undone when the visit
+    # leaves it.
+    #
+    # The tree by get_prev_cs_bb() is kept on purpose rather than a dominator
+    # tree computed from the control flow graph. In this structured IR it is
+    # the dominator tree: the parent of a block is its immediate dominator,
+    # e.g. the relation block of an if for both branches and the join.
+    # Inst.get_cs() walks the same tree while the IR is built, and the
+    # numbering must give what it gives. The tree also places blocks that are
+    # not reachable, e.g. after a return, which a graph walk would skip.
+    #
+    # Loads and stores are killed by a store to the same array in between, or
+    # by one in the killStores of a block in between. The table keeps when
+    # each instruction was added, and kills when each array was last stored.
+
+    table: Dict[tuple, Tuple[SSA.Inst, int]]  # {key: (inst, time)}
+    kills: Dict[int, int]  # {identifier of an array: time}
+    log: List[Tuple[dict, object, object]]  # (dict, key, old value or None)
+    path: List[Tuple[BasicBlock, int]]  # (block, len(log) when entered)
+
+    def __init__(self):
+        self.table = {}
+        self.kills = {}
+        self.log = []
+        self.path = []
+        self.time = 0
+        self.parents: Dict[BasicBlock, BasicBlock] = {}
+        self.roots: Dict[BasicBlock, BasicBlock] = {}
+        self.on_path: Dict[BasicBlock, int] = {}  # {block: index in path}
+        self.left = set()  # Blocks the visit has left
+
+    @staticmethod
+    def is_numbered(inst: SSA.BaseSSA) -> bool:
+        # Instructions that can be a common subexpression. The others are
+        # their own value.
+        return isinstance(inst, SSA.Inst) and \
+            inst.op not in CSTable.BLACK_LIST
+
+    def number(self, ssa: List[SSA.BaseSSA], bbs: List[BasicBlock]) -> None:
+        # Number the instructions of a compilation, ordered by id, and its
+        # basic blocks
+        for inst in ssa:
+            if isinstance(inst, SSA.Inst):
+                inst.cs = None
+                inst._get_cs_flag = True
+                inst.vn = None if self.is_numbered(inst) else inst.id
+        # Copies of the instructions, as operands and in the value tables, may
+        # have looked up their common subexpressions before. They take the
+        # ones of their originals instead.
+        for copy in self._copies(ssa, bbs):
+            copy._get_cs_flag = False
+            copy.vn = None
+        # Instructions removed by a pass have no block
+        trees: Dict[BasicBlock, List[SSA.Inst]] = {}
+        for inst in ssa:
+            if self.is_numbered(inst) and inst.bb is not None:
+                trees.setdefault(self._root(inst.bb), []).append(inst)
+        for insts in trees.values():
+            for inst in insts:
+                self.visit(inst.bb)
+                self.add(inst)
+
+    @staticmethod
+    def _copies(ssa: List[SSA.BaseSSA], bbs: List[BasicBlock]):
+        for inst in ssa:
+            if isinstance(inst, SSA.CallInst):
+                operands = inst.call_args
+            elif isinstance(inst, SSA.Inst):
+                operands = (inst.x, inst.y)
+            else:
+                continue
+            for operand in operands:
+                if isinstance(operand, SSA.Inst) and \
+                        operand.original is not operand:
+                    yield operand
+        for bb in bbs:
+            for value in bb.get_value_table().table.values():
+                if isinstance(value, SSA.Inst) and \
+                        value.original is not value:
+                    yield value
+
+    def _set(self, d: dict, key, value) -> None:
+        self.log.append((d, key, d.get(key)))
+        d[key] = value
+
+    def _parent(self, bb: BasicBlock) -> BasicBlock:
+        if bb not in self.parents:
+            self.parents[bb] = bb.get_prev_cs_bb()
+        return self.parents[bb]
+
+    def _root(self, bb: BasicBlock) -> BasicBlock:
+        blocks = []
+        while bb not in self.roots:
+            parent = self._parent(bb)
+            if parent is None:
+                self.roots[bb] = bb
+                break
+            blocks.append(bb)
+            bb = parent
+        root = self.roots[bb]
+        for block in blocks:
+            self.roots[block] = root
+        return root
+
+    def visit(self, bb: BasicBlock) -> None:
+        # Make bb the last block of the path from the root
+        if self.path and self.path[-1][0] is bb:
+            return
+
+        entering = []
+        block = bb
+        while block is not None and block not in self.on_path:
+            entering.append(block)
+            block = self._parent(block)
+        assert bb not in self.on_path, \
+            f"Instructions of {bb} are created after those of its children"
+        depth = self.on_path[block] + 1 if block is not None else 0
+
+        while len(self.path) > depth:
+            left, size = self.path.pop()
+            del self.on_path[left]
+            self.left.add(left)
+            while len(self.log) > size:
+                d, key, old = self.log.pop()
+                if old is None:
+                    del d[key]
+                else:
+                    d[key] = old
+
+        for block in reversed(entering):
+            assert block not in self.left, \
+                f"Instructions of {block} are created after it was left"
+            self.on_path[block] = len(self.path)
+            self.path.append((block, len(self.log)))
+            self.time += 1
+            for store in block.killStores:
+                # Stores not numbered yet are in the body of a loop that
+                # starts here, where each kills itself
+                if store.vn is None or store.cs is None:
+                    self._set(self.kills, store.identifier, self.time)
+
+    def key(self, inst: SSA.Inst) -> tuple:
+        x = inst.x.get_id() if inst.x is not None else None
+        y = inst.y.get_id() if inst.y is not None else None
+        if inst.op.is_commutative() and x > y:
+            x, y = y, x
+        return inst.op, x, y
+
+    def add(self, inst: SSA.Inst) -> None:
+        key = self.key(inst)
+        cs, time = self.table.get(key, (None, None))
+        if inst.op in SSA.OP.MEM_OP and cs is not None and \
+                self.kills.get(inst.identifier, 0) > time:
+            cs = None
+        inst.cs = cs
+        inst._get_cs_flag = True
+        inst.vn = cs.vn if cs is not None else inst.id
+
+        self.time += 1
+        self._set(self.table, key, (inst, self.time))
+        if inst.op == SSA.OP.STORE and cs is None:
+            self._set(self.kills, inst.identifier, self.time)
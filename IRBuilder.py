@@ -0,0 +1,670 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, \
+    Tuple
+from functools import wraps
+from itertools import chain
+from Tokenizer import Token
+from CompilationContext import CompilationContext
+from Block import *
+from SSA import FramePointer, Const, SSAValue, BlockFirstSSA, NextBlockFirstSSA
+from Types import *
+from Function import *
+from GVN import GVN
+from Dominance import Dominance
+from SCCP import SCCP, BOTTOM
+from DCE import DCE
+
+if TYPE_CHECKING:
+    from IRVis import IRVis
+
+
+def compiling(func: Callable):
+    # Run a method of an IRBuilder in its CompilationContext, so that the
+    # instructions and blocks created are numbered and kept per compilation
+    @wraps(func)
+    def wrapCtx(self, *args, **kargs):
+        with self.ctx:
+            return func(self, *args, **kargs)
+    return wrapCtx
+
+
+class IRBuilder:
+    # Emits the blocks and SSA instructions of each grammar construct. The
+    # parser calls these as it parses, the lowering pass as it walks the AST.
+    # Diagnostics point at the given token, or at inputSym.
+
+    inputSym: Token
+    names: Dict[int, str]  # Identifier id: identifier, or a list by id
+    ctx: CompilationContext
+    computationBlock: SuperBlock
+    funcCtx: FuncContext
+    mainFuncCtx: FuncContext
+    predefined: Dict[int, str]  # Id of a predefined function: its name
+    dominators: Dict[SuperBlock, Dominance]  # See dominance()
+
+    def __init__(self, names: Dict[int, str]):
+        self.inputSym = None
+        self.names = names
+        self.ctx = CompilationContext()
+        with self.ctx:
+            self.computationBlock = SuperBlock("computation block")
+        # Filled by the front end, which gives the ids
+        self.predefined = {}
+        self.funcCtx = FuncContext(self.predefined)
+        self.mainFuncCtx = self.funcCtx
+        self.dominators = {}
+
+    def __enter__(self) -> IRBuilder:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Release the source, e.g. a memory-mapped file. Warnings and errors
+        # that point into it cannot be reported after.
+        pass
+
+    def id2string(self, id: int) -> str:
+        return self.names[id]
+
+    def _compiling_msg(self, msg: str, sym: Token = None) -> str:
+        sym = sym if sym else self.inputSym
+        return f"{sym.source_loc()}\n{msg}"
+
+    def warning(self, msg:str, sym:Token = None) -> None:
+        print(self._compiling_msg("WARNING: " + msg, sym))
+
+    def error(self, msg: str, sym: Token = None) -> None:
+        raise Exception(self._compiling_msg("ERROR: " + msg, sym))
+
+    def getConst(self, num: int) -> Const:
+        return self.funcCtx.getConst(num)
+
+    @compiling
+    def vis(self, vis: IRVis) -> None:
+        vis.block(self.computationBlock)
+        for _, _type in self.mainFuncCtx.identType.items():
+            if isinstance(_type, FuncType):
+                _type.vis(vis)
+
+    def func_blocks(self) -> List[Tuple[str, SuperBlock]]:
+        # Main and each function, by name
+        blocks = [("main", self.computationBlock)]
+        for _, _type in self.mainFuncCtx.identType.items():
+            if isinstance(_type, FuncType):
+                blocks.append((_type.superBlock.name, _type.superBlock))
+        return blocks
+
+    def func_contexts(self) -> List[Tuple[SuperBlock, FuncContext]]:
+        # The blocks of main and each function with their constants
+        contexts = [(self.computationBlock, self.mainFuncCtx)]
+        for _, _type in self.mainFuncCtx.identType.items():
+            if isinstance(_type, FuncType):
+                contexts.append((_type.superBlock, _type.funcCtx))
+        return contexts
+
+    def dominance(self, superBlock: SuperBlock) -> Dominance:
+        # Dominators of main or a function of func_blocks(), found once. A pass
+        # that changes the edges between the blocks drops them with
+        # invalidate_dominance().
+        if superBlock not in self.dominators:
+            self.dominators[superBlock] = Dominance(superBlock)
+        return self.dominators[superBlock]
+
+    def invalidate_dominance(self) -> None:
+        self.dominators.clear()
+
+    @compiling
+    def sccp(self) -> int:
+        # Propagate the constants of main and each function, see SCCP, and
+        # number the values again. Returns the number of instructions
+        # removed.
+        removed = 0
+        for superBlock, funcCtx in self.func_contexts():
+            removed += SCCP(self.dominance(superBlock), funcCtx).run()
+        GVN().number(self.ctx.all_ssa, self.ctx.all_bb)
+        return removed
+
+    @compiling
+    def dce(self) -> int:
+        # Remove the dead code of main and each function, see DCE, and number
+        # the values again. Returns the number of instructions removed.
+        removed = 0
+        dropped = 0
+        for superBlock, funcCtx in self.func_contexts():
+            dce = DCE(superBlock, funcCtx)
+            removed += dce.run()
+            dropped += dce.dropped
+        if dropped:
+            self.invalidate_dominance()
+        GVN().number(self.ctx.all_ssa, self.ctx.all_bb)
+        return removed
+
+    def inst_counts(self) -> List[Tuple[str, int]]:
+        # The number of instructions of main and each function, by name
+        return [(name, sum(len(bb.get_insts(cse=False))
+                           for bb in superBlock.get_bbs()))
+                for name, superBlock in self.func_blocks()]
+
+    @compiling
+    def dump(self, cse: bool = True) -> str:
+        # The IR as text, without graphviz: main and each function, their
+        # basic blocks by id and the instructions
+        lines = []
+        for name, superBlock in self.func_blocks():
+            lines.append(f"{name}:")
+            for bb in sorted(superBlock.get_bbs(), key=lambda bb: bb.bbid):
+                next = bb.next_bb()
+                lines.append(f"  {bb} -> "
+                             f"{'end' if next is None else next.bbid}"
+                             f"{' unreachable' if bb.unreachable else ''}")
+                lines.extend(f"    {inst}" for inst in bb.get_insts(cse=cse))
+        return "\n".join(lines) + "\n"
+
+    def _get_ctx(self, lastBlock: Block, canMerge: bool = False) -> SimpleBB:
+        if isinstance(lastBlock, SimpleBB) and canMerge:
+            context = lastBlock
+        else:
+            context = SimpleBB()
+            context.set_prev(lastBlock)
+        return context
+
+    # Expressions
+
+    def lookup_ident(self, id: int) -> IdentType:
+        if not self.funcCtx.identDefined(id):
+            self.error("Using of undefined identifier!")
+        return self.funcCtx.getIdent(id)
+
+    def emit_designator(self, context: SimpleBB, sym: Token, id: int,
+                        _type: IdentType, dims: List[SSAValue],
+                        write: bool) -> Tuple[SSAValue, int, bool]:
+        # Returned BaseSSA:
+        # For scalars (write=False), return the BaseSSA from the value table.
+        # For arrays, first emit instructions to calculate the offset. Then
+        # return the address of the element.
+
+        # Array
+        if dims:
+            # Compute the offset
+            offset = None
+            for idx, limit in zip(dims, _type.dims):
+                if isinstance(idx, Const):
+                    assert idx.num < limit, "Array index out of bound!"
+                if offset is not None:
+                    offset = self.emit_binop(context, SSA.OP.MUL, offset,
+                                             self.getConst(limit))
+                    offset = self.emit_binop(context, SSA.OP.ADD, offset, idx)
+                else:
+                    offset = idx
+
+            # Scale by 4 (assuming each array element takes 4 bytes)
+            offset = self.emit_binop(context, SSA.OP.MUL, offset,
+                                     self.getConst(4))
+
+            # Return the SSAValue on the target address
+            return offset, id, True
+
+        # Scalar
+        else:
+            assert _type == VarType.Scalar()
+            if write:
+                return None, id, False
+
+            else:
+                # Trace back and look up for the value in the value table
+                value = context.lookup_value_table(id)
+                if value is not None:
+                    return value, id, False
+                else:
+                    self.warning("Using uninitialized variable!", sym)
+                    return self.uninitialized(id), id, False
+
+    def uninitialized(self, id: int) -> SSAValue:
+        # An uninitialized variable is 0 from the start on, for the values of
+        # all reads and phis of it to be the same
+        valueTable = self.funcCtx.constBlock.get_value_table()
+        valueTable.set(id, self.getConst(0))
+        return valueTable.get(id)
+
+    def emit_load(self, context: SimpleBB, offset: SSAValue,
+                  id: int) -> SSAValue:
+        # Calculate the element address based on the array's address
+        base = context.lookup_value_table(id)
+        assert base is not None
+        address = SSA.Inst(SSA.OP.ADDA, base, offset)
+        context.add_inst(address)
+
+        # Load from the address (ret)
+        load = SSA.Inst(SSA.OP.LOAD, address)
+        load.identifier = id
+        context.add_inst(load)
+        return load
+
+    def emit_binop(self, context: SimpleBB, op: SSA.OP, left: SSAValue,
+                   right: SSAValue) -> SSAValue:
+        val = self.simplify(op, left, right)
+        if val is not None:
+            return val
+        val = SSA.Inst(op, left, right)
+        context.add_inst(val)
+        return val
+
+    @staticmethod
+    def literal(value: SSAValue) -> Optional[int]:
+        # The number of a constant of the program. Not of the value of a
+        # variable, a copy in a value table, which the loops around may still
+        # replace by a phi.
+        if isinstance(value, Const) and value.copied_from is None:
+            return value.num
+        return None
+
+    def simplify(self, op: SSA.OP, left: SSAValue,
+                 right: SSAValue) -> Optional[SSAValue]:
+        # The value of an arithmetic instruction if it needs none: constants
+        # folded, or x + 0, x - 0, x * 1, x / 1, x * 0 and x - x
+        x, y = self.literal(left), self.literal(right)
+        if x is not None and y is not None:
+            num = SCCP.fold(op, x, y)
+            # Division by zero is left to run
+            return None if num == BOTTOM else self.getConst(num)
+        if op == SSA.OP.ADD:
+            if x == 0:
+                return right
+            if y == 0:
+                return left
+        elif op == SSA.OP.SUB:
+            if y == 0:
+                return left
+            if left is right:
+                return self.getConst(0)
+        elif op == SSA.OP.MUL:
+            if x == 0 or y == 0:
+                return self.getConst(0)
+            if x == 1:
+                return right
+            if y == 1:
+                return left
+        elif op == SSA.OP.DIV:
+            if y == 1:
+                return left
+        return None
+
+    def emit_relation(self, context: SimpleBB, operand1: SSAValue,
+                      operand2: SSAValue) -> SSAValue:
+        ret = SSA.Inst(SSA.OP.CMP, operand1, operand2)
+        context.add_inst(ret)
+        return ret
+
+    def emit_call(self, context: SimpleBB, sym: Token, id: int,
+                  args: List[SSAValue]) -> SSAValue:
+        if not self.funcCtx.identDefined(id):
+            self.error("Calling undefined function!", sym)
+
+        if id in self.predefined:
+            # Emit calling of the predefined function
+            op, param_cnt = PREDEFINED_FUNCTIONS[self.predefined[id]]
+            if param_cnt != len(args):
+                self.error(
+                    f"Expecting {param_cnt} parameters, getting {len(args)}.")
+            inst = SSA.Inst(op, *args)
+            context.add_inst(inst)
+            return inst
+
+        else:
+            func = self.funcCtx.getIdent(id)
+            if not isinstance(func, FuncType):
+                self.error(f"Expecting function, getting {func}")
+            assert len(func.args) == len(args)
+            # Emit call of that function
+            call = SSA.CallInst(sym.sym, args)
+            context.add_inst(call)
+            return call
+
+    # Statements
+
+    def emit_assignment(self, context: SimpleBB, ret: SSAValue, id: int,
+                        is_array: bool, src: SSAValue) -> None:
+        if is_array:
+            # Calculate the element address based on the array's address
+            base = context.lookup_value_table(id)
+            assert base is not None
+            address = SSA.Inst(SSA.OP.ADDA, base, ret)
+            context.add_inst(address)
+
+            # Store value to array
+            store = SSA.Inst(SSA.OP.STORE, src, address)
+            store.identifier = id
+            context.add_inst(store)
+
+        else:
+            # Update the mapping in the value table
+            context.get_value_table().set(id, src)
+
+    def emit_return(self, context: SimpleBB, value: SSAValue) -> SSAValue:
+        if value is not None:
+            ret = SSA.Inst(SSA.OP.RET, value)
+        else:
+            ret = SSA.Inst(SSA.OP.RET)
+
+        context.add_inst(ret)
+        return ret
+
+    def statement_prev(self, lastBlock: Block,
+                       superBlock: SuperBlock) -> Tuple[Block, bool]:
+        # The block the next statement of superBlock follows, and whether the
+        # statement can be merged into it
+        if superBlock.tail is None:
+            return lastBlock, False
+        return superBlock.tail, True
+
+    def add_statement(self, lastBlock: Block, superBlock: SuperBlock,
+                      block: Block) -> None:
+        # This is the first block in the super block
+        if superBlock.tail is None:
+            block.set_prev(lastBlock)
+            superBlock.head = block
+            superBlock.tail = block
+
+        # Check if a new block was just created
+        elif block.id != superBlock.tail.id:
+            # Connect new block in the list of the superBlock
+            superBlock.tail.set_next(block)
+            block.set_prev(superBlock.tail)
+            superBlock.tail = block
+
+    # ifStatement: begin_if(), relation into relBlock, begin_if_body(), the
+    # body, end_if_body(), then either begin_else(), the else body and
+    # end_else(), or no_else(). end_if() inserts the phis.
+
+    def begin_if(self, lastBlock: Block,
+                 superBlock: SuperBlock) -> Tuple[BranchBB, JoinBB]:
+        relBlock = BranchBB()
+        connectBlock = JoinBB()
+        relBlock.set_prev(lastBlock)
+        superBlock.head = relBlock
+        superBlock.tail = connectBlock
+        connectBlock.last_cs_block = relBlock
+        return relBlock, connectBlock
+
+    def begin_if_body(self, relBlock: BranchBB,
+                      connectBlock: JoinBB) -> SuperBlock:
+        # Setting up the context
+        ifBlock = SuperBlock()
+        ifBlock.name = "if body"
+        relBlock.set_next(ifBlock)
+        connectBlock.set_prev(ifBlock)
+        return ifBlock
+
+    def end_if_body(self, relBlock: BranchBB, connectBlock: JoinBB,
+                    ifBlock: SuperBlock, rel: SSAValue, relop: int,
+                    changed_variables: Set[int]) -> None:
+        ifBlock.set_next(connectBlock)
+        ifBlock.finish()
+        changed_variables.update(ifBlock.get_value_table().get_ids())
+        connectBlock.killStores = set(ifBlock.get_stores())
+
+        # Branch to if block
+        ifBraOp = SSA.OP._from_relop(relop)
+        conditionBraInst = SSA.Inst(
+            ifBraOp, rel, BlockFirstSSA(ifBlock.get_firstbb()))
+        relBlock.add_inst(conditionBraInst)
+
+    def begin_else(self, relBlock: BranchBB,
+                   connectBlock: JoinBB) -> SuperBlock:
+        # Setting up the context
+        elseBlock = SuperBlock()
+        elseBlock.name = "else body"
+        relBlock.branchBlock = elseBlock
+        connectBlock.joiningBlock = elseBlock
+        return elseBlock
+
+    def end_else(self, connectBlock: JoinBB, elseBlock: SuperBlock,
+                 changed_variables: Set[int]) -> None:
+        elseBlock.set_next(connectBlock)
+        elseBlock.finish()
+        changed_variables.update(elseBlock.get_value_table().get_ids())
+        connectBlock.killStores |= set(elseBlock.get_stores())
+
+        # Branch from the end of else block to connect block
+        elseJoinBraOp = SSA.Inst(SSA.OP.BRA, BlockFirstSSA(connectBlock))
+        elseBlock.get_lastbb().add_inst(elseJoinBraOp)
+
+    def no_else(self, relBlock: BranchBB, connectBlock: JoinBB) -> None:
+        relBlock.branchBlock = connectBlock
+        connectBlock.joiningBlock = relBlock
+
+        # Fall through to connect block
+        fallThroughBraInst = SSA.Inst(
+            SSA.OP.BRA, BlockFirstSSA(connectBlock))
+        relBlock.add_inst(fallThroughBraInst)
+
+    def end_if(self, connectBlock: JoinBB,
+               changed_variables: Set[int]) -> None:
+        # Add phi instructions
+        # 1. Find changed variables: value table from left (else) if any, and
+        # from right(if body) branch
+        # 2. For each variable, get SSA value from left and right
+        # 3. Insert phi(left, right) and update value table
+        left_block = connectBlock.joiningBlock
+        right_block = connectBlock.prev
+        for id in changed_variables:
+            id_name = self.id2string(id)
+            left = left_block.lookup_value_table(id)
+            right = right_block.lookup_value_table(id)
+
+            if left is None:
+                self.warning(f"Using uninitialized variable {id_name} in phi!")
+                left = self.uninitialized(id)
+            if right is None:
+                self.warning(f"Using uninitialized variable {id_name} in phi!")
+                right = self.uninitialized(id)
+
+            if self.same_value(left, right):
+                continue
+
+            phi = SSA.Inst(SSA.OP.PHI, left, right)
+            phi.identifier = id
+            connectBlock.add_inst(phi)
+            connectBlock.get_value_table().set(id, phi)
+
+    @staticmethod
+    def same_value(left: SSAValue, right: SSAValue) -> bool:
+        # Whether two values of a variable stay the same, whatever the loops
+        # around replace: one value and a copy of it. Common subexpressions,
+        # equal constants and copies of the same value may not, as the loops
+        # can replace the uses of one and not of the other. So may copies of
+        # copies, the one in between being of another variable.
+        return left is right or left.copied_from is right or \
+            right.copied_from is left
+
+    # whileStatement: begin_while(), relation into relBlock, the body into
+    # bodyBlock, then end_while()
+
+    def begin_while(self, lastBlock: Block, superBlock: SuperBlock
+                    ) -> Tuple[JoinBB, BranchBB, SuperBlock]:
+        connectBlock = JoinBB()
+        relBlock = BranchBB()
+        bodyBlock = SuperBlock()
+        bodyBlock.name = "while body"
+        connectBlock.joiningBlock = bodyBlock
+        connectBlock.set_next(relBlock)
+        connectBlock.set_prev(lastBlock)
+        relBlock.branchBlock = bodyBlock
+        relBlock.set_prev(connectBlock)
+        superBlock.head = connectBlock
+        superBlock.tail = relBlock
+        return connectBlock, relBlock, bodyBlock
+
+    def end_while_body(self, connectBlock: JoinBB,
+                       bodyBlock: SuperBlock) -> Set[int]:
+        bodyBlock.set_next(connectBlock)
+        bodyBlock.finish()
+        connectBlock.killStores = set(bodyBlock.get_stores())
+        return bodyBlock.get_value_table().get_ids()
+
+    def end_while(self, connectBlock: JoinBB, relBlock: BranchBB,
+                  bodyBlock: SuperBlock, rel: SSAValue, relop: int,
+                  changed_variables: Set[int]) -> None:
+        # Branch from relation block to body block if condition is met
+        whileBraOp = SSA.OP._from_relop(relop)
+        conditionBraInst = SSA.Inst(
+            whileBraOp, rel, BlockFirstSSA(bodyBlock.get_firstbb()))
+        relBlock.add_inst(conditionBraInst)
+
+        # Branch from relation block to the next block of while
+        relToNextBlockBraInst = SSA.Inst(SSA.OP.BRA, NextBlockFirstSSA(relBlock))
+        relBlock.add_inst(relToNextBlockBraInst)
+
+        # Branch from while body to connect block unconditionally
+        bodyToJoinBraInst = SSA.Inst(SSA.OP.BRA, BlockFirstSSA(connectBlock))
+        bodyBlock.get_lastbb().add_inst(bodyToJoinBraInst)
+
+        # : Add phi instructions
+        # 0. Annotate SSA value with variable name in assignments
+        # 1. Find changed variables: must from left (while body) branch
+        # 2. For each variable, get SSA value from left and right
+        # 3. Insert phi(left, right) and update value table
+        # 4. Change SSA values used in the rel block and the while body block
+        left_block = connectBlock.joiningBlock
+        right_block = connectBlock.prev
+        loopBBs = relBlock.get_bbs() | bodyBlock.get_bbs()
+        copies = self.loop_copies(loopBBs)
+        phis = []
+        for ident in changed_variables:
+            id_name = self.id2string(ident)
+            left = left_block.lookup_value_table(ident)
+            right = right_block.lookup_value_table(ident)
+
+            # The changed variable must have been changed in the while body
+            assert left is not None
+            if right is None:
+                self.warning(f"Using uninitialized variable {id_name} in phi!")
+                right = self.uninitialized(ident)
+
+            # The uses of the value from before the loop, i.e. right: read
+            # from the variable, or copied from it in the loop
+            uses = set(id(value) for value in copies.get(id(right), [right]))
+            if self.same_value(left, right) or id(left) in uses:
+                continue
+
+            phi = SSA.Inst(SSA.OP.PHI, left, right)
+            phi.identifier = ident
+            connectBlock.add_inst(phi)
+            connectBlock.get_value_table().set(ident, phi)
+            phis.append((phi, right, uses))
+
+        # Change the uses in rel block and while body block, and the values
+        # from the body of the phis, to the phis. Only once all phis are
+        # there, as the value of one variable at the end of the body can be
+        # the one of another at the start.
+        lefts = {id(phi.x): phi for phi, _, _ in phis}
+        for phi, right, uses in phis:
+            right.replace_uses(phi, uses, loopBBs)
+            for use in uses:
+                if use in lefts:
+                    lefts[use].x = phi
+
+    @staticmethod
+    def loop_copies(loopBBs: Set[BasicBlock]) -> Dict[int, List[SSAValue]]:
+        # The values set in the value tables of a loop that are copies of a
+        # value from before it, e.g. read from another variable, after that
+        # value and by its id. Also copies of copies.
+        values = {}
+        for bb in loopBBs:
+            valueTable = bb.get_value_table()
+            for value in chain(valueTable.table.values(), valueTable.replaced):
+                values[id(value)] = value
+        copies = {}
+        for value in values.values():
+            source = value.copied_from
+            while id(source) in values:
+                source = source.copied_from
+            if source is not None:
+                copies.setdefault(id(source), [source]).append(value)
+        return copies
+
+    # Declarations
+
+    def declare_var(self, context: SimpleBB, sym: Token, id: int,
+                    _type: VarType) -> None:
+        # Add identifier to type table
+        if self.funcCtx.identDefined(id):
+            self.error("Redefinition of variable!", sym)
+        self.funcCtx.setIdent(id, _type)
+
+        if _type.is_array():
+            fp = FramePointer()
+            addr = SSA.Inst(SSA.OP.ADD, fp, self.getConst(fp.offset))
+            context.add_inst(addr)
+            fp.increment(_type.size())
+            context.value_table.set(id, addr)
+
+    def begin_func(self, sym: Token, id: int, is_void: bool) -> FuncType:
+        # Create function object
+        if self.funcCtx.identDefined(id):
+            self.error("Redefinition of variable!", sym)
+        func = FuncType(sym.sym, is_void, self.predefined)
+
+        # Add functions to the context
+        for ident, _type in self.funcCtx.identType.items():
+            if isinstance(_type, FuncType):
+                func.funcCtx.setIdent(ident, _type)
+        self.funcCtx.setIdent(id, func)
+        # Set context
+        self.funcCtx = func.funcCtx
+        return func
+
+    def declare_param(self, func: FuncType, sym: Token, id: int,
+                      paramCnt: int) -> None:
+        # Create an ARG inst for the parameter
+        if self.funcCtx.identDefined(id):
+            self.error("Redefinition of variable!", sym)
+        # Formal parameters are all scalars
+        self.funcCtx.setIdent(id, VarType.Scalar())
+        arg = SSA.Inst(SSA.OP.ARG, self.getConst(paramCnt))
+        func.constBlock.add_inst(arg)
+        func.constBlock.get_value_table().set(id, arg)
+        func.add_arg(arg)
+
+    def empty_body(self, superBlock: SuperBlock) -> None:
+        emptyBlock = SimpleBB()
+        superBlock.head = emptyBlock
+        superBlock.tail = emptyBlock
+
+    def end_func_body(self, func: FuncType) -> None:
+        func.bodyBlock.set_next(func.endBlock)
+        func.bodyBlock.set_prev(func.constBlock)
+
+    def end_func(self) -> None:
+        # Restore context
+        self.funcCtx = self.mainFuncCtx
+
+    def begin_computation(self) -> Tuple[SimpleBB, SimpleBB, SuperBlock]:
+        # Create blocks
+        constBlock = SimpleBB()
+        endBlock = SimpleBB()
+        mainBlock = SuperBlock("main function")
+        self.funcCtx.constBlock = constBlock
+
+        constBlock.add_inst(FramePointer())
+        constBlock.set_prev(constBlock)  # To itself, meaning the first
+        constBlock.set_next(mainBlock)
+        endBlock.set_prev(mainBlock)
+        endBlock.set_next(endBlock)  # To itself, meaning the last
+
+        # Construct computation block that contains the const block ("BB0") and
+        # the main block
+        self.computationBlock.head = constBlock
+        self.computationBlock.tail = endBlock
+        return constBlock, endBlock, mainBlock
+
+    def end_main(self, mainBlock: SuperBlock, endBlock: SimpleBB) -> None:
+        mainBlock.set_next(endBlock)
+        endBlock.add_inst(SSA.Inst(SSA.OP.END))
+
+    def end_computation(self) -> None:
+        # Regenerate all common subexpressions in the end. Previously some cs
+        # can be falsely generated because the graph is not complete.
+        GVN().number(self.ctx.all_ssa, self.ctx.all_bb)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+from typing import Collection, Dict, List, Optional
+import contextlib
+import hashlib
+import importlib
+import io
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+import IRSerial
+from IRBuilder import IRBuilder
+from CompilationContext import CompilationContext
+from Block import SuperBlock
+from Function import FuncContext
+from SmplCompiler import SmplCompiler
+
+# Modules whose code decides the IR. Their source is hashed into the key of
+# the cache, so a changed compiler never loads the IR of an older one.
+COMPILER_MODULES = ["Tokenizer", "SmplCompiler", "IRBuilder", "Block", "SSA",
+                    "GVN", "Dominance", "SCCP", "DCE", "Function", "Types",
+                    "CompilationContext", "IRSerial",
+                    "TokenBuffer", "AST", "ASTParser", "Lowering",
+                    "ParallelCompiler", "IncrementalCompiler"]
+
+_compiler_version: str = None
+
+
+def compiler_version() -> str:
+    global _compiler_version
+    if _compiler_version is None:
+        h = hashlib.blake2b(digest_size=16)
+        for name in COMPILER_MODULES:
+            with open(importlib.import_module(name).__file__, "rb") as f:
+                h.update(f.read())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+
+class CachedIR(IRBuilder):
+    # The IR of a compilation, loaded from the cache: the computation block,
+    # the functions and the numbering of the compiler that made it, for IRVis
+    # and later passes. There is nothing left to parse.
+
+    file: str
+
+    def __init__(self, file: str, names: Dict[int, str],
+                 ctx: CompilationContext, computationBlock: SuperBlock,
+                 funcCtx: FuncContext):
+        # The blocks come from the cache, IRBuilder.__init__ would make new
+        # ones
+        self.file = file
+        self.names = names
+        self.inputSym = None
+        self.ctx = ctx
+        self.computationBlock = computationBlock
+        self.funcCtx = funcCtx
+        self.mainFuncCtx = funcCtx
+        self.predefined = funcCtx.predefined
+        self.dominators = {}
+
+
+class IRCache:
+    # On-disk cache of the finished IR, keyed by the hash of the source bytes,
+    # the compiler version and the options. An entry is the IR of the whole
+    # program as IRSerial data, compressed with zlib, with the warnings of the
+    # compilation, which are printed again on a hit. Errors are not cached.
+    #
+    # The least recently used entries are removed when the entries take more
+    # than max_size bytes.
+
+    VERSION = 1
+
+    directory: str
+    max_size: int
+    options: Dict[str, object]  # Anything else that changes the IR
+
+    def __init__(self, directory: str, max_size: int = 64 << 20,
+                 options: Dict[str, object] = None):
+        self.directory = directory
+        self.max_size = max_size
+        self.options = dict(options) if options else {}
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.0
+        self.compile_time = 0.0
+
+    def key(self, code) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.VERSION} {IRSerial.VERSION} "
+                 f"{compiler_version()}\n".encode())
+        h.update(repr(sorted(self.options.items())).encode() + b"\0")
+        h.update(code)
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".ir")
+
+    def compile(self, file: str, source=None, jobs: int = None,
+                incremental: bool = False) -> IRBuilder:
+        # Return the compiler that made the IR, or the IR from the cache. file
+        # is the name in diagnostics if the source is given. jobs: compile the
+        # functions in this many processes on a miss, see ParallelCompiler.
+        # incremental: on a miss, lower only the functions that changed, see
+        # IncrementalCompiler.
+        if source is None:
+            with open(file, "rb") as f:
+                source = f.read()
+        code = source.encode() if isinstance(source, str) else bytes(source)
+        path = self.path(self.key(code))
+
+        start = time.perf_counter()
+        ir = self.load(path, file)
+        if ir is not None:
+            self.hits += 1
+            self.load_time += time.perf_counter() - start
+            return ir
+
+        self.misses += 1
+        start = time.perf_counter()
+        out = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(out):
+                if incremental:
+                    from IncrementalCompiler import IncrementalCompiler
+                    compiler = IncrementalCompiler.from_file(
+                        file, self, jobs=jobs, source=code)
+                    compiler.compile()
+                elif jobs:
+                    from ParallelCompiler import ParallelCompiler
+                    compiler = ParallelCompiler.from_file(file, jobs=jobs,
+                                                          source=code)
+                    compiler.compile()
+                else:
+                    compiler = SmplCompiler(file, source=code)
+                    compiler.computation()
+        finally:
+            print(out.getvalue(), end="")
+        self.compile_time += time.perf_counter() - start
+
+        self.store(path, compiler, out.getvalue())
+        return compiler
+
+    def read(self, path: str) -> Optional[bytes]:
+        # The uncompressed data of an entry, marked as recently used
+        try:
+            with open(path, "rb") as f:
+                data = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        except zlib.error:
+            print(f"Ignore broken IR cache {path}", file=sys.stderr)
+            return None
+        os.utime(path)
+        return data
+
+    def write(self, path: str, data: bytes, evict: bool = True) -> None:
+        # Without evict, call evict() once after writing several entries
+        data = zlib.compress(data)
+
+        # Write to a temporary file first, so that a concurrent reader never
+        # sees a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+        if evict:
+            self.evict(keep=[path])
+
+    def load(self, path: str, file: str) -> Optional[CachedIR]:
+        data = self.read(path)
+        if data is None:
+            return None
+        try:
+            names, diagnostics, ctx, computationBlock, funcCtx = \
+                IRSerial.loads(data)
+        except (ValueError, EOFError, TypeError):
+            print(f"Ignore broken IR cache {path}", file=sys.stderr)
+            return None
+
+        print(diagnostics, end="")
+        return CachedIR(file, names, ctx, computationBlock, funcCtx)
+
+    def store(self, path: str, compiler: IRBuilder, diagnostics: str) -> None:
+        # All identifiers by id, also the local ones
+        if isinstance(compiler, SmplCompiler):
+            names = dict(compiler.tokenizer.names)
+        else:  # Lowering
+            names = dict(enumerate(compiler.names))
+        self.write(path, IRSerial.dumps(
+            (names, diagnostics, compiler.ctx, compiler.computationBlock,
+             compiler.mainFuncCtx)))
+
+    def entries(self) -> List[os.DirEntry]:
+        # Least recently used first
+        with os.scandir(self.directory) as it:
+            entries = [e for e in it if e.name.endswith(".ir")]
+        return sorted(entries, key=lambda e: e.stat().st_mtime)
+
+    def size(self) -> int:
+        return sum(e.stat().st_size for e in self.entries())
+
+    def evict(self, keep: Collection[str] = ()) -> None:
+        # Entries in keep, e.g. the ones just written, are never removed
+        entries = self.entries()
+        size = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if size <= self.max_size:
+                break
+            if entry.path in keep:
+                continue
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:  # Removed by another process
+                pass
+            size -= entry.stat().st_size
+            self.evictions += 1
+
+    def report(self) -> str:
+        return f"IR cache: {self.hits} hits ({self.load_time * 1000:.2f} " \
+            f"ms loading), {self.misses} misses " \
+            f"({self.compile_time * 1000:.2f} ms compiling), " \
+            f"{self.evictions} evicted"
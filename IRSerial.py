@@ -0,0 +1,155 @@
+from __future__ import annotations
+from enum import Enum
+from typing import Callable, Dict, List
+import importlib
+import marshal
+
+
+# Serialization of IR object graphs (blocks, SSA instructions, function types)
+# to marshal data, e.g. to send the IR of a function between processes.
+#
+# Blocks and instructions point at each other in long chains and cycles, which
+# pickle follows recursively. Here every object becomes one record in a flat
+# list and is referred to by its index. The objects are created first and
+# filled afterwards, and sets and dicts are only filled after the fixup
+# callback of loads(), because instructions and blocks are hashed by their
+# ids, which the caller may still want to change (see ParallelCompiler).
+#
+# An object is recorded as the index of its shape, its class and attribute
+# names, and the encoded attribute values. Values are encoded as:
+#   None, bool, int, float, str, bytes   as is
+#   (index,)                             an object
+#   ("x", key)                           an external object, see dumps()
+#   ("e", class index, name)             an Enum member
+#   ("l", [values])                      a list
+#   ("t", [values])                      a tuple
+#   ("s", [values])                      a set
+#   ("d", [keys], [values])              a dict
+
+VERSION = 1
+
+_PLAIN = (type(None), bool, int, float, str, bytes)
+
+
+def dumps(root, external: Callable[[object], object] = None) -> bytes:
+    # external(obj) returns a marshallable key for objects that are not
+    # serialized, but looked up by loads() instead, or None
+    classes: List[tuple] = []
+    class_idx: Dict[type, int] = {}
+    shapes: List[tuple] = []
+    shape_idx: Dict[tuple, int] = {}
+    records: List[tuple] = []
+    index: Dict[int, int] = {}  # id(obj): index
+    pending: List[object] = []
+
+    def get_class(cls: type) -> int:
+        if cls not in class_idx:
+            class_idx[cls] = len(classes)
+            classes.append((cls.__module__, cls.__qualname__))
+        return class_idx[cls]
+
+    def encode(value):
+        if type(value) in _PLAIN:
+            return value
+        if isinstance(value, list):
+            return ("l", [encode(v) for v in value])
+        if isinstance(value, tuple):
+            return ("t", [encode(v) for v in value])
+        if isinstance(value, (set, frozenset)):
+            return ("s", [encode(v) for v in value])
+        if isinstance(value, dict):
+            return ("d", [encode(k) for k in value.keys()],
+                    [encode(v) for v in value.values()])
+        if isinstance(value, Enum):
+            return ("e", get_class(type(value)), value.name)
+
+        if id(value) not in index:
+            key = external(value) if external else None
+            if key is not None:
+                return ("x", key)
+            index[id(value)] = len(pending)
+            pending.append(value)
+        return (index[id(value)],)
+
+    encoded_root = encode(root)
+    # Objects found while encoding are appended to pending
+    i = 0
+    while i < len(pending):
+        obj = pending[i]
+        state = vars(obj)
+        shape = (get_class(type(obj)), *state.keys())
+        if shape not in shape_idx:
+            shape_idx[shape] = len(shapes)
+            shapes.append(shape)
+        records.append((shape_idx[shape],
+                        *[encode(v) for v in state.values()]))
+        i += 1
+
+    return marshal.dumps((VERSION, classes, shapes, records, encoded_root))
+
+
+def loads(data: bytes, external: Callable[[object], object] = None,
+          fixup: Callable[[List[object]], None] = None):
+    # external(key) returns the object for a key given by dumps(). fixup(objs)
+    # is called with all objects before sets and dicts are filled.
+    version, classes, shapes, records, encoded_root = marshal.loads(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported IR version {version}")
+
+    classes = [_find_class(module, name) for module, name in classes]
+    shapes = [(classes[shape[0]], shape[1:]) for shape in shapes]
+    objects = [object.__new__(shapes[record[0]][0]) for record in records]
+    deferred = []  # (empty set or dict, encoded items)
+
+    def decode(value):
+        if type(value) is not tuple:
+            return value
+        tag = value[0]
+        if len(value) == 1:
+            return objects[tag]
+        elif tag == "x":
+            return external(value[1])
+        elif tag == "e":
+            return classes[value[1]][value[2]]
+        elif tag == "l":
+            return [decode(v) for v in value[1]]
+        elif tag == "t":
+            return tuple(decode(v) for v in value[1])
+        elif tag == "s":
+            ret = set()
+            deferred.append((ret, value[1:]))
+            return ret
+        elif tag == "d":
+            ret = {}
+            deferred.append((ret, value[1:]))
+            return ret
+        raise ValueError(f"Unknown IR value {value!r}")
+
+    for obj, record in zip(objects, records):
+        names = shapes[record[0]][1]
+        obj.__dict__.update(zip(names, [
+            objects[v[0]] if type(v) is tuple and len(v) == 1 else
+            decode(v) if type(v) is tuple else v for v in record[1:]]))
+    root = decode(encoded_root)
+
+    if fixup:
+        fixup(objects)
+
+    # Decoding items can defer more containers, nested ones come later
+    i = 0
+    while i < len(deferred):
+        container, items = deferred[i]
+        if isinstance(container, set):
+            container.update(decode(v) for v in items[0])
+        else:
+            container.update(zip((decode(k) for k in items[0]),
+                                 (decode(v) for v in items[1])))
+        i += 1
+    return root
+
+
+def _find_class(module: str, qualname: str) -> type:
+    cls = importlib.import_module(module)
+    for name in qualname.split("."):
+        cls = getattr(cls, name)
+    return cls
@@ -1,7 +1,13 @@
-from graphviz import Digraph
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from Block import *
 import SSA
 
+# graphviz is imported by the first IRVis, so that compiling without a graph
+# does not pay for it
+if TYPE_CHECKING:
+    from graphviz import Digraph
+
 class IRVis:
     g: Digraph
     debug: bool
@@ -14,6 +20,7 @@ class IRVis:
 
     def __init__(self, filename: str = "graph/out.dot",
                  debug: bool = False) -> None:
+        from graphviz import Digraph
         self._graph = Digraph('structs', filename=filename,
                                        node_attr={'shape': 'record'})
         self.debug = debug
@@ -64,8 +71,10 @@ class IRVis:
             return sb.get_bbs()
 
     def _basicBlock(self, b: BasicBlock, g: Digraph) -> None:
+        # Blocks a pass found unreachable are grayed out
+        attrs = {"color": "gray"} if b.unreachable else {}
         g.node(b.dot_name(), b.dot_label(
-            IRVis.instid_color, cse=not self.debug))
+            IRVis.instid_color, cse=not self.debug), **attrs)
 
     def _basicBlockEdges(self, b: BasicBlock) -> None:
         next = b.next_bb()
@@ -100,6 +109,10 @@ class IRVis:
     def render(self):
         self._graph.render()
 
+    def source(self) -> str:
+        # The dot source, without rendering it
+        return self._graph.source
+
 
 if __name__ == "__main__":
 
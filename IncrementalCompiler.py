@@ -0,0 +1,161 @@
+from __future__ import annotations
+from typing import List, Optional
+import hashlib
+import marshal
+import sys
+import time
+
+from TokenBuffer import TokenBuffer
+from ASTParser import ASTParser
+from ParallelCompiler import ParallelCompiler, _use, _lower_function
+from Tokenizer import Token
+from IRCache import IRCache, compiler_version
+import AST
+import IRSerial
+
+
+class IncrementalCompiler(ParallelCompiler):
+    # Lowers only the functions that changed since they were last compiled,
+    # and takes the IR of the others from an IRCache.
+    #
+    # A function is looked up by its fingerprint: its tokens, the names of the
+    # identifiers it uses and what each of them is declared as before it (a
+    # variable of main, a function with its signature, or nothing), and the
+    # frame pointer offset it starts at, which depends on the arrays of the
+    # functions before it. These are all it is lowered from in a worker of
+    # ParallelCompiler, so the IR in the cache is the IR it would get. The
+    # main function is always lowered.
+    #
+    # The warnings of a function are kept with its IR. They give the position
+    # in the source, so a function with warnings that has moved is lowered
+    # again.
+
+    VERSION = 1
+
+    cache: IRCache
+    rebuilt: List[str]  # Names of the functions lowered
+    reused: List[str]  # Names of the functions taken from the cache
+    saved: float  # Seconds it took to lower the reused functions
+    load_time: float  # Seconds to read and merge the reused functions
+
+    def __init__(self, buffer: TokenBuffer, cache: IRCache, jobs: int = 1,
+                 executor=None):
+        super().__init__(buffer, jobs=jobs if jobs else 1, executor=executor)
+        self.cache = cache
+        self.rebuilt = []
+        self.reused = []
+        self.saved = 0.0
+        self.load_time = 0.0
+
+    @classmethod
+    def from_file(cls, file: str, cache: IRCache, jobs: int = 1,
+                  use_mmap: bool = False, source=None) -> IncrementalCompiler:
+        return cls(ASTParser.from_file(file, use_mmap, source).buffer, cache,
+                   jobs)
+
+    def functions(self, funcs: List[AST.FuncDecl]) -> None:
+        starts = self._starts(funcs)
+        ends = starts[1:] + [self._main_body]
+        declared, counts, offsets = self._declarations(funcs)
+        paths = [self.cache.path(self.fingerprint(start, end, dict(
+                     declared[:count]), offset))
+                 for start, end, count, offset in zip(starts, ends, counts,
+                                                      offsets)]
+
+        start_time = time.perf_counter()
+        results = [self._load(path, start) for path, start in zip(paths,
+                                                                  starts)]
+        self.load_time += time.perf_counter() - start_time
+
+        # Lower the others, the results are merged in order
+        missing = [i for i, result in enumerate(results) if result is None]
+        lowered = [result is None for result in results]
+
+        def store(i: int, result: tuple) -> None:
+            i = missing[i]
+            data, out, e, elapsed = result
+            results[i] = result
+            if e is None:
+                self.cache.write(paths[i], marshal.dumps(
+                    (self.VERSION, self.buffer.offsets[starts[i]], out,
+                     elapsed, data)), evict=False)
+
+        if self.jobs > 1 and len(missing) > 1:
+            self._lower_in_workers([starts[i] for i in missing],
+                                   [counts[i] for i in missing],
+                                   [offsets[i] for i in missing], declared,
+                                   store)
+        else:
+            _use(self.buffer, declared)
+            try:
+                for i in range(len(missing)):
+                    store(i, _lower_function(starts[missing[i]],
+                                             counts[missing[i]],
+                                             offsets[missing[i]]))
+            finally:
+                _use(None, None)
+
+        if any(lowered):
+            self.cache.evict(keep=set(paths))
+
+        for i, (data, out, e, elapsed) in enumerate(results):
+            print(out, end="")
+            if e is not None:
+                raise e
+            start_time = time.perf_counter()
+            self._merge(data)
+            name = self.id2string(funcs[i].id)
+            if lowered[i]:
+                self.rebuilt.append(name)
+            else:
+                self.reused.append(name)
+                self.saved += elapsed
+                self.load_time += time.perf_counter() - start_time
+        self._main()
+
+    def fingerprint(self, start: int, end: int, declared: dict,
+                    offset: int) -> str:
+        # Of the function in tokens [start, end), see above. declared: kind of
+        # each identifier declared before it, see ParallelCompiler.
+        buffer = self.buffer
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"function {self.VERSION} {IRSerial.VERSION} "
+                 f"{compiler_version()} {offset}\n".encode())
+        h.update(repr(sorted(self.cache.options.items())).encode() + b"\0")
+        h.update(buffer.types[start:end].tobytes())
+        h.update(buffer.values[start:end].tobytes())
+
+        used = sorted({buffer.values[i] for i in range(start, end)
+                       if buffer.types[i] == Token.IDENT})
+        h.update(repr([(id, buffer.names[id], declared.get(id, "local"))
+                       for id in used]).encode())
+        # Numbers too large for the values of the buffer
+        h.update(repr([buffer.token(i).sym for i in range(start, end)
+                       if buffer.types[i] == Token.NUMBER and
+                       buffer.values[i] == TokenBuffer.NO_VALUE]).encode())
+        return h.hexdigest()
+
+    def _load(self, path: str, start: int) -> Optional[tuple]:
+        data = self.cache.read(path)
+        if data is None:
+            return None
+        try:
+            version, offset, out, elapsed, data = marshal.loads(data)
+        except (ValueError, EOFError, TypeError):
+            version = None
+        if version != self.VERSION:
+            print(f"Ignore broken IR cache {path}", file=sys.stderr)
+            return None
+
+        # Warnings of a function that moved would point at the old position
+        if out and offset != self.buffer.offsets[start]:
+            return None
+        return data, out, None, elapsed
+
+    def report(self) -> str:
+        total = len(self.rebuilt) + len(self.reused)
+        rebuilt = f": {', '.join(self.rebuilt)}" if self.rebuilt else ""
+        return f"Rebuilt {len(self.rebuilt)} of {total} functions{rebuilt}. " \
+            f"Reused {len(self.reused)}: {self.saved * 1000:.2f} ms of " \
+            f"lowering for {self.load_time * 1000:.2f} ms loading, " \
+            f"{(self.saved - self.load_time) * 1000:.2f} ms saved"
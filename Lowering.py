@@ -0,0 +1,263 @@
+from __future__ import annotations
+from typing import Generator, List, Tuple
+from Tokenizer import Token
+from TokenBuffer import TokenBuffer
+from IRBuilder import IRBuilder, compiling
+from Block import *
+from SSA import SSAValue
+from Types import *
+from Function import *
+import AST
+from AST import run_nested
+
+
+class Lowering(IRBuilder):
+    # Turns the AST of a computation into blocks and SSA, the same as
+    # SmplCompiler emits them while parsing. Blocks and instructions are
+    # created in the same order, so they get the same ids.
+
+    buffer: TokenBuffer
+    names: List[str]
+
+    BINOPS = {
+        Token.TIMES: SSA.OP.MUL,
+        Token.DIV: SSA.OP.DIV,
+        Token.PLUS: SSA.OP.ADD,
+        Token.MINUS: SSA.OP.SUB,
+    }
+
+    def __init__(self, buffer: TokenBuffer):
+        super().__init__(list(buffer.names))
+        self.buffer = buffer
+
+        # The predefined functions get the ids they have in the buffer, or new
+        # ones if they are not used
+        for func in PREDEFINED_FUNCTIONS:
+            if func not in self.names:
+                self.names.append(func)
+            self.predefined[self.names.index(func)] = func
+
+    def close(self) -> None:
+        self.buffer.source.close()
+
+    def token(self, tok: int) -> Token:
+        return self.buffer.token(tok)
+
+    def designator(self, node: AST.Designator, context: SimpleBB,
+                   write: bool) -> Tuple[SSAValue, int, bool]:
+        sym = self.token(node.tok)
+        self.inputSym = sym
+        _type = self.lookup_ident(node.id)
+
+        dims = [self.expression(index, context) for index in node.indices]
+        return self.emit_designator(context, sym, node.id, _type, dims, write)
+
+    def expression(self, node: AST.Node, context: SimpleBB) -> SSAValue:
+        # Walked with a work stack rather than a Python call per node, so that
+        # deeply nested expressions don't hit the recursion limit. The
+        # instructions are emitted in the order of a recursive walk: the
+        # operands, indices and arguments of a node first, left to right.
+        # The values of the nodes walked are kept on a stack too.
+
+        work = [(node, None)]  # Node and, once its children are, its state
+        values = []
+        while work:
+            node, state = work.pop()
+
+            if isinstance(node, AST.BinOp):
+                if state is None:
+                    work.append((node, True))
+                    work.append((node.right, None))
+                    work.append((node.left, None))
+                    continue
+                right = values.pop()
+                left = values.pop()
+                values.append(self.emit_binop(context, self.BINOPS[node.op],
+                                              left, right))
+
+            elif isinstance(node, AST.Designator):
+                if state is None:
+                    sym = self.token(node.tok)
+                    self.inputSym = sym
+                    work.append((node, (sym, self.lookup_ident(node.id))))
+                    work.extend((index, None)
+                                for index in reversed(node.indices))
+                    continue
+                sym, _type = state
+                start = len(values) - len(node.indices)
+                dims = values[start:]
+                del values[start:]
+                ret, id, is_array = self.emit_designator(
+                    context, sym, node.id, _type, dims, False)
+                if is_array:
+                    ret = self.emit_load(context, ret, id)
+                values.append(ret)
+
+            elif isinstance(node, AST.Num):
+                values.append(self.getConst(node.value))
+
+            elif isinstance(node, AST.Call):
+                if state is None:
+                    work.append((node, True))
+                    work.extend((arg, None) for arg in reversed(node.args))
+                    continue
+                start = len(values) - len(node.args)
+                args = values[start:]
+                del values[start:]
+                sym = self.token(node.tok)
+                self.inputSym = sym
+                values.append(self.emit_call(context, sym, node.id, args))
+
+            else:
+                raise Exception(f"Internal error: unexpected expression {node}")
+
+        return values.pop()
+
+    def relation(self, node: AST.Relation,
+                 context: SimpleBB) -> Tuple[SSAValue, int]:
+        left = self.expression(node.left, context)
+        right = self.expression(node.right, context)
+        return self.emit_relation(context, left, right), node.op
+
+    def assignment(self, node: AST.Assign, context: SimpleBB) -> None:
+        ret, id, is_array = self.designator(node.target, context, write=True)
+        src = self.expression(node.value, context)
+        self.emit_assignment(context, ret, id, is_array, src)
+
+    def funcCall(self, node: AST.Call, context: SimpleBB) -> SSAValue:
+        args = [self.expression(arg, context) for arg in node.args]
+        sym = self.token(node.tok)
+        self.inputSym = sym
+        return self.emit_call(context, sym, node.id, args)
+
+    def ifStatement(self, node: AST.If, lastBlock: Block,
+                    superBlock: SuperBlock
+                    ) -> Generator[Generator, None, SuperBlock]:
+        relBlock, connectBlock = self.begin_if(lastBlock, superBlock)
+        changed_variables = set()  # The variables changed in either branch
+
+        rel, relop = self.relation(node.cond, relBlock)
+
+        ifBlock = self.begin_if_body(relBlock, connectBlock)
+        yield self.statSequence(node.then, relBlock, ifBlock)
+        self.end_if_body(relBlock, connectBlock, ifBlock, rel, relop,
+                         changed_variables)
+
+        if node.orelse is not None:
+            elseBlock = self.begin_else(relBlock, connectBlock)
+            yield self.statSequence(node.orelse, relBlock, elseBlock)
+            self.end_else(connectBlock, elseBlock, changed_variables)
+        else:
+            self.no_else(relBlock, connectBlock)
+
+        # Warnings point at "fi", as when parsing
+        self.inputSym = self.token(node.end)
+        self.end_if(connectBlock, changed_variables)
+        return superBlock
+
+    def whileStatement(self, node: AST.While, lastBlock: Block,
+                       superBlock: SuperBlock
+                       ) -> Generator[Generator, None, SuperBlock]:
+        connectBlock, relBlock, bodyBlock = self.begin_while(lastBlock,
+                                                             superBlock)
+
+        rel, relop = self.relation(node.cond, relBlock)
+
+        yield self.statSequence(node.body, relBlock, bodyBlock)
+        changed_variables = self.end_while_body(connectBlock, bodyBlock)
+
+        # Warnings point after "od", as when parsing
+        self.inputSym = self.token(node.end + 1)
+        self.end_while(connectBlock, relBlock, bodyBlock, rel, relop,
+                       changed_variables)
+        return superBlock
+
+    def returnStatement(self, node: AST.Return, context: SimpleBB) -> SSAValue:
+        value = None
+        if node.value is not None:
+            value = self.expression(node.value, context)
+        return self.emit_return(context, value)
+
+    def statement(self, node: AST.Node, lastBlock: Block,
+                  canMerge: bool = False) -> Generator[Generator, None, Block]:
+        if isinstance(node, AST.If):
+            ifBlock = SuperBlock("if statement")
+            ifBlock.set_prev(lastBlock)
+            return (yield self.ifStatement(node, lastBlock, ifBlock))
+
+        elif isinstance(node, AST.While):
+            whileBlock = SuperBlock("while statement")
+            whileBlock.set_prev(lastBlock)
+            return (yield self.whileStatement(node, lastBlock, whileBlock))
+
+        context = self._get_ctx(lastBlock, canMerge)
+        if isinstance(node, AST.Assign):
+            self.assignment(node, context)
+        elif isinstance(node, AST.Call):
+            self.funcCall(node, context)
+        elif isinstance(node, AST.Return):
+            self.returnStatement(node, context)
+        else:
+            raise Exception(f"Internal error: unexpected statement {node}")
+        return context
+
+    def statSequence(self, statements: List[AST.Node], lastBlock: Block,
+                     superBlock: SuperBlock
+                     ) -> Generator[Generator, None, None]:
+        # Generators run by run_nested(), as in SmplCompiler
+        superBlock.set_prev(lastBlock)
+
+        for node in statements:
+            prev, canMerge = self.statement_prev(lastBlock, superBlock)
+            block = yield self.statement(node, prev, canMerge=canMerge)
+            self.add_statement(lastBlock, superBlock, block)
+
+    def varDecl(self, node: AST.VarDecl, context: SimpleBB) -> None:
+        _type = VarType(node.dims) if node.dims else VarType.Scalar()
+        for tok in node.idents:
+            sym = self.token(tok)
+            self.inputSym = sym
+            self.declare_var(context, sym, self.buffer.values[tok], _type)
+
+    def funcDecl(self, node: AST.FuncDecl) -> None:
+        sym = self.token(node.tok)
+        self.inputSym = sym
+        func = self.begin_func(sym, node.id, node.is_void)
+
+        for paramCnt, tok in enumerate(node.params):
+            self.declare_param(func, self.token(tok), self.buffer.values[tok],
+                               paramCnt)
+
+        for decl in node.decls:
+            self.varDecl(decl, self.funcCtx.constBlock)
+
+        if node.body:
+            run_nested(self.statSequence(node.body, self.funcCtx.constBlock,
+                                         func.bodyBlock))
+        else:
+            self.empty_body(func.bodyBlock)
+
+        self.end_func_body(func)
+        self.end_func()
+
+    def functions(self, funcs: List[AST.FuncDecl]) -> None:
+        for func in funcs:
+            self.funcDecl(func)
+
+    @compiling
+    def computation(self, node: AST.Computation) -> SuperBlock:
+        self.inputSym = self.token(node.tok)
+        constBlock, endBlock, mainBlock = self.begin_computation()
+
+        for decl in node.decls:
+            self.varDecl(decl, self.funcCtx.constBlock)
+
+        # Create functions
+        self.functions(node.funcs)
+
+        # Process the statement sequence
+        run_nested(self.statSequence(node.body, constBlock, mainBlock))
+        self.end_main(mainBlock, endBlock)
+
+        self.end_computation()
+        return self.computationBlock
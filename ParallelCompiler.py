@@ -0,0 +1,253 @@
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import contextlib
+import io
+import os
+import time
+
+from TokenBuffer import TokenBuffer
+from ASTParser import ASTParser
+from Lowering import Lowering
+from CompilationContext import CompilationContext
+from Block import Block, BasicBlock, SuperBlock
+from SSA import BaseSSA, FramePointer, Inst, CallInst
+from Types import VarType
+from Function import FuncType
+import AST
+import IRSerial
+
+
+class ParallelCompiler(Lowering):
+    # Lowers the functions of a program in a pool of worker processes.
+    #
+    # A pre-scan parses the declarations and skips the bodies. Each worker
+    # parses and lowers one function in a CompilationContext of its own, with
+    # the frame pointer offset it would have in one pass, and the IR comes back
+    # through IRSerial. It is merged in the order of the functions and
+    # renumbered, so that the ids are the same as with Lowering or
+    # SmplCompiler. The main function is parsed and lowered here.
+
+    jobs: int
+    executor: Executor
+
+    def __init__(self, buffer: TokenBuffer, jobs: int = None,
+                 executor: Executor = None):
+        super().__init__(buffer)
+        self.jobs = jobs if jobs else os.cpu_count()
+        self.executor = executor
+        self._node = None
+
+    @classmethod
+    def from_file(cls, file: str, jobs: int = None, use_mmap: bool = False,
+                  source=None) -> ParallelCompiler:
+        return cls(ASTParser.from_file(file, use_mmap, source).buffer, jobs)
+
+    def compile(self) -> SuperBlock:
+        parser = ASTParser(self.buffer, skip_bodies=True)
+        try:
+            self._node = parser.computation()
+        except Exception:
+            # Parse it all to report the first error, as in one pass
+            ASTParser(self.buffer).computation()
+            raise
+        self._main_body = parser.skipped[-1]
+        return self.computation(self._node)
+
+    def functions(self, funcs: List[AST.FuncDecl]) -> None:
+        starts = self._starts(funcs)
+        if self.jobs > 1 and len(funcs) > 1:
+            self._lower_parallel(funcs, starts)
+        else:
+            parser = ASTParser(self.buffer)
+            for start in starts:
+                parser.seek(start)
+                self.funcDecl(parser.funcDecl())
+        self._main()
+
+    def _starts(self, funcs: List[AST.FuncDecl]) -> List[int]:
+        # Token indices of "function", or "void"
+        return [func.tok - (2 if func.is_void else 1) for func in funcs]
+
+    def _main(self) -> None:
+        # The main body is parsed after the functions, so that errors are
+        # reported in the order of the source
+        self._node.body = ASTParser(self.buffer).body(self._main_body)
+
+    def _declarations(self, funcs: List[AST.FuncDecl]) \
+            -> Tuple[List[Tuple[int, tuple]], List[int], List[int]]:
+        # What each function can see when it is lowered: the variables of main
+        # and the functions before it, and the frame pointer offset after
+        # their arrays. Returns the declarations, and the count of those seen
+        # and the offset for each function.
+        declared = [(id, None) for id in self.funcCtx.identType]
+        counts = []
+        offsets = []
+        offset = FramePointer().offset
+        for func in funcs:
+            counts.append(len(declared))
+            offsets.append(offset)
+            declared.append((func.id, (func.is_void, len(func.params))))
+            for decl in func.decls:
+                if decl.dims:
+                    offset += VarType(decl.dims).size() * len(decl.idents)
+        return declared, counts, offsets
+
+    def _lower_parallel(self, funcs: List[AST.FuncDecl],
+                        starts: List[int]) -> None:
+        declared, counts, offsets = self._declarations(funcs)
+
+        def merge(i: int, result: tuple) -> None:
+            data, out, e, _ = result
+            print(out, end="")
+            if e is not None:
+                raise e
+            self._merge(data)
+        self._lower_in_workers(starts, counts, offsets, declared, merge)
+
+    def _lower_in_workers(self, starts: List[int], counts: List[int],
+                          offsets: List[int],
+                          declared: List[Tuple[int, tuple]],
+                          handle: Callable[[int, tuple], None]) -> None:
+        # Call handle(i, result of _lower_function) for each function, in
+        # order, as the results come in
+        code = self.buffer.source.code
+        if not isinstance(code, str):
+            code = bytes(code)  # E.g. a memory map
+        executor = self.executor
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=min(self.jobs, len(starts)),
+                initializer=_init_worker,
+                initargs=(self.buffer.to_bytes(), self.buffer.source.file,
+                          code, declared))
+
+        try:
+            chunksize = max(1, len(starts) // (self.jobs * 4))
+            results = executor.map(_lower_function, starts, counts, offsets,
+                                   chunksize=chunksize)
+            for i, result in enumerate(results):
+                handle(i, result)
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(cancel_futures=True)
+
+    def _merge(self, data: bytes) -> None:
+        ctx = self.ctx
+        fp = ctx.frame_pointer
+        # The frame pointer is 0 in the worker, and not sent back
+        ssa_base = ctx.ssa_cnt - 1
+        block_base = ctx.block_cnt
+        bb_base = ctx.bb_cnt
+
+        def external(key):
+            if key == "fp":
+                return fp
+            elif key == "ctx":
+                return ctx
+            return self.mainFuncCtx.getIdent(key[1])  # ("func", id)
+
+        def renumber(objects: List[object]) -> None:
+            for obj in objects:
+                if isinstance(obj, BaseSSA):
+                    if "id" in vars(obj):  # Not for meta SSA
+                        obj.id += ssa_base
+                elif isinstance(obj, Block):
+                    obj.id += block_base
+                    if isinstance(obj, BasicBlock):
+                        obj.bbid += bb_base
+
+        id, func, all_ssa, all_bb, block_cnt, offset = \
+            IRSerial.loads(data, external, renumber)
+
+        # The users of the frame pointer were kept by the one of the worker
+        for inst in all_ssa:
+            if isinstance(inst, Inst) and not isinstance(inst, CallInst):
+                for operand in (inst.x, inst.y):
+                    if operand is fp:
+                        fp.add_user(inst)
+
+        ctx.all_ssa.extend(all_ssa)
+        ctx.ssa_cnt += len(all_ssa)
+        ctx.all_bb.extend(all_bb)
+        ctx.bb_cnt += len(all_bb)
+        ctx.block_cnt += block_cnt
+        fp.offset = offset
+        self.funcCtx.setIdent(id, func)
+
+
+# Worker processes. The program is sent once per worker, when it starts.
+
+_buffer: TokenBuffer = None
+_declared: List[Tuple[int, tuple]] = None
+_stubs: Dict[int, object] = {}  # Identifier id: type seen by the workers
+_stub_keys: Dict[int, tuple] = {}  # id() of a stub function: key for IRSerial
+_stub_ctx = CompilationContext()  # Not part of the IR sent back
+
+
+def _init_worker(data: bytes, file: str, code, declared) -> None:
+    _use(TokenBuffer.from_bytes(data, file, code), declared)
+
+
+def _use(buffer: TokenBuffer, declared: List[Tuple[int, tuple]]) -> None:
+    # The program that _lower_function() works on. Also used without workers,
+    # see IncrementalCompiler.
+    global _buffer, _declared
+    _buffer = buffer
+    _declared = declared
+    _stubs.clear()
+    _stub_keys.clear()
+
+
+def _stub(ident: int, kind: tuple):
+    # Stands in for a variable of main or a function declared before. Calls
+    # only need the number of arguments of a function.
+    if ident not in _stubs:
+        if kind is None:
+            _stubs[ident] = VarType.Scalar()
+        else:
+            is_void, param_cnt = kind
+            with _stub_ctx:
+                func = FuncType(_buffer.names[ident], is_void)
+            func.args = [None] * param_cnt
+            _stubs[ident] = func
+            _stub_keys[id(func)] = ("func", ident)
+    return _stubs[ident]
+
+
+def _lower_function(start: int, count: int, offset: int):
+    # Return the serialized IR of the function starting at token index start,
+    # what it printed, the exception it raised if any, and the seconds it took
+    # to parse and lower it
+    begin = time.perf_counter()
+    out = io.StringIO()
+    ctx = CompilationContext()
+    try:
+        with contextlib.redirect_stdout(out):
+            lowering = Lowering(_buffer)
+            for ident, kind in _declared[:count]:
+                lowering.funcCtx.setIdent(ident, _stub(ident, kind))
+
+            parser = ASTParser(_buffer)
+            parser.seek(start)
+            node = parser.funcDecl()
+
+            with ctx:
+                fp = FramePointer()  # Takes id 0
+                fp.offset = offset
+                lowering.funcDecl(node)
+    except Exception as e:
+        return None, out.getvalue(), e, time.perf_counter() - begin
+    elapsed = time.perf_counter() - begin
+
+    def external(obj):
+        if obj is fp:
+            return "fp"
+        elif obj is ctx:
+            return "ctx"
+        return _stub_keys.get(id(obj))
+
+    func = lowering.mainFuncCtx.getIdent(node.id)
+    data = IRSerial.dumps((node.id, func, ctx.all_ssa[1:], ctx.all_bb,
+                           ctx.block_cnt, fp.offset), external)
+    return data, out.getvalue(), None, elapsed
@@ -0,0 +1,255 @@
+from __future__ import annotations
+from typing import Dict, List, Set, Tuple
+import SSA
+from Block import BasicBlock
+from Dominance import Dominance
+from Function import FuncContext
+
+
+# Lattice values of the instructions: the number of a constant, or
+TOP = None  # Not evaluated yet, maybe a constant
+BOTTOM = "bottom"  # Not a constant
+
+
+class SCCP:
+    # Sparse conditional constant propagation over the finished IR of main or
+    # of a function, after Wegman and Zadeck. Instructions are evaluated over
+    # the lattice TOP > constants > BOTTOM, only in blocks found reachable,
+    # and the operands of a phi only along the edges found executable. Edges
+    # are followed from the entry, and from a branch only to the successors
+    # its condition allows. The users of each value are evaluated again when
+    # its value changes.
+    #
+    # Then the arithmetic, comparisons and phis found constant are removed,
+    # their uses using the constant of the FuncContext instead. Phis with one
+    # executable edge are replaced by their operand along it. Branches on a
+    # constant condition jump to the one successor, and the blocks never
+    # reached are marked unreachable and emptied.
+    #
+    # A cmp is the sign of the difference of its operands, which the branches
+    # compare to 0.
+
+    FOLDED = {SSA.OP.ADD, SSA.OP.SUB, SSA.OP.MUL, SSA.OP.DIV, SSA.OP.CMP,
+              SSA.OP.PHI}
+
+    BRANCH_TAKEN = {
+        SSA.OP.BEQ: lambda c: c == 0,
+        SSA.OP.BNE: lambda c: c != 0,
+        SSA.OP.BLT: lambda c: c < 0,
+        SSA.OP.BLE: lambda c: c <= 0,
+        SSA.OP.BGT: lambda c: c > 0,
+        SSA.OP.BGE: lambda c: c >= 0,
+    }
+
+    dominance: Dominance
+    funcCtx: FuncContext
+    lattice: Dict[int, object]  # {instruction id: lattice value}
+    edges: Set[Tuple[BasicBlock, BasicBlock]]  # Executable (pred, succ)
+    reached: Set[BasicBlock]
+    flowWork: List[Tuple[BasicBlock, BasicBlock]]
+    ssaWork: List[SSA.Inst]
+
+    def __init__(self, dominance: Dominance, funcCtx: FuncContext):
+        self.dominance = dominance
+        self.funcCtx = funcCtx
+        self.lattice = {}
+        self.edges = set()
+        self.reached = set()
+        self.flowWork = []
+        self.ssaWork = []
+        self.removed = 0
+        self.folded = 0  # Branches
+        self.unreachable = 0  # Blocks
+
+    def run(self) -> int:
+        # Returns the number of instructions removed
+        self.propagate()
+        self.rewrite()
+        return self.removed
+
+    # Propagation
+
+    @staticmethod
+    def meet(a, b):
+        if a is TOP:
+            return b
+        if b is TOP or a == b:
+            return a
+        return BOTTOM
+
+    def value(self, operand: SSA.BaseSSA):
+        if isinstance(operand, SSA.Const):
+            return operand.num
+        if isinstance(operand, SSA.Inst):
+            return self.lattice.get(operand.id, TOP)
+        return BOTTOM
+
+    @staticmethod
+    def fold(op: SSA.OP, x: int, y: int):
+        if op == SSA.OP.ADD:
+            return x + y
+        if op == SSA.OP.SUB:
+            return x - y
+        if op == SSA.OP.MUL:
+            return x * y
+        if op == SSA.OP.DIV:
+            if y == 0:
+                return BOTTOM
+            # Rounded towards zero
+            q = abs(x) // abs(y)
+            return q if (x < 0) == (y < 0) else -q
+        assert op == SSA.OP.CMP
+        return (x > y) - (x < y)
+
+    @staticmethod
+    def phi_edges(phi: SSA.Inst) -> List[Tuple[BasicBlock, SSA.BaseSSA]]:
+        # The predecessor each operand comes from, see Dominance
+        bb = phi.bb
+        return [(bb.last_bb_join(), phi.x), (bb.prev_bb(), phi.y)]
+
+    def evaluate(self, inst: SSA.Inst):
+        if inst.op == SSA.OP.PHI:
+            value = TOP
+            for pred, operand in self.phi_edges(inst):
+                if (pred, inst.bb) in self.edges:
+                    value = self.meet(value, self.value(operand))
+            return value
+        if inst.op not in self.FOLDED:
+            return BOTTOM
+        x, y = self.value(inst.x), self.value(inst.y)
+        if x is BOTTOM or y is BOTTOM:
+            return BOTTOM
+        if x is TOP or y is TOP:
+            return TOP
+        return self.fold(inst.op, x, y)
+
+    def reach(self, pred: BasicBlock, succ: BasicBlock) -> None:
+        if (pred, succ) not in self.edges:
+            self.flowWork.append((pred, succ))
+
+    def branch_succs(self, inst: SSA.Inst) -> Tuple[BasicBlock, BasicBlock]:
+        # The successors of a conditional branch if it is taken and if not
+        taken = inst.y.block
+        succs = self.dominance.succs[inst.bb]
+        others = [succ for succ in succs if succ is not taken]
+        return taken, others[0] if others else taken
+
+    def visit_branch(self, inst: SSA.Inst) -> None:
+        cond = self.value(inst.x)
+        if cond is TOP:
+            return
+        taken, other = self.branch_succs(inst)
+        if cond is BOTTOM or self.BRANCH_TAKEN[inst.op](cond):
+            self.reach(inst.bb, taken)
+        if cond is BOTTOM or not self.BRANCH_TAKEN[inst.op](cond):
+            self.reach(inst.bb, other)
+
+    def visit(self, inst: SSA.SSAValue) -> None:
+        if not isinstance(inst, SSA.Inst):
+            return
+        if inst.op in self.BRANCH_TAKEN:
+            self.visit_branch(inst)
+            return
+        value = self.evaluate(inst)
+        old = self.lattice.get(inst.id, TOP)
+        if value is not old and value != old:
+            self.lattice[inst.id] = value
+            self.ssaWork.extend(inst.get_users())
+
+    def visit_block(self, bb: BasicBlock) -> None:
+        conditional = False
+        for inst in bb.get_insts(cse=False):
+            self.visit(inst)
+            if isinstance(inst, SSA.Inst) and inst.op in self.BRANCH_TAKEN:
+                conditional = True
+        if not conditional:
+            for succ in self.dominance.succs[bb]:
+                self.reach(bb, succ)
+
+    def propagate(self) -> None:
+        self.flowWork.append((None, self.dominance.entry))
+        while self.flowWork or self.ssaWork:
+            if self.flowWork:
+                edge = self.flowWork.pop()
+                if edge in self.edges:
+                    continue
+                self.edges.add(edge)
+                bb = edge[1]
+                if bb in self.reached:
+                    # Only the phis see the new edge
+                    for inst in bb.get_insts(cse=False):
+                        if isinstance(inst, SSA.Inst) and \
+                                inst.op == SSA.OP.PHI:
+                            self.visit(inst)
+                    continue
+                self.reached.add(bb)
+                self.visit_block(bb)
+            else:
+                inst = self.ssaWork.pop()
+                if inst.bb in self.reached:
+                    self.visit(inst)
+
+    # Rewriting
+
+    def rewrite(self) -> None:
+        for bb in self.dominance.rpo:
+            if bb not in self.reached:
+                continue
+            removed = set()
+            for inst in bb.get_insts(cse=False):
+                if isinstance(inst, SSA.Inst) and \
+                        inst.op in self.BRANCH_TAKEN:
+                    removed.update(self.fold_branch(inst))
+                elif isinstance(inst, SSA.Inst) and self.replace(inst):
+                    removed.add(inst.id)
+            if removed:
+                bb.remove_insts(removed)
+                self.removed += len(removed)
+
+        for bb in self.dominance.succs:
+            if bb not in self.reached:
+                bb.unreachable = True
+                self.unreachable += 1
+        for bb in self.dominance.succs:
+            if bb.unreachable:
+                insts = bb.get_insts(cse=False)
+                bb.remove_insts(set(inst.id for inst in insts))
+                self.removed += len(insts)
+
+    def replace(self, inst: SSA.Inst) -> bool:
+        # Whether the uses of the instruction use a constant or an operand of
+        # a phi instead
+        value = self.lattice.get(inst.id, TOP)
+        if inst.op in self.FOLDED and value is not TOP and \
+                value is not BOTTOM:
+            inst.replace_all_uses(self.funcCtx.getConst(value))
+            return True
+        if inst.op == SSA.OP.PHI:
+            operands = [operand for pred, operand in self.phi_edges(inst)
+                        if (pred, inst.bb) in self.edges]
+            if len(operands) == 1:
+                inst.replace_all_uses(operands[0])
+                return True
+        return False
+
+    def fold_branch(self, inst: SSA.Inst) -> Set[int]:
+        # The ids of the instructions to remove from the block of a branch on
+        # a constant condition: the branch if it is never taken and jumps on,
+        # else the instructions after it, which it now always jumps over
+        cond = self.value(inst.x)
+        if cond is TOP or cond is BOTTOM:
+            return set()
+        self.folded += 1
+        taken, other = self.branch_succs(inst)
+        insts = inst.bb.insts
+        i = next(i for i in range(len(insts)) if insts[i] is inst)
+        after = insts[i + 1:]
+        if not self.BRANCH_TAKEN[inst.op](cond):
+            if after and after[0].op == SSA.OP.BRA:
+                return {inst.id}
+            taken = other
+            inst.y = SSA.BlockFirstSSA(taken)
+        inst.op = SSA.OP.BRA
+        inst.x = inst.y
+        inst.y = None
+        return set(later.id for later in after)
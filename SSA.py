@@ -1,14 +1,15 @@
 from __future__ import annotations
 from enum import Enum, auto
-from typing import List
+from typing import List, Set
 import Tokenizer
 import copy
+from CompilationContext import CompilationContext
 
 
 class BaseSSA:
     id: int
 
-    # Global count of all instructions
+    # Global count of all instructions, used outside of a CompilationContext
     CNT = 0
     # A list of all SSA instructions, ordered by id
     ALL_SSA = []
@@ -21,16 +22,21 @@ class BaseSSA:
 
     @classmethod
     def get_inst(cls, id: int) -> BaseSSA:
-        return cls.ALL_SSA[id]
+        ctx = CompilationContext.current()
+        return (ctx.all_ssa if ctx else cls.ALL_SSA)[id]
 
     def __init__(self):
         # Unique id for each SSA instruction
-        self.id = BaseSSA.CNT
+        ctx = CompilationContext.current()
+        if ctx:
+            self.id = ctx.add_ssa(self)
+        else:
+            self.id = BaseSSA.CNT
+            # Update class variables
+            BaseSSA.CNT += 1
+            BaseSSA.ALL_SSA.append(self)
         # The basic block that this inst belongs to
         self.bb = None
-        # Update class variables
-        BaseSSA.CNT += 1
-        BaseSSA.ALL_SSA.append(self)
 
     # Get the real id for the SSA value. For meta SSA, return the *real* id of
     # the SSA pointed to; for cse, return the real id of the SSA that is the
@@ -50,33 +56,99 @@ class BaseSSA:
 
 class SSAValue(BaseSSA):
     identifier: int
+    original: SSAValue
+    users: List[Inst]
 
     def __init__(self):
         super().__init__()
         # The corresponding identifier. The same SSA value (SSA id) can map to
         # multiple identifier, and the same identifier can map to multiple SSA
-        # value (at different time).
-        # This mapping is for changing the SSA value which is required for
-        # inserting phi in while blocks
+        # value (at different time). For loads and stores, the array.
         self.identifier = None
+        # For a copy in a value table, the value it was copied from, e.g. read
+        # from another variable. Loops find the copies of the values of their
+        # variables by it, see IRBuilder.end_while().
+        self.copied_from = None
+        # The instructions using this value, once per operand. Copies of the
+        # value, e.g. in the value tables, point at the original, which keeps
+        # the list, see get_users().
+        self.original = self
+        self.users = []
+
+    def __copy__(self) -> SSAValue:
+        # A copy has no list of its own, so that it is not shared, e.g. each
+        # use of a constant is a copy, and serializing every copy would repeat
+        # the users of the constant
+        _copy = object.__new__(type(self))
+        _copy.__dict__.update(self.__dict__)
+        _copy.users = None
+        return _copy
+
+    def get_users(self) -> List[Inst]:
+        return self.original.users
+
+    def add_user(self, user: Inst) -> None:
+        self.original.users.append(user)
+
+    def remove_user(self, user: Inst) -> None:
+        # One use by user. Instructions compare by their common
+        # subexpressions, so it is found by identity.
+        users = self.original.users
+        for i in range(len(users)):
+            if users[i] is user:
+                del users[i]
+                return
+        assert False, f"{user} is not a user of {self}"
+
+    def replace_uses(self, _to: SSAValue, uses: Set[int],
+                     bbs: Set[object]) -> None:
+        # Uses of this value as one of the objects with the ids in uses, e.g.
+        # the copies read from a variable, by the instructions in the basic
+        # blocks bbs use _to instead, e.g. the phi of a loop. Takes time in
+        # the number of uses.
+        users = self.original.users
+        kept = []
+        for user in users:
+            if user.bb in bbs and user.replace_use(uses, _to):
+                _to.add_user(user)
+            else:
+                kept.append(user)
+        users[:] = kept
+
+    def replace_all_uses(self, _to: SSAValue) -> None:
+        # Every use of this value, by any copy, uses _to instead, e.g.
+        # the constant a pass found it to be
+        users = self.original.users
+        while users:
+            user = users.pop()
+            replaced = user.replace_value(self, _to)
+            assert replaced, f"{user} does not use {self}"
+            _to.add_user(user)
 
 
 class FramePointer(SSAValue):
     offset: int
 
+    # One frame pointer per compilation, or per process outside of a
+    # CompilationContext
     _instance = None
     _initialized = False
 
     def __new__(cls) -> FramePointer:
+        ctx = CompilationContext.current()
+        if ctx:
+            if ctx.frame_pointer is None:
+                ctx.frame_pointer = super().__new__(cls)
+            return ctx.frame_pointer
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
     def __init__(self):
-        if not FramePointer._initialized:
+        if not self._initialized:
             super().__init__()
             self.offset = 0
-        FramePointer._initialized = True
+            self._initialized = True
 
     def __str__(self) -> str:
         return self.to_str(dot_style=False)
@@ -172,11 +244,12 @@ OP.FUNC_OP = {OP.CALL, OP.ARG, OP.RET}
 
 class Inst(SSAValue):
     op: OP
-    x: BaseSSA
-    y: BaseSSA
+    _x: BaseSSA
+    _y: BaseSSA
     op_last_inst: Inst
     cs: Inst
     _get_cs_flag: bool
+    vn: int
 
     def __init__(self, op: OP, x: BaseSSA = None, y: BaseSSA = None):
         super().__init__()
@@ -184,12 +257,46 @@ class Inst(SSAValue):
         assert y is None or isinstance(y, BaseSSA)
 
         self.op = op
+        # Operands, also kept in the users of their values as they are set.
+        # Copies of the instruction have the operands of the original, also
+        # once they are replaced.
+        self._x = None
+        self._y = None
         self.x = x
         self.y = y
         # Last SSA instruction with the same op
         self.op_last_inst = None
         self.cs = None
         self._get_cs_flag = False
+        # Set by GVN for the finished IR: the value number, i.e. the id at the
+        # end of the cs chain
+        self.vn = None
+
+    def _set_operand(self, old: BaseSSA, new: BaseSSA) -> None:
+        if isinstance(old, SSAValue):
+            old.remove_user(self)
+        if isinstance(new, SSAValue):
+            new.add_user(self)
+
+    @property
+    def x(self) -> BaseSSA:
+        return self.original._x
+
+    @x.setter
+    def x(self, x: BaseSSA) -> None:
+        inst = self.original
+        inst._set_operand(inst._x, x)
+        inst._x = x
+
+    @property
+    def y(self) -> BaseSSA:
+        return self.original._y
+
+    @y.setter
+    def y(self, y: BaseSSA) -> None:
+        inst = self.original
+        inst._set_operand(inst._y, y)
+        inst._y = y
 
     def to_str(self, dot_style: bool = False, color: str = "black") -> str:
         s = f'<font color="{color}"><b>{self.get_id(cse=False)}</b></font>' \
@@ -214,9 +321,10 @@ class Inst(SSAValue):
             return False
         if self.op != __o.op:
             return False
-        if self.x == __o.x and self.y == __o.y:
+        a, b = self.original, __o.original
+        if a._x == b._x and a._y == b._y:
             return True
-        elif self.op.is_commutative() and self.x == __o.y and self.y == __o.x:
+        elif self.op.is_commutative() and a._x == b._y and a._y == b._x:
             return True
         # TODO: For loads, if one value is stored at the same position, we can
         # also use it.
@@ -241,10 +349,43 @@ class Inst(SSAValue):
             raise Exception(f"Can only use is_cs_kill with SSAValue or a list "
                             f"of SSAValue, but received {type(__o)}")
 
+
+    def _operands_cs(self) -> None:
+        # Find the common subexpressions of the operands first, innermost
+        # first, so that comparing the operands does not recurse as deep as
+        # the expression is nested. Phis compare no operands, and through them
+        # the operands of a loop can be cyclic.
+        operands = []
+        stack = [self]
+        seen = set()
+        while stack:
+            inst = stack.pop()
+            for operand in (inst.x, inst.y):
+                if isinstance(operand, Inst) and not operand._get_cs_flag \
+                        and id(operand) not in seen:
+                    seen.add(id(operand))
+                    operands.append(operand)
+                    if operand.op != OP.PHI:
+                        stack.append(operand)
+        for operand in reversed(operands):
+            operand.get_cs()
+
     def get_cs(self) -> Inst:
+        inst = self.original
+        if inst is not self:
+            # A copy in a value table, e.g. of a load read into a scalar,
+            # stands for the original and is killed by the same stores. Once
+            # the original is numbered by GVN, its answer is final.
+            if inst.vn is None:
+                return inst.get_cs()
+            if not self._get_cs_flag:
+                self.cs = inst.cs
+                self._get_cs_flag = True
+            return self.cs
         if not self._get_cs_flag:
             self.cs = None
             self._get_cs_flag = True
+            self._operands_cs()
 
             # Try to find the common subexpression within the same block
             inst = self.op_last_inst
@@ -284,19 +425,49 @@ class Inst(SSAValue):
 
         return self.cs
 
-    def replace_operand(self, _from: Inst, _from_ident: int, _to: Inst) -> None:
-        if self.x is not None and isinstance(self.x, SSAValue) and \
-                self.x == _from and self.x.identifier == _from_ident:
-            self.x = _to
-        if self.y is not None and isinstance(self.y, SSAValue) and \
-                self.y == _from and self.y.identifier == _from_ident:
-            self.y = _to
+    def replace_use(self, uses: Set[int], _to: SSAValue) -> bool:
+        # Replace one operand that is one of the objects with the ids in uses,
+        # leaving the users to the caller, see SSAValue.replace_uses()
+        if id(self._x) in uses:
+            self._x = _to
+            return True
+        if id(self._y) in uses:
+            self._y = _to
+            return True
+        return False
+
+    def replace_value(self, _from: SSAValue, _to: SSAValue) -> bool:
+        # Replace one operand that is _from, or a copy of it, see
+        # SSAValue.replace_all_uses()
+        if isinstance(self._x, SSAValue) and \
+                self._x.original is _from.original:
+            self._x = _to
+            return True
+        if isinstance(self._y, SSAValue) and \
+                self._y.original is _from.original:
+            self._y = _to
+            return True
+        return False
+
+    def drop_operands(self) -> None:
+        # No longer use the operands, e.g. once removed from its block
+        self.x = None
+        self.y = None
 
     def get_id(self, cse: bool = True) -> int:
-        if cse and self.get_cs() is not None:
-            return self.get_cs().get_id()
-        else:
-            return super().get_id()
+        # The id of the last common subexpression in the chain, kept as the
+        # value number once numbered. Followed in a loop, the chain is as long
+        # as the statements it spans are nested.
+        inst = self
+        if cse:
+            while inst.vn is None:
+                cs = inst.get_cs()
+                if cs is None:
+                    break
+                inst = cs
+            else:
+                return inst.vn
+        return SSAValue.get_id(inst)
 
 class CallInst(Inst):
     func_name: str
@@ -306,6 +477,8 @@ class CallInst(Inst):
         super().__init__(OP.CALL)
         self.func_name = func_name
         self.call_args = args
+        for arg in args:
+            arg.add_user(self)
 
     def to_str(self, dot_style: bool = False, color: str = "black") -> str:
         s = f'<font color="{color}"><b>{self.get_id(cse=False)}</b></font>' \
@@ -328,8 +501,24 @@ class CallInst(Inst):
     def get_cs(self) -> Inst:
         return None
 
-    def replace_operand(self, _from: Inst, _from_ident: int, _to: Inst) -> None:
-        return
+    def replace_use(self, uses: Set[int], _to: SSAValue) -> bool:
+        for i, arg in enumerate(self.call_args):
+            if id(arg) in uses:
+                self.call_args[i] = _to
+                return True
+        return False
+
+    def replace_value(self, _from: SSAValue, _to: SSAValue) -> bool:
+        for i, arg in enumerate(self.call_args):
+            if arg.original is _from.original:
+                self.call_args[i] = _to
+                return True
+        return False
+
+    def drop_operands(self) -> None:
+        for arg in self.call_args:
+            arg.remove_user(self)
+        self.call_args.clear()
 
     def get_id(self, cse: bool = True) -> int:
         return self.id
@@ -370,9 +559,11 @@ class NextBlockFirstSSA(MetaSSA):
 
     def get_target_SSA(self) -> BaseSSA:
         assert self.block is not None
-        assert self.block.next is not None
-        targetSSA =  self.block.next.get_first_inst()
+        # The next block can be a super block, e.g. an if after a while
+        next = self.block.next_bb()
+        assert next is not None
+        targetSSA = next.get_first_inst()
         if targetSSA is None:
-            targetSSA = self.block.next.add_nop()
+            targetSSA = next.add_nop()
         return targetSSA
 
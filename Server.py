@@ -0,0 +1,144 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import Batch
+from Client import DEFAULT_SOCKET, send_message, recv_message
+
+
+# A compile server. It keeps warm worker processes, with the compiler already
+# imported, and answers the requests of Client.py over a Unix domain socket.
+
+
+def compile_request(request: dict) -> dict:
+    # Run in a worker process
+    result = Batch.compile_file(request["name"], request["name"],
+                                source=request["source"],
+                                trace=request.get("trace"),
+                                dot=request.get("dot", False),
+                                verbose=request.get("verbose", False))
+    return {"ok": result.ok, "ir": result.ir,
+            "diagnostics": result.diagnostics, "elapsed": result.elapsed,
+            "trace": result.trace, "dot": result.dot}
+
+
+def _failed(diagnostics: str, elapsed: float = 0.0) -> dict:
+    return {"ok": False, "ir": None, "diagnostics": diagnostics,
+            "elapsed": elapsed, "trace": None, "dot": None}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        # Requests of one connection are answered in order
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, ValueError):
+                return
+            if request is None:
+                return
+
+            op = request.get("op", "compile")
+            if op == "compile":
+                reply = self.server.compile(request)
+            elif op == "ping":
+                reply = {"ok": True}
+            elif op == "shutdown":
+                send_message(self.request, {"ok": True})
+                self.server.shutdown()
+                return
+            else:
+                reply = _failed(f"Unknown request {op!r}\n")
+            send_message(self.request, reply)
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # jobs: number of worker processes, at most this many files are compiled
+    # at the same time. request_timeout: seconds a request may take, requests
+    # can ask for less.
+
+    daemon_threads = True
+
+    path: str
+    jobs: int
+    request_timeout: float
+
+    def __init__(self, path: str = DEFAULT_SOCKET, jobs: int = None,
+                 request_timeout: float = None):
+        _remove_stale_socket(path)
+        self.path = path
+        self.jobs = jobs if jobs else os.cpu_count()
+        self.request_timeout = request_timeout
+        self._lock = threading.Lock()
+        self.executor = self._start_workers()
+        super().__init__(path, _Handler)
+
+    def _start_workers(self) -> ProcessPoolExecutor:
+        # Started before any thread of the server, and warmed up once
+        executor = ProcessPoolExecutor(max_workers=self.jobs)
+        executor.submit(int).result()
+        return executor
+
+    def compile(self, request: dict) -> dict:
+        timeouts = [t for t in [request.get("timeout"), self.request_timeout]
+                    if t is not None]
+        timeout = min(timeouts) if timeouts else None
+
+        start = time.perf_counter()
+        executor = self.executor
+        future = executor.submit(compile_request, request)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # A running compilation cannot be stopped, it keeps its worker
+            # until it is done
+            future.cancel()
+            return _failed(f"{request.get('name')}: timed out after "
+                           f"{timeout}s\n", time.perf_counter() - start)
+        except BrokenProcessPool as e:
+            # A worker died, e.g. killed. Start new ones for the next requests.
+            with self._lock:
+                if self.executor is executor:
+                    self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+            return _failed(f"Internal error: {e}\n")
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(path: str) -> None:
+    # Left by a server that did not exit cleanly. A running server is not
+    # replaced.
+    if not os.path.exists(path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        sock.close()
+    raise OSError(f"A compile server is already running on {path}")
+
+
+def serve(path: str = DEFAULT_SOCKET, jobs: int = None,
+          request_timeout: float = None) -> None:
+    with CompileServer(path, jobs, request_timeout) as server:
+        print(f"Compile server listening on {path} with {server.jobs} "
+              "workers", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -1,11 +1,66 @@
-from Tokenizer import Tokenizer, Token
-from typing import Callable, List, Tuple
+from __future__ import annotations
+from Tokenizer import Tokenizer, SliceTokenizer, Token
+from typing import Callable, Generator, List, TextIO, Tuple
 from functools import wraps
+import inspect
+from types import MethodType
+import io
+import json
 from Block import *
 from SSA import FramePointer, Const, SSAValue, BlockFirstSSA, NextBlockFirstSSA
 from Types import *
 from Function import *
-from IRVis import IRVis
+from IRBuilder import IRBuilder, compiling
+from AST import run_nested
+
+
+# What an expression is nested in, see SmplCompiler.expression()
+_TOP, _PAREN, _INDEX, _ARGS = range(4)
+
+
+class TraceWriter:
+    # Writes the parse trace as it happens, in the format of SmplCDebug.toStr()
+
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    @classmethod
+    def open(cls, file: str) -> TraceWriter:
+        return cls(open(file, "w", buffering=1 << 16))
+
+    def enter(self, name: str, depth: int) -> None:
+        self.out.write(f"{'| ' * depth}NT:{name}\n")
+
+    def exit(self, name: str, depth: int) -> None:
+        pass
+
+    def token(self, token: Token, depth: int) -> None:
+        self.out.write(f"{'| ' * depth}{token}\n")
+
+    def flush(self) -> None:
+        self.out.flush()
+
+    def close(self) -> None:
+        self.out.close()
+
+
+class JsonTraceWriter(TraceWriter):
+    # One JSON object per line, for tools
+
+    def _write(self, record: dict) -> None:
+        self.out.write(json.dumps(record, separators=(",", ":")))
+        self.out.write("\n")
+
+    def enter(self, name: str, depth: int) -> None:
+        self._write({"enter": name, "depth": depth})
+
+    def exit(self, name: str, depth: int) -> None:
+        self._write({"exit": name, "depth": depth})
+
+    def token(self, token: Token, depth: int) -> None:
+        line, col = token.source.line_col(token.offset)
+        self._write({"token": Token.TokenName[token.type], "sym": token.sym,
+                     "line": line, "col": col, "depth": depth})
 
 
 class SmplCDebug:
@@ -14,74 +69,114 @@ class SmplCDebug:
             self.name = name
             self.components = []
 
-    def __init__(self, file: str = None):
+    def __init__(self, file: str = None, writer: TraceWriter = None,
+                 tree: bool = True):
+        # With a writer, the trace is streamed as it happens. The tree is only
+        # kept in memory if asked for.
         self.root = []
         self.current = self.root
         self.stack = []
         self.file = file
+        self.writer = writer
+        self.tree = tree
+        self.names = []  # Nonterminals being parsed
 
     def add(self, item):
-        self.current.append(item)
+        if self.writer:
+            self.writer.token(item, len(self.names))
+        if self.tree:
+            self.current.append(item)
 
     def push(self, func_name:str):
-        nt = self.NT(func_name)
-        self.add(nt)
-        self.stack.append(self.current)
-        self.current = nt.components
+        if self.writer:
+            self.writer.enter(func_name, len(self.names))
+        self.names.append(func_name)
+        if self.tree:
+            nt = self.NT(func_name)
+            self.current.append(nt)
+            self.stack.append(self.current)
+            self.current = nt.components
 
     def pop(self):
-        self.current = self.stack.pop()
-
-    def toStr(self, node: List, indent: int = 0) -> str:
-        string = ""
+        func_name = self.names.pop()
+        if self.writer:
+            self.writer.exit(func_name, len(self.names))
+        if self.tree:
+            self.current = self.stack.pop()
 
+    def write(self, writer: TraceWriter, node: List, indent: int = 0) -> None:
         for item in node:
             if isinstance(item, self.NT):
-                string += f"{'| ' * indent}NT:{item.name}\n"
-                string += self.toStr(indent=indent+1, node=item.components)
+                writer.enter(item.name, indent)
+                self.write(writer, item.components, indent + 1)
+                writer.exit(item.name, indent)
             elif isinstance(item, Token):
-                string += f"{'| ' * indent}{item}\n"
+                writer.token(item, indent)
             else:
                 raise Exception("Internal error: debug node of unexpected "
                                 f"type {type(node)}")
 
-        return string
+    def toStr(self, node: List, indent: int = 0) -> str:
+        out = io.StringIO()
+        self.write(TraceWriter(out), node, indent)
+        return out.getvalue()
 
     def dump(self):
+        if self.writer:
+            self.writer.flush()
+        if not self.tree:
+            return
+
         if self.file:
             with open(self.file, "w+") as f:
-                f.write(self.toStr(self.root))
-        else:
+                self.write(TraceWriter(f), self.root)
+        elif not self.writer:
             print(self.toStr(self.root))
 
 
-class SmplCompiler:
+class SmplCompiler(IRBuilder):
     file: str
     debug: SmplCDebug
     tokenizer: Tokenizer
-    inputSym: Token
-    computationBlock: SuperBlock
-    funcCtx: FuncContext
-    mainFuncCtx: FuncContext
 
-    def __init__(self, file: str, debug: SmplCDebug = None):
+    def __init__(self, file: str, debug: SmplCDebug = None,
+                 use_mmap: bool = False, tokenizer: Tokenizer = None,
+                 source=None):
         self.file = file
+        # Parse tracing is on with a debug tree. Without it, the grammar
+        # methods are called directly.
         self.debug = debug
-        self.tokenizer = Tokenizer(self.file)
-        self.inputSym = None
-        self.computationBlock = SuperBlock("computation block")
-        self.funcCtx = FuncContext()
-        self.mainFuncCtx = self.funcCtx
+        if not self.debug:
+            self._untrace()
+        # A given tokenizer, e.g. one replaying a cached token stream
+        self.tokenizer = tokenizer if tokenizer else \
+            SliceTokenizer(self.file, use_mmap=use_mmap, source=source)
+        # The names the tokenizer adds as it reads are seen as they come
+        super().__init__(self.tokenizer.names)
 
         self._debug_printed = False
 
+        # Prevent the user from redefining these functions. Names already
+        # known to the tokenizer keep their ids.
+        for func in PREDEFINED_FUNCTIONS:
+            if func in self.tokenizer.ids:
+                id = self.tokenizer.string2id(func)
+            else:
+                id = self.tokenizer.add_name(func)
+            self.predefined[id] = func
+
         # Read the first token
         self._next()
 
-        # Prevent the user from redefining these functions
-        for func, v in PREDEFINED_FUNCTIONS.items():
-            id = self.tokenizer.add_name(func)
-            v[2] = id  # Set id
+    @classmethod
+    def from_source(cls, source, name: str = "<source>",
+                    debug: SmplCDebug = None) -> SmplCompiler:
+        # Compile a str, bytes or memoryview without a file on disk. name is
+        # shown in diagnostics in place of the file.
+        return cls(name, debug=debug, source=source)
+
+    def close(self) -> None:
+        self.tokenizer.close()
 
     def _next(self) -> None:
         if self.debug and self.inputSym:
@@ -102,25 +197,6 @@ class SmplCompiler:
                 pass
             self._debug_printed = True
 
-    def _compiling_msg(self, msg: str, sym: Token = None) -> str:
-        sym = sym if sym else self.inputSym
-        return f"{sym.source_loc()}\n{msg}"
-
-    def warning(self, msg:str, sym:Token = None) -> None:
-        print(self._compiling_msg("WARNING: " + msg, sym))
-
-    def error(self, msg: str, sym: Token = None) -> None:
-        raise Exception(self._compiling_msg("ERROR: " + msg, sym))
-
-    def getConst(self, num: int) -> Const:
-        return self.funcCtx.getConst(num)
-
-    def vis(self, vis: IRVis) -> None:
-        vis.block(self.computationBlock)
-        for _, _type in self.funcCtx.identType.items():
-            if isinstance(_type, FuncType):
-                _type.vis(vis)
-
     def _nonterminal(func: Callable):
         @wraps(func)
         def wrapNT(self, *args, **kargs):
@@ -140,28 +216,55 @@ class SmplCompiler:
                     self.debug.pop()
             return ret
 
+        # The same for a grammar method that is a generator, see run_nested()
+        @wraps(func)
+        def wrapNestedNT(self, *args, **kargs):
+            try:
+                if self.debug:
+                    self.debug.push(func.__name__)
+                ret = yield from func(self, *args, **kargs)
+
+            except Exception as e:
+                if self.debug:
+                    self.debug.dump()
+                self._debug_print()
+                raise e
+
+            finally:
+                if self.debug:
+                    self.debug.pop()
+            return ret
+
+        if inspect.isgeneratorfunction(func):
+            wrapNT = wrapNestedNT
+        wrapNT.nonterminal = True
         return wrapNT
 
+    def _untrace(self) -> None:
+        # Bind the undecorated grammar methods to this instance, so that the
+        # parser pays nothing per nonterminal. computation() stays wrapped to
+        # print where an error happened.
+        cls = type(self)
+        for name in dir(cls):
+            method = getattr(cls, name)
+            if getattr(method, "nonterminal", False) and \
+                    name != "computation":
+                setattr(self, name, MethodType(method.__wrapped__, self))
+
     @_nonterminal
     def designator(self, context: SimpleBB,
                    write: bool) -> Tuple[SSAValue, int, bool]:
         # designator = ident{ "[" expression "]" }
 
-        # Return values: BaseSSA see below, int: identifier id, bool: is array
-
-        # Returned BaseSSA:
-        # For scalars (write=False), return the BaseSSA from the value table.
-        # For arrays, first emit instructions to calculate the offset. Then
-        # return the address of the element.
+        # Return values: BaseSSA see IRBuilder.emit_designator(), int:
+        # identifier id, bool: is array
 
         self._check_token(Token.IDENT, 'Expecting identifier at the beginning '
                           f'of designator, found {self.inputSym}')
 
         sym = self.inputSym
         id = self.tokenizer.id
-        if not self.funcCtx.identDefined(id):
-            self.error("Using of undefined identifier!")
-        _type = self.funcCtx.getIdent(id)
+        _type = self.lookup_ident(id)
 
         self._next()
 
@@ -177,132 +280,217 @@ class SmplCompiler:
                               f'Expecting "]", found {self.inputSym}')
             self._next()
 
-        # Array
-        if dims:
-            # Compute the offset
-            offset = None
-            for idx, limit in zip(dims, _type.dims):
-                if isinstance(idx, Const):
-                    assert idx.num < limit, "Array index out of bound!"
-                if offset is not None:
-                    offset = SSA.Inst(SSA.OP.MUL, offset,
-                                      self.getConst(limit))
-                    context.add_inst(offset)
-                    offset = SSA.Inst(SSA.OP.ADD, offset, idx)
-                    context.add_inst(offset)
-                else:
-                    offset = idx
-
-            # Scale by 4 (assuming each array element takes 4 bytes)
-            offset = SSA.Inst(SSA.OP.MUL, offset, self.getConst(4))
-            context.add_inst(offset)
-
-            # Return the SSAValue on the target address
-            return offset, id, True
-
-        # Scalar
-        else:
-            assert _type == VarType.Scalar()
-            if write:
-                return None, id, False
-
-            else:
-                # Trace back and look up for the value in the value table
-                value = context.lookup_value_table(id)
-                if value is not None:
-                    return value, id, False
-                else:
-                    self.warning("Using uninitialized variable!", sym)
-                    zero = self.getConst(0)
-                    zero.identifier = id
-                    context.get_value_table().set(id, zero)
-                    return zero, id, False
-
-    @_nonterminal
-    def factor(self, context: SimpleBB) -> SSAValue:
-        # factor = designator | number | "(" expression ")" | funcCall
-
-        if self.inputSym.type == Token.IDENT:
-            ret, id, is_array = self.designator(context, write=False)
-            if is_array:
-                # Calculate the element address based on the array's address
-                base = context.lookup_value_table(id)
-                assert base is not None
-                address = SSA.Inst(SSA.OP.ADDA, base, ret)
-                context.add_inst(address)
-
-                # Load from the address (ret)
-                load = SSA.Inst(SSA.OP.LOAD, address)
-                load.identifier = id
-                context.add_inst(load)
-                return load
-            else:
-                return ret
-
-        elif self.inputSym.type == Token.NUMBER:
-            num = self.tokenizer.num
-            ret = self.getConst(num)
-            self._next()
-            return ret
-
-        elif self.inputSym.type == Token.OPENPAREN:
-            self._next()
-            ret = self.expression(context)
-            self._check_token(Token.CLOSEPAREN,
-                              "Unmatched parentheses in factor!")
-            self._next()
-            return ret
-
-        elif self.inputSym.type == Token.CALL:
-            return self.funcCall(context)
-
-        else:
-            raise Exception(
-                f"Factor starts with unexpected token {self.inputSym}")
-
-    @_nonterminal
-    def term(self, context: SimpleBB) -> SSAValue:
-        # term = factor { ("*" | "/") factor}
-
-        val = self.factor(context)
-
-        while True:
-            if self.inputSym.type == Token.TIMES:
-                self._next()
-                operand = self.factor(context)
-                val = SSA.Inst(SSA.OP.MUL, val, operand)
-                context.add_inst(val)
-
-            elif self.inputSym.type == Token.DIV:
-                self._next()
-                operand = self.factor(context)
-                val = SSA.Inst(SSA.OP.DIV, val, operand)
-                context.add_inst(val)
-
-            else:
-                return val
+        return self.emit_designator(context, sym, id, _type, dims, write)
 
     @_nonterminal
     def expression(self, context: SimpleBB) -> SSAValue:
         # expression = term {("+" | "-") term}
+        # term = factor { ("*" | "/") factor}
+        # factor = designator | number | "(" expression ")" | funcCall
+        #
+        # Parsed in a loop rather than with a Python call per nonterminal, so
+        # that deeply nested expressions don't hit the recursion limit. An
+        # expression in parentheses, an array index or a call argument saves
+        # the state of the expression around it on a stack. The instructions
+        # are emitted at the same points as by recursive descent: "*" and "/"
+        # when their right factor ends, "+" and "-" when their right term
+        # ends. The trace has the same nonterminals too.
+
+        debug = self.debug
+        traced = 0  # Nonterminals pushed here and not popped yet
+        stack = []  # State of the expressions around this one
+        kind = _TOP
+        info = None  # Designator or call an index or argument belongs to
+        expr = expr_op = term = term_op = None
+
+        try:
+            if debug:
+                debug.push("term")
+                traced += 1
+
+            while True:
+                # A factor, or the beginning of an expression nested in it
+                if debug:
+                    debug.push("factor")
+                    traced += 1
+                designator = None
+
+                if self.inputSym.type == Token.IDENT:
+                    if debug:
+                        debug.push("designator")
+                        traced += 1
+                    sym = self.inputSym
+                    id = self.tokenizer.id
+                    _type = self.lookup_ident(id)
+                    self._next()
 
-        val = self.term(context)
+                    designator = (sym, id, _type, [])
+                    if self.inputSym.type == Token.OPENBRACKET:
+                        self._next()
+                        stack.append((kind, info, expr, expr_op, term,
+                                      term_op))
+                        kind, info = _INDEX, designator
+                        expr = expr_op = term = term_op = None
+                        if debug:
+                            debug.push("expression")
+                            debug.push("term")
+                            traced += 2
+                        continue
+
+                elif self.inputSym.type == Token.NUMBER:
+                    value = self.getConst(self.tokenizer.num)
+                    self._next()
 
-        while True:
-            if self.inputSym.type == Token.PLUS:
-                self._next()
-                operand = self.term(context)
-                val = SSA.Inst(SSA.OP.ADD, val, operand)
-                context.add_inst(val)
+                elif self.inputSym.type == Token.OPENPAREN:
+                    self._next()
+                    stack.append((kind, info, expr, expr_op, term, term_op))
+                    kind, info = _PAREN, None
+                    expr = expr_op = term = term_op = None
+                    if debug:
+                        debug.push("expression")
+                        debug.push("term")
+                        traced += 2
+                    continue
+
+                elif self.inputSym.type == Token.CALL:
+                    if debug:
+                        debug.push("funcCall")
+                        traced += 1
+                    self._next()
+                    self._check_token(Token.IDENT, 'Expecting function name, '
+                                      f'found {self.inputSym}')
+                    sym = self.inputSym
+                    id = self.tokenizer.id
+                    self._next()
 
-            elif self.inputSym.type == Token.MINUS:
-                self._next()
-                operand = self.term(context)
-                val = SSA.Inst(SSA.OP.SUB, val, operand)
-                context.add_inst(val)
+                    if self.inputSym.type == Token.OPENPAREN:
+                        self._next()
+                        if self.inputSym.type != Token.CLOSEPAREN:
+                            stack.append((kind, info, expr, expr_op, term,
+                                          term_op))
+                            kind, info = _ARGS, (sym, id, [])
+                            expr = expr_op = term = term_op = None
+                            if debug:
+                                debug.push("expression")
+                                debug.push("term")
+                                traced += 2
+                            continue
+                        self._next()
+
+                    value = self.emit_call(context, sym, id, [])
+                    if debug:
+                        debug.pop()
+                        traced -= 1
 
-            else:
-                return val
+                else:
+                    raise Exception(
+                        f"Factor starts with unexpected token {self.inputSym}")
+
+                # The factor ends, and maybe the expressions it ends
+                while True:
+                    if designator is not None:
+                        sym, id, _type, dims = designator
+                        designator = None
+                        value, id, is_array = self.emit_designator(
+                            context, sym, id, _type, dims, False)
+                        if debug:
+                            debug.pop()
+                            traced -= 1
+                        if is_array:
+                            value = self.emit_load(context, value, id)
+                    if debug:
+                        debug.pop()
+                        traced -= 1
+
+                    if term_op is None:
+                        term = value
+                    else:
+                        term = self.emit_binop(context, term_op, term, value)
+                        term_op = None
+
+                    if self.inputSym.type == Token.TIMES:
+                        term_op = SSA.OP.MUL
+                        self._next()
+                        break
+                    elif self.inputSym.type == Token.DIV:
+                        term_op = SSA.OP.DIV
+                        self._next()
+                        break
+
+                    # The term ends
+                    if debug:
+                        debug.pop()
+                        traced -= 1
+                    if expr_op is None:
+                        expr = term
+                    else:
+                        expr = self.emit_binop(context, expr_op, expr, term)
+                        expr_op = None
+
+                    if self.inputSym.type in (Token.PLUS, Token.MINUS):
+                        expr_op = SSA.OP.ADD \
+                            if self.inputSym.type == Token.PLUS else SSA.OP.SUB
+                        self._next()
+                        if debug:
+                            debug.push("term")
+                            traced += 1
+                        break
+
+                    # The expression ends
+                    value = expr
+                    if kind == _TOP:
+                        return value
+                    if debug:
+                        debug.pop()
+                        traced -= 1
+
+                    if kind == _PAREN:
+                        self._check_token(Token.CLOSEPAREN,
+                                          "Unmatched parentheses in factor!")
+                        self._next()
+
+                    elif kind == _INDEX:
+                        info[3].append(value)
+                        self._check_token(Token.CLOSEBRACKET,
+                                          f'Expecting "]", found '
+                                          f'{self.inputSym}')
+                        self._next()
+                        if self.inputSym.type == Token.OPENBRACKET:
+                            self._next()
+                            expr = None
+                            if debug:
+                                debug.push("expression")
+                                debug.push("term")
+                                traced += 2
+                            break
+                        designator = info
+
+                    else:
+                        info[2].append(value)
+                        if self.inputSym.type == Token.COMMA:
+                            self._next()
+                            assert self.inputSym.type != Token.CLOSEPAREN
+                        if self.inputSym.type != Token.CLOSEPAREN:
+                            expr = None
+                            if debug:
+                                debug.push("expression")
+                                debug.push("term")
+                                traced += 2
+                            break
+                        self._next()
+                        sym, id, args = info
+                        value = self.emit_call(context, sym, id, args)
+                        if debug:
+                            debug.pop()
+                            traced -= 1
+
+                    # The factor it is nested in ends next
+                    kind, info, expr, expr_op, term, term_op = stack.pop()
+
+        finally:
+            # On an error, close what the nested calls would have
+            for _ in range(traced):
+                debug.pop()
 
     @_nonterminal
     def relation(self, context: SimpleBB) -> Tuple[SSAValue, int]:
@@ -317,10 +505,7 @@ class SmplCompiler:
 
         operand2 = self.expression(context)
 
-        ret = SSA.Inst(SSA.OP.CMP, operand1, operand2)
-        context.add_inst(ret)
-
-        return ret, relop
+        return self.emit_relation(context, operand1, operand2), relop
 
     @_nonterminal
     def assignment(self, context: SimpleBB) -> None:
@@ -338,21 +523,7 @@ class SmplCompiler:
 
         src = self.expression(context)
 
-        if is_array:
-            # Calculate the element address based on the array's address
-            base = context.lookup_value_table(id)
-            assert base is not None
-            address = SSA.Inst(SSA.OP.ADDA, base, ret)
-            context.add_inst(address)
-
-            # Store value to array
-            store = SSA.Inst(SSA.OP.STORE, src, address)
-            store.identifier = id
-            context.add_inst(store)
-
-        else:
-            # Update the mapping in the value table
-            context.get_value_table().set(id, src)
+        self.emit_assignment(context, ret, id, is_array, src)
 
     @_nonterminal
     def funcCall(self, context: SimpleBB) -> SSAValue:
@@ -385,40 +556,15 @@ class SmplCompiler:
                               f'{self.inputSym}')
             self._next()
 
-        if not self.funcCtx.identDefined(id):
-            self.error("Calling undefined function!", sym)
-
-        if sym.sym in PREDEFINED_FUNCTIONS:
-            # Emit calling of the predefined function
-            op, param_cnt, _ = PREDEFINED_FUNCTIONS[sym.sym]
-            if param_cnt != len(args):
-                self.error(
-                    f"Expecting {param_cnt} parameters, getting {len(args)}.")
-            inst = SSA.Inst(op, *args)
-            context.add_inst(inst)
-            return inst
-
-        else:
-            func = self.funcCtx.getIdent(id)
-            if not isinstance(func, FuncType):
-                self.error(f"Expecting function, getting {func}")
-            assert len(func.args) == len(args)
-            # Emit call of that function
-            call = SSA.CallInst(sym.sym, args)
-            context.add_inst(call)
-            return call
+        return self.emit_call(context, sym, id, args)
 
     @_nonterminal
-    def ifStatement(self, lastBlock: Block, superBlock: SuperBlock) -> SuperBlock:
+    def ifStatement(self, lastBlock: Block, superBlock: SuperBlock
+                    ) -> Generator[Generator, None, SuperBlock]:
         # ifStatement = "if" relation "then" statSequence [ "else" statSequence ] "fi"
 
-        relBlock = BranchBB()
-        connectBlock = JoinBB()
+        relBlock, connectBlock = self.begin_if(lastBlock, superBlock)
         changed_variables = set()  # The variables changed in either branch
-        relBlock.set_prev(lastBlock)
-        superBlock.head = relBlock
-        superBlock.tail = connectBlock
-        connectBlock.last_cs_block = relBlock
 
         self._check_token(Token.IF, 'Expecting "if" at the begining of '
                           f'ifStatement, found {self.inputSym}')
@@ -428,76 +574,24 @@ class SmplCompiler:
         self._check_token(Token.THEN, 'Expecting "then" in ifStatement, found '
                           f'{self.inputSym}')
         self._next()
-        # Setting up the context
-        ifBlock = SuperBlock()
-        ifBlock.name = "if body"
-        relBlock.set_next(ifBlock)
-        connectBlock.set_prev(ifBlock)
 
         # Process the statement sequence
-        self.statSequence(relBlock, ifBlock)
-        ifBlock.set_next(connectBlock)
-        changed_variables.update(ifBlock.get_value_table().get_ids())
-        connectBlock.killStores = set(ifBlock.get_stores())
-
-        # Branch to if block
-        ifBraOp = SSA.OP._from_relop(relop)
-        conditionBraInst = SSA.Inst(
-            ifBraOp, rel, BlockFirstSSA(ifBlock.get_firstbb()))
-        relBlock.add_inst(conditionBraInst)
+        ifBlock = self.begin_if_body(relBlock, connectBlock)
+        yield self.statSequence(relBlock, ifBlock)
+        self.end_if_body(relBlock, connectBlock, ifBlock, rel, relop,
+                         changed_variables)
 
         if self.inputSym.type == Token.ELSE:
             self._next()
-            # Setting up the context
-            elseBlock = SuperBlock()
-            elseBlock.name = "else body"
-            relBlock.branchBlock = elseBlock
-            connectBlock.joiningBlock = elseBlock
             # Process the statement sequence
-            self.statSequence(relBlock, elseBlock)
-            elseBlock.set_next(connectBlock)
-            changed_variables.update(elseBlock.get_value_table().get_ids())
-            connectBlock.killStores = set(elseBlock.get_stores())
-
-            # Branch from the end of else block to connect block
-            elseJoinBraOp = SSA.Inst(SSA.OP.BRA, BlockFirstSSA(connectBlock))
-            elseBlock.get_lastbb().add_inst(elseJoinBraOp)
+            elseBlock = self.begin_else(relBlock, connectBlock)
+            yield self.statSequence(relBlock, elseBlock)
+            self.end_else(connectBlock, elseBlock, changed_variables)
 
         else:
-            relBlock.branchBlock = connectBlock
-            connectBlock.joiningBlock = relBlock
-
-            # Fall through to connect block
-            fallThroughBraInst = SSA.Inst(
-                SSA.OP.BRA, BlockFirstSSA(connectBlock))
-            relBlock.add_inst(fallThroughBraInst)
-
-        # Add phi instructions
-        # 1. Find changed variables: value table from left (else) if any, and
-        # from right(if body) branch
-        # 2. For each variable, get SSA value from left and right
-        # 3. Insert phi(left, right) and update value table
-        left_block = connectBlock.joiningBlock
-        right_block = connectBlock.prev
-        for id in changed_variables:
-            id_name = self.tokenizer.id2string(id)
-            left = left_block.lookup_value_table(id)
-            right = right_block.lookup_value_table(id)
-
-            if left is None:
-                self.warning(f"Using uninitialized variable {id_name} in phi!")
-                left = self.get_const(0)
-            if right is None:
-                self.warning(f"Using uninitialized variable {id_name} in phi!")
-                right = self.get_const(0)
-
-            if left == right:
-                continue
-
-            phi = SSA.Inst(SSA.OP.PHI, left, right)
-            phi.identifier = id
-            connectBlock.add_inst(phi)
-            connectBlock.get_value_table().set(id, phi)
+            self.no_else(relBlock, connectBlock)
+
+        self.end_if(connectBlock, changed_variables)
 
         self._check_token(Token.FI, 'Expecting "fi" at the end of ifStatement, '
                           f'found {self.inputSym}')
@@ -506,21 +600,12 @@ class SmplCompiler:
         return superBlock
 
     @_nonterminal
-    def whileStatement(self, lastBlock: Block,
-                       superBlock: SuperBlock) -> SuperBlock:
+    def whileStatement(self, lastBlock: Block, superBlock: SuperBlock
+                       ) -> Generator[Generator, None, SuperBlock]:
         # whileStatement = "while" relation "do" StatSequence "od"
 
-        connectBlock = JoinBB()
-        relBlock = BranchBB()
-        bodyBlock = SuperBlock()
-        bodyBlock.name = "while body"
-        connectBlock.joiningBlock = bodyBlock
-        connectBlock.set_next(relBlock)
-        connectBlock.set_prev(lastBlock)
-        relBlock.branchBlock = bodyBlock
-        relBlock.set_prev(connectBlock)
-        superBlock.head = connectBlock
-        superBlock.tail = relBlock
+        connectBlock, relBlock, bodyBlock = self.begin_while(lastBlock,
+                                                             superBlock)
 
         self._check_token(Token.WHILE, 'Expecting "while" at the begining of '
                           f'whileStatement, found {self.inputSym}')
@@ -532,61 +617,15 @@ class SmplCompiler:
         self._next()
 
         # Process while body
-        self.statSequence(relBlock, bodyBlock)
-        bodyBlock.set_next(connectBlock)
-        changed_variables = bodyBlock.get_value_table().get_ids()
-        connectBlock.killStores = set(bodyBlock.get_stores())
+        yield self.statSequence(relBlock, bodyBlock)
+        changed_variables = self.end_while_body(connectBlock, bodyBlock)
 
         self._check_token(Token.OD, 'Expecting "od" at the end of whileStatement, '
                           f'found {self.inputSym}')
         self._next()
 
-        # Branch from relation block to body block if condition is met
-        whileBraOp = SSA.OP._from_relop(relop)
-        conditionBraInst = SSA.Inst(
-            whileBraOp, rel, BlockFirstSSA(bodyBlock.get_firstbb()))
-        relBlock.add_inst(conditionBraInst)
-
-        # Branch from relation block to the next block of while
-        relToNextBlockBraInst = SSA.Inst(SSA.OP.BRA, NextBlockFirstSSA(relBlock))
-        relBlock.add_inst(relToNextBlockBraInst)
-
-        # Branch from while body to connect block unconditionally
-        bodyToJoinBraInst = SSA.Inst(SSA.OP.BRA, BlockFirstSSA(connectBlock))
-        bodyBlock.get_lastbb().add_inst(bodyToJoinBraInst)
-
-        # : Add phi instructions
-        # 0. Annotate SSA value with variable name in assignments
-        # 1. Find changed variables: must from left (while body) branch
-        # 2. For each variable, get SSA value from left and right
-        # 3. Insert phi(left, right) and update value table
-        # 4. Change SSA values used in the rel block and the while body block
-        left_block = connectBlock.joiningBlock
-        right_block = connectBlock.prev
-        for id in changed_variables:
-            id_name = self.tokenizer.id2string(id)
-            left = left_block.lookup_value_table(id)
-            right = right_block.lookup_value_table(id)
-
-            # The changed variable must have been changed in the while body
-            assert left is not None
-            if right is None:
-                self.warning(f"Using uninitialized variable {id_name} in phi!")
-                right = self.get_const(0)
-
-            if left == right:
-                continue
-
-            phi = SSA.Inst(SSA.OP.PHI, left, right)
-            phi.identifier = id
-            connectBlock.add_inst(phi)
-            connectBlock.get_value_table().set(id, phi)
-
-            # Change SSA values for id in rel block and while body block from
-            # original SSA (that from before while, i.e. right) to phi
-            relBlock.replace_operand(right, id, phi)
-            bodyBlock.replace_operand(right, id, phi)
-
+        self.end_while(connectBlock, relBlock, bodyBlock, rel, relop,
+                       changed_variables)
         return superBlock
 
     @_nonterminal
@@ -597,25 +636,15 @@ class SmplCompiler:
                           f'returnStatement, found {self.inputSym}')
         self._next()
 
+        value = None
         if self.inputSym.type in [Token.IDENT, Token.NUMBER, Token.OPENPAREN, Token.CALL]:
             value = self.expression(context)
-            ret = SSA.Inst(SSA.OP.RET, value)
-        else:
-            ret = SSA.Inst(SSA.OP.RET)
 
-        context.add_inst(ret)
-        return ret
-
-    def _get_ctx(self, lastBlock: Block, canMerge: bool = False) -> SimpleBB:
-        if isinstance(lastBlock, SimpleBB) and canMerge:
-            context = lastBlock
-        else:
-            context = SimpleBB()
-            context.set_prev(lastBlock)
-        return context
+        return self.emit_return(context, value)
 
     @_nonterminal
-    def statement(self, lastBlock: Block, canMerge: bool = False) -> Block:
+    def statement(self, lastBlock: Block, canMerge: bool = False
+                  ) -> Generator[Generator, None, Block]:
         # statement = assignment | funcCall | ifStatement | whileStatement | returnStatement
 
         if self.inputSym.type == Token.LET:
@@ -631,13 +660,13 @@ class SmplCompiler:
         elif self.inputSym.type == Token.IF:
             ifBlock = SuperBlock("if statement")
             ifBlock.set_prev(lastBlock)
-            self.ifStatement(lastBlock, ifBlock)
+            yield self.ifStatement(lastBlock, ifBlock)
             return ifBlock
 
         elif self.inputSym.type == Token.WHILE:
             whileBlock = SuperBlock("while statement")
             whileBlock.set_prev(lastBlock)
-            self.whileStatement(lastBlock, whileBlock)
+            yield self.whileStatement(lastBlock, whileBlock)
             return whileBlock
 
         elif self.inputSym.type == Token.RETURN:
@@ -649,9 +678,13 @@ class SmplCompiler:
             raise Exception(f'Expecting statment, found {self.inputSym}')
 
     @_nonterminal
-    def statSequence(self, lastBlock: Block, superBlock: SuperBlock):
+    def statSequence(self, lastBlock: Block, superBlock: SuperBlock
+                     ) -> Generator[Generator, Block, None]:
         # statSequence = statement { ";" statement } [ ";" ]
 
+        # The statements, and the statSequences in them, are generators run by
+        # run_nested(). Each yields the nonterminal it would call.
+
         superBlock.set_prev(lastBlock)
 
         statement_tokens = [Token.LET, Token.CALL,
@@ -662,21 +695,9 @@ class SmplCompiler:
                            f'Expecting statement, found {self.inputSym}')
 
         while self.inputSym.type in statement_tokens:
-            # This is the first block in the super block
-            if superBlock.tail is None:
-                block = self.statement(lastBlock, canMerge=False)
-                block.set_prev(lastBlock)
-                superBlock.head = block
-                superBlock.tail = block
-
-            else:
-                block = self.statement(superBlock.tail, canMerge=True)
-                # Check if a new block was just created
-                if block.id != superBlock.tail.id:
-                    # Connect new block in the list of the superBlock
-                    superBlock.tail.set_next(block)
-                    block.set_prev(superBlock.tail)
-                    superBlock.tail = block
+            prev, canMerge = self.statement_prev(lastBlock, superBlock)
+            block = yield self.statement(prev, canMerge=canMerge)
+            self.add_statement(lastBlock, superBlock, block)
 
             if self.inputSym.type == Token.SEMI:
                 self._next()
@@ -728,19 +749,7 @@ class SmplCompiler:
             self._check_token(Token.IDENT, 'Expecting identifier, found '
                               f'{self.inputSym}')
 
-            # Add identifier to type table
-            sym = self.inputSym
-            id = self.tokenizer.id
-            if self.funcCtx.identDefined(id):
-                self.error("Redefinition of variable!", sym)
-            self.funcCtx.setIdent(id, _type)
-
-            if _type.is_array():
-                fp = FramePointer()
-                addr = SSA.Inst(SSA.OP.ADD, fp, self.getConst(fp.offset))
-                context.add_inst(addr)
-                fp.increment(_type.size())
-                context.value_table.set(id, addr)
+            self.declare_var(context, self.inputSym, self.tokenizer.id, _type)
 
             self._next()
 
@@ -769,20 +778,7 @@ class SmplCompiler:
         self._check_token(Token.IDENT, 'Expecting identifier after keyword '
                           f'"function", found {self.inputSym}')
 
-        # Create function object
-        sym = self.inputSym
-        id = self.tokenizer.id
-        if self.funcCtx.identDefined(id):
-            self.error("Redefinition of variable!", sym)
-        func = FuncType(sym.sym, is_void)
-
-        # Add functions to the context
-        for ident, _type in self.funcCtx.identType.items():
-            if isinstance(_type, FuncType):
-                func.funcCtx.setIdent(ident, _type)
-        self.funcCtx.setIdent(id, func)
-        # Set context
-        self.funcCtx = func.funcCtx
+        func = self.begin_func(self.inputSym, self.tokenizer.id, is_void)
 
         self._next()
 
@@ -793,15 +789,13 @@ class SmplCompiler:
         self._next()
 
         self.funcBody(func.bodyBlock)
-        func.bodyBlock.set_next(func.endBlock)
-        func.bodyBlock.set_prev(func.constBlock)
+        self.end_func_body(func)
 
         self._check_token(Token.SEMI, 'Expecting ";" after funcBody, '
                           f'found {self.inputSym}')
         self._next()
 
-        # Restore context
-        self.funcCtx = self.mainFuncCtx
+        self.end_func()
 
     @_nonterminal
     def formalParam(self, func: FuncType):
@@ -815,16 +809,8 @@ class SmplCompiler:
 
         while self.inputSym.type == Token.IDENT:
             # Collect all parameters, create an ARG inst for each
-            sym = self.inputSym
-            id = self.tokenizer.id
-            if self.funcCtx.identDefined(id):
-                self.error("Redefinition of variable!", sym)
-            # Formal parameters are all scalars
-            self.funcCtx.setIdent(id, VarType.Scalar())
-            arg = SSA.Inst(SSA.OP.ARG, self.getConst(paramCnt))
-            func.constBlock.add_inst(arg)
-            func.constBlock.get_value_table().set(id, arg)
-            func.add_arg(arg)
+            self.declare_param(func, self.inputSym, self.tokenizer.id,
+                               paramCnt)
             paramCnt += 1
 
             self._next()
@@ -852,17 +838,17 @@ class SmplCompiler:
         self._next()
         
         if self.inputSym.type != Token.END:
-            self.statSequence(self.funcCtx.constBlock, superBlock)
+            run_nested(self.statSequence(self.funcCtx.constBlock,
+                                          superBlock))
         else:
-            emptyBlock = SimpleBB()
-            superBlock.head = emptyBlock
-            superBlock.tail = emptyBlock
+            self.empty_body(superBlock)
 
         self._check_token(Token.END, 'Expecting "}" at the end of '
                           f'funcBody, found {self.inputSym}')
         self._next()
 
     @_nonterminal
+    @compiling
     def computation(self) -> SuperBlock:
         # computation = "main" { varDecl } { funcDecl } "{" statSequence "}" "."
 
@@ -870,23 +856,7 @@ class SmplCompiler:
                           f'of computation, found {self.inputSym}')
         self._next()
 
-        # Create blocks
-        constBlock = SimpleBB()
-        endBlock = SimpleBB()
-        mainBlock = SuperBlock("main function")
-        self.funcCtx.constBlock = constBlock
-
-        SSA.Const.constBlock = constBlock
-        constBlock.add_inst(FramePointer())
-        constBlock.set_prev(constBlock)  # To itself, meaning the first
-        constBlock.set_next(mainBlock)
-        endBlock.set_prev(mainBlock)
-        endBlock.set_next(endBlock)  # To itself, meaning the last
-
-        # Construct computation block that contains the const block ("BB0") and
-        # the main block
-        self.computationBlock.head = constBlock
-        self.computationBlock.tail = endBlock
+        constBlock, endBlock, mainBlock = self.begin_computation()
 
         while self.inputSym.type == Token.VAR or self.inputSym.type == Token.ARR:
             self.varDecl(self.funcCtx.constBlock)
@@ -900,9 +870,8 @@ class SmplCompiler:
         self._next()
         
         # Process the statement sequence
-        self.statSequence(constBlock, mainBlock)
-        mainBlock.set_next(endBlock)
-        endBlock.add_inst(SSA.Inst(SSA.OP.END))
+        run_nested(self.statSequence(constBlock, mainBlock))
+        self.end_main(mainBlock, endBlock)
 
         self._check_token(
             Token.END, 'Expecting "}", found ' + f'{self.inputSym}')
@@ -912,8 +881,4 @@ class SmplCompiler:
                           f'computation, found {self.inputSym}')
         self._next()
 
-        # Regenerate all common subexpressions in the end. Previously some cs
-        # can be falsely generated because the graph is not complete.
-        for inst in SSA.SSAValue.ALL_SSA:
-            if isinstance(inst, SSA.Inst):
-                inst._get_cs_flag = False
+        self.end_computation()
@@ -0,0 +1,323 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from Tokenizer import Tokenizer, SliceTokenizer, Token, SourceMap
+
+
+class TokenBuffer:
+    # A whole token stream of one source, stored as struct of arrays. Token i
+    # is (types[i], offsets[i], lengths[i], values[i]). The last token is
+    # always EOF or ERROR.
+
+    types: array
+    offsets: array
+    lengths: array
+    values: array  # Identifier id or number value, NO_VALUE otherwise
+    names: List[str]  # Identifier id: identifier
+    source: SourceMap
+    relexed: Tuple[int, int]  # Token indices scanned again by relex()
+
+    NO_VALUE = -1
+
+    MAGIC = b"SMPLTOK2"
+    # Magic, token count, name count, names size, line count, typecodes of
+    # token offsets and line starts
+    _HEADER = struct.Struct("<8sQQQQcc")
+
+    def __init__(self, source: SourceMap, names: List[str] = None):
+        self.source = source
+        self.names = names if names is not None else []
+        self.relexed = None
+
+        # Signed, as the EOF token of an empty source is at offset -1
+        wide = len(source.code) >= 2 ** 31
+        self.types = array("B")
+        self.offsets = array("q" if wide else "i")
+        self.lengths = array("I")
+        self.values = array("q")
+
+    @classmethod
+    def scan(cls, tokenizer: Tokenizer) -> TokenBuffer:
+        # Run the tokenizer to the end of the file. Identifiers already added
+        # to the tokenizer keep their ids.
+        buffer = cls(tokenizer.source)
+        while True:
+            token = tokenizer.getNext()
+            buffer.append(token)
+            if token.type in [Token.EOF, Token.ERROR]:
+                break
+
+        buffer.names = [tokenizer.names[id] for id in range(tokenizer.id_cnt)]
+        return buffer
+
+    def append(self, token: Token) -> None:
+        value = token.value
+        if value is None or not -2 ** 63 <= value < 2 ** 63:
+            # Numbers too large for the array are parsed again when replayed
+            value = self.NO_VALUE
+        self.types.append(token.type)
+        self.offsets.append(token.offset)
+        self.lengths.append(token.length)
+        self.values.append(value)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def token(self, idx: int) -> Token:
+        _type = self.types[idx]
+        value = self.values[idx]
+        if value == self.NO_VALUE:
+            value = None
+        token = Token(self.source, self.offsets[idx], self.lengths[idx], _type,
+                      value)
+        if _type == Token.NUMBER and value is None:
+            token.value = int(token.sym)
+        return token
+
+    def relex(self, offset: int, removed: int, inserted) -> TokenBuffer:
+        # The token stream after replacing removed chars at offset with
+        # inserted. Only the damaged window is scanned again: from the first
+        # token touching the edit up to the first new token that starts where
+        # an old one did in the unchanged rest. Identifiers keep their ids.
+        if self.source.is_bytes and isinstance(inserted, str):
+            inserted = inserted.encode()
+        source = self.source.splice(offset, removed, inserted)
+        delta = len(inserted) - removed
+
+        # Tokens ending before the edit are kept. A token ending right at the
+        # edit may be extended by it.
+        first = bisect_left(self.offsets, offset)
+        if first >= len(self) - 1:
+            # At the end. The last token is always new, and the EOF token sits
+            # on the last char, so the token before it is scanned again too.
+            first = max(len(self) - 2, 0)
+        elif first and self.offsets[first - 1] + self.lengths[first - 1] >= \
+                offset:
+            first -= 1
+        pos = self.offsets[first - 1] + self.lengths[first - 1] if first \
+            else 0
+
+        buffer = TokenBuffer(source)
+        for dst, src in [(buffer.types, self.types),
+                         (buffer.offsets, self.offsets),
+                         (buffer.lengths, self.lengths),
+                         (buffer.values, self.values)]:
+            dst.extend(src[:first])
+
+        tokenizer = SliceTokenizer.resume(source, pos, self.names)
+        old = first  # No old token before this one can match
+        while True:
+            token = tokenizer.getNext()
+            if token.type in [Token.EOF, Token.ERROR]:
+                buffer.append(token)
+                break
+
+            if token.offset >= offset + len(inserted):
+                # Past the edit. Look for an old token at the same place.
+                old = bisect_left(self.offsets, token.offset - delta, old)
+                if old < len(self) - 1 and \
+                        self.offsets[old] == token.offset - delta and \
+                        self.types[old] == token.type and \
+                        self.lengths[old] == token.length:
+                    # The rest is scanned from the same chars, so is the same
+                    buffer.relexed = (first, len(buffer))
+                    buffer.types.extend(self.types[old:])
+                    buffer.offsets.extend(
+                        o + delta for o in self.offsets[old:])
+                    buffer.lengths.extend(self.lengths[old:])
+                    buffer.values.extend(self.values[old:])
+                    break
+            buffer.append(token)
+
+        if buffer.relexed is None:
+            buffer.relexed = (first, len(buffer))
+        buffer.names = [tokenizer.names[id] for id in range(tokenizer.id_cnt)]
+        return buffer
+
+    def is_error(self) -> bool:
+        return self.types[-1] == Token.ERROR
+
+    def to_bytes(self) -> bytes:
+        names = "\n".join(self.names).encode()
+        arrays = [self.types, self.offsets, self.lengths, self.values,
+                  self.source.line_starts]
+        if sys.byteorder == "big":
+            arrays = [array(a.typecode, a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+
+        header = self._HEADER.pack(
+            self.MAGIC, len(self), len(self.names), len(names),
+            len(self.source.line_starts), self.offsets.typecode.encode(),
+            self.source.line_starts.typecode.encode())
+        return b"".join([header, names] + [a.tobytes() for a in arrays])
+
+    @classmethod
+    def from_bytes(cls, data: bytes, file: str, code) -> TokenBuffer:
+        # Load a token stream of code, as saved by to_bytes()
+        magic, token_cnt, name_cnt, names_size, line_cnt, offset_code, \
+            line_code = cls._HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError(f"Not a token buffer: {file}")
+        pos = cls._HEADER.size
+
+        names = data[pos:pos + names_size].decode().split("\n") \
+            if name_cnt else []
+        pos += names_size
+
+        arrays = []
+        for typecode, cnt in [("B", token_cnt),
+                              (offset_code.decode(), token_cnt),
+                              ("I", token_cnt), ("q", token_cnt),
+                              (line_code.decode(), line_cnt)]:
+            a = array(typecode)
+            size = a.itemsize * cnt
+            a.frombytes(data[pos:pos + size])
+            if sys.byteorder == "big":
+                a.byteswap()
+            arrays.append(a)
+            pos += size
+        if pos != len(data):
+            raise ValueError(f"Corrupted token buffer: {file}")
+
+        types, offsets, lengths, values, line_starts = arrays
+        buffer = cls(SourceMap(file, code, line_starts=line_starts), names)
+        buffer.types = types
+        buffer.offsets = offsets
+        buffer.lengths = lengths
+        buffer.values = values
+        return buffer
+
+
+class ReplayTokenizer(Tokenizer):
+    # Same contract as Tokenizer.getNext(), but replays a scanned TokenBuffer
+    # instead of reading the source.
+
+    buffer: TokenBuffer
+
+    def __init__(self, buffer: TokenBuffer, start: int = 0):
+        # Nothing to read, so Tokenizer.__init__() is not called
+        self.buffer = buffer
+        self.source = buffer.source
+        self.file = self.source.file
+        self.idx = start  # Index of the next token
+
+        # States
+        self.is_error = False
+        self.num = None
+        self.id = None
+
+        # ID - Name mapping
+        self.id_cnt = len(buffer.names)
+        self.names = dict(enumerate(buffer.names))
+        self.ids = {name: id for id, name in self.names.items()}
+
+    def getNext(self) -> Token:
+        token = self.buffer.token(self.idx)
+        # The last token (EOF or ERROR) is repeated
+        if self.idx < len(self.buffer) - 1:
+            self.idx += 1
+
+        if token.type == Token.IDENT:
+            self.id = token.value
+        elif token.type == Token.NUMBER:
+            self.num = token.value
+        elif token.type == Token.ERROR:
+            self.is_error = True
+        return token
+
+
+class TokenCache:
+    # On-disk cache of token streams, keyed by the hash of the source bytes.
+    # A cached stream is replayed without running the scanner.
+
+    VERSION = 2
+
+    directory: str
+    names: List[str]  # Identifiers added before scanning, e.g. predefined
+
+    def __init__(self, directory: str, names: List[str] = ()):
+        self.directory = directory
+        self.names = list(names)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self.scan_time = 0.0
+
+    def key(self, code) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.VERSION}\n".encode())
+        h.update("\n".join(self.names).encode() + b"\0")
+        h.update(code)
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".tok")
+
+    def tokenizer(self, file: str) -> Tokenizer:
+        # Offsets of cached tokens are taken in the raw bytes, so the source is
+        # always memory-mapped. Nothing is scanned yet.
+        tokenizer = SliceTokenizer(file, use_mmap=True)
+        if tokenizer.is_error:
+            return tokenizer
+
+        code = tokenizer.source.code
+        path = self.path(self.key(code))
+
+        start = time.perf_counter()
+        buffer = self.load(path, file, code)
+        if buffer is not None:
+            self.hits += 1
+            self.load_time += time.perf_counter() - start
+            return ReplayTokenizer(buffer)
+
+        self.misses += 1
+        start = time.perf_counter()
+        for name in self.names:
+            tokenizer.add_name(name)
+        buffer = TokenBuffer.scan(tokenizer)
+        self.scan_time += time.perf_counter() - start
+
+        # Errors are reported while scanning. Such streams are not kept.
+        if not buffer.is_error():
+            self.store(path, buffer)
+        return ReplayTokenizer(buffer)
+
+    def load(self, path: str, file: str, code) -> Optional[TokenBuffer]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            return TokenBuffer.from_bytes(data, file, code)
+        except FileNotFoundError:
+            return None
+        except (ValueError, struct.error):
+            print(f"Ignore broken token cache {path}", file=sys.stderr)
+            return None
+
+    def store(self, path: str, buffer: TokenBuffer) -> None:
+        # Write to a temporary file first, so that a concurrent reader never
+        # sees a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(buffer.to_bytes())
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    def report(self) -> str:
+        return f"Token cache: {self.hits} hits ({self.load_time * 1000:.2f} " \
+            f"ms loading), {self.misses} misses " \
+            f"({self.scan_time * 1000:.2f} ms scanning)"
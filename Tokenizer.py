@@ -1,38 +1,85 @@
 #! /bin/env python3
 
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+import mmap
+import os
+import re
 import sys
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List
 
 
 class FileReader:
     ERROR = 0
     EOF = 255
+    TAB_SIZE = 4
 
-    def __init__(self, file: str):
+    def __init__(self, file: str, use_mmap: bool = False, source=None):
         self.code = ""
         self.idx = 0
         self.is_error = False
 
-        # For debugging
-        self.line = 1
-        self.col = 0
+        # With use_mmap, the file is mapped instead of read into a str, and tabs
+        # are only expanded when a column is reported. self.code is then a
+        # bytes-like buffer.
+        self.use_mmap = use_mmap
+
+        # For debugging. Line and column are only resolved from the source map
+        # when they are reported, instead of being updated for every char.
         self.file = file
+        self.source = SourceMap(self.file, self.code)
 
-        self.open()
+        if source is None:
+            self.open()
+        else:
+            # Already in memory. file only names it in diagnostics.
+            self.load(source)
 
     def __str__(self) -> str:
-        return f"{self.file}:{self.line}:{self.col}"
+        return "{}:{}:{}".format(*self.debug_info())
+
+    @property
+    def line(self) -> int:
+        return self.debug_info()[1]
+
+    @property
+    def col(self) -> int:
+        return self.debug_info()[2]
 
     def debug_info(self) -> Tuple[str, int, int]:
-        return self.file, self.line, self.col
+        # Position of the last char read
+        return (self.file, *self.source.line_col(self.idx - 1))
 
     def open(self) -> None:
         try:
-            with open(self.file) as f:
-                self.code = f.read().expandtabs(tabsize=4)
+            if self.use_mmap:
+                with open(self.file, "rb") as f:
+                    if os.fstat(f.fileno()).st_size:
+                        self.code = mmap.mmap(
+                            f.fileno(), 0, access=mmap.ACCESS_READ)
+                    else:
+                        self.code = b""  # Cannot map an empty file
+            else:
+                with open(self.file) as f:
+                    self.code = f.read().expandtabs(tabsize=self.TAB_SIZE)
+            self.source = SourceMap(self.file, self.code)
         except:
             self.error(f"Fail to open file {self.file}")
 
+    def load(self, source) -> None:
+        # Use a str like a file read in text mode. A bytes-like source is used
+        # as it is, like a memory-mapped file.
+        if isinstance(source, str):
+            self.use_mmap = False
+            self.code = source.replace("\r\n", "\n").replace("\r", "\n") \
+                .expandtabs(tabsize=self.TAB_SIZE)
+        else:
+            self.use_mmap = True
+            self.code = memoryview(source).cast("B") \
+                if isinstance(source, memoryview) else source
+        self.source = SourceMap(self.file, self.code)
+
     def error(self, error_msg: str) -> None:
         self.is_error = True
         print(
@@ -47,13 +94,17 @@ class FileReader:
         elif self.end():
             return self.EOF
         else:
-            if self.idx > 0 and self.code[self.idx - 1] == "\n":
-                self.line += 1
-                self.col = 1
-            else:
-                self.col += 1
             sym = self.code[self.idx]
             self.idx += 1
+            if self.use_mmap:
+                # Indexing a bytes-like buffer gives an int
+                sym = chr(sym)
+                # Read "\r\n" and a lone "\r" as "\n", like reading the file
+                # in text mode
+                if sym == "\r":
+                    if self.code[self.idx:self.idx + 1] == b"\n":
+                        return self.getNext()
+                    sym = "\n"
             return sym
 
 
@@ -187,49 +238,151 @@ class Token:
         "main": MAIN,
     }
 
-    file: str
-    line: int
-    col: int
-    sym: str
-    type: int
+    # A token only keeps its type, where it is in the source and its value.
+    # The lexeme, line and column are resolved from the source map on demand.
+    __slots__ = ("type", "offset", "length", "value", "source")
 
-    def __init__(self, file: str, line: int, col: int):
-        self.file = file
-        self.line = line
-        self.col = col
-
-        self.sym = ""
-        self.type = self.ERROR  # Unset
+    type: int
+    offset: int  # Buffer offset of the first char
+    length: int
+    value: int  # Identifier id or number value
+    source: SourceMap
+
+    def __init__(self, source: SourceMap, offset: int, length: int = 0,
+                 _type: int = ERROR, value: int = None):
+        self.source = source
+        self.offset = offset
+        self.length = length
+        self.type = _type
+        self.value = value
+
+    @property
+    def file(self) -> str:
+        return self.source.file
+
+    @property
+    def line(self) -> int:
+        return self.source.line_col(self.offset)[0]
+
+    @property
+    def col(self) -> int:
+        return self.source.line_col(self.offset)[1]
+
+    @property
+    def sym(self) -> str:
+        return self.source.text(self.offset, self.offset + self.length)
 
     def __str__(self) -> str:
+        line, col = self.source.line_col(self.offset)
         return f'"{self.sym}" ({self.TokenName[self.type]}) ' + \
-            f'{self.file}:{self.line}:{self.col}'
+            f'{self.file}:{line}:{col}'
 
     def __repr__(self) -> str:
         return self.__str__()
 
     def source_loc(self) -> str:
-        with open(self.file, "r") as f:
-            lines = f.readlines()
-        assert len(lines) > self.line-1
+        return self.source.source_loc(*self.source.line_col(self.offset),
+                                      self.length)
 
-        code_line = lines[self.line-1].expandtabs(tabsize=4)
-        if len(code_line) <= self.col + len(self.sym) - 2:
-            print(code_line)
-            print(len(code_line), self.col, len(self.sym))
-        assert len(code_line) > self.col + len(self.sym) - 2
 
-        file_loc = f"{self.file}({self.line}:{self.col})\n"
+class SourceMap:
+    # The source buffer of a file and the offsets of its line starts. Built
+    # once per file, so that diagnostics never read the file again.
+
+    file: str
+    code: str  # Or a bytes-like buffer, see FileReader
+    line_starts: array
+
+    _NEWLINE = re.compile("\n")
+    # A lone "\r" ends a line too, as in text mode, see FileReader
+    _NEWLINE_BYTES = re.compile(b"\r\n?|\n")
+
+    def __init__(self, file: str, code, line_starts: array = None):
+        self.file = file
+        self.code = code
+        self.is_bytes = not isinstance(code, str)
+
+        if line_starts is not None:
+            # Already known, e.g. loaded from a token cache
+            self.line_starts = line_starts
+            return
+
+        newline = self._NEWLINE_BYTES if self.is_bytes else self._NEWLINE
+        # 4 bytes per line unless the buffer is too large for that
+        self.line_starts = array("I" if len(code) < 2 ** 32 else "Q", [0])
+        self.line_starts.extend(m.end() for m in newline.finditer(code))
+
+    def line_cnt(self) -> int:
+        return len(self.line_starts)
+
+    def close(self) -> None:
+        # Unmap a memory-mapped file. Its tokens cannot be read after.
+        if isinstance(self.code, mmap.mmap):
+            self.code.close()
+
+    def splice(self, offset: int, removed: int, inserted) -> SourceMap:
+        # The source map after replacing removed chars at offset with
+        # inserted. Line starts outside the edit are kept or shifted.
+        if self.is_bytes:
+            code = b"".join([self.code[:offset], inserted,
+                             self.code[offset + removed:]])
+        else:
+            code = self.code[:offset] + inserted + self.code[offset + removed:]
+        newline = self._NEWLINE_BYTES if self.is_bytes else self._NEWLINE
+        delta = len(inserted) - removed
+
+        line_starts = array("I" if len(code) < 2 ** 32 else "Q",
+                            self.line_starts[:bisect_right(self.line_starts,
+                                                           offset)])
+        line_starts.extend(offset + m.end()
+                           for m in newline.finditer(inserted))
+        line_starts.extend(
+            start + delta for start in self.line_starts[
+                bisect_right(self.line_starts, offset + removed):])
+        return SourceMap(self.file, code, line_starts=line_starts)
+
+    def line_col(self, offset: int) -> Tuple[int, int]:
+        # Line and column (after tab expansion) of the char at offset
+        line = max(bisect_right(self.line_starts, offset), 1)
+        line_start = self.line_starts[line - 1]
+        prefix = self.text(line_start, offset + 1)
+        if "\t" in prefix:
+            return line, len(prefix.expandtabs(tabsize=FileReader.TAB_SIZE))
+        return line, offset - line_start + 1
+
+    def text(self, start: int, end: int) -> str:
+        text = self.code[start:end]
+        if self.is_bytes:
+            # A slice of a memoryview is still a memoryview
+            text = bytes(text).decode(errors="replace") \
+                .replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def line_text(self, line: int) -> str:
+        # The line with tabs expanded, including the newline if there is one
+        assert 0 < line <= self.line_cnt()
+        end = self.line_starts[line] if line < self.line_cnt() else None
+        return self.text(self.line_starts[line - 1], end) \
+            .expandtabs(tabsize=FileReader.TAB_SIZE)
+
+    def source_loc(self, line: int, col: int, length: int) -> str:
+        code_line = self.line_text(line)
+        assert len(code_line) > col + length - 2
+
+        file_loc = f"{self.file}({line}:{col})\n"
+
+        return f"{file_loc}{code_line}{' '*(col-1)}{'^'*length}"
 
-        return f"{file_loc}{code_line}{' '*(self.col-1)}{'^'*len(self.sym)}"
 
 class Tokenizer:
     ids: Dict[str, int]
     names: Dict[int, str]
 
-    def __init__(self, file: str):
+    def __init__(self, file: str, use_mmap: bool = False, source=None):
         self.file = file
-        self.fileReader = FileReader(self.file)
+        self.fileReader = FileReader(self.file, use_mmap=use_mmap,
+                                     source=source)
+        self.source = self.fileReader.source
 
         # States
         self.is_error = False
@@ -242,6 +395,19 @@ class Tokenizer:
         self.ids = {}  # identifier: identifier id
         self.names = {}  # identifier id: identifier
 
+        self._start()
+
+    def __enter__(self) -> Tokenizer:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Done with the source, and with the diagnostics of its tokens
+        self.source.close()
+
+    def _start(self) -> None:
         self.next()  # Read the first char
         self.clear_white_space()
 
@@ -300,7 +466,8 @@ class Tokenizer:
             self.next()
 
     def create_token(self) -> Token:
-        return Token(*self.fileReader.debug_info())
+        # Starts at the current char
+        return Token(self.source, self.fileReader.idx - 1)
 
     def number(self) -> Token:
         token = self.create_token()
@@ -317,8 +484,9 @@ class Tokenizer:
         self.clear_white_space()
 
         self.num = result
-        token.sym = sym
+        token.length = len(sym)
         token.type = Token.NUMBER
+        token.value = result
         return token
 
     def identifier(self) -> Token:
@@ -335,7 +503,7 @@ class Tokenizer:
         # Consume following white spaces. Prepare for parsing the next token.
         self.clear_white_space()
 
-        token.sym = sym
+        token.length = len(sym)
         if sym in Token.RESERVED_WORDS:
             token.type = Token.RESERVED_WORDS[sym]
         else:
@@ -344,6 +512,7 @@ class Tokenizer:
             if sym not in self.ids:
                 self.add_name(sym)
             self.id = self.ids[sym]
+            token.value = self.id
 
         return token
 
@@ -363,7 +532,7 @@ class Tokenizer:
                 self.next()
         elif sym in ["=", "!"]:
             if self.inputSym != "=":
-                token.sym = sym
+                token.length = len(sym)
                 token.type = Token.ERROR
                 self.error(f"Fail to parse token: {token}")
                 return token
@@ -373,7 +542,7 @@ class Tokenizer:
         # Consume following white spaces. Prepare for parsing the next token.
         self.clear_white_space()
 
-        token.sym = sym
+        token.length = len(sym)
         if sym in Token.SYMBOLS:
             token.type = Token.SYMBOLS[sym]
         else:
@@ -397,3 +566,112 @@ class Tokenizer:
             return self.identifier()
         else:
             return self.operator()
+
+
+class SliceTokenizer(Tokenizer):
+    # Same contract as Tokenizer.getNext(), but scans whole lexemes by index
+    # over the buffer with one compiled regex instead of pulling characters one
+    # by one through FileReader.getNext(). Lexemes are taken as slices.
+
+    # Leading white spaces, then a number, an identifier or an operator. The
+    # last alternative takes any other character so that unknown symbols are
+    # still reported.
+    _PATTERN = r"[{0}]*(?:([0-9]+)|([A-Za-z][A-Za-z0-9]*)|" \
+        r"(<[=-]?|>=?|[=!]=?|[^{0}]))"
+    _SCAN = re.compile(_PATTERN.format(r" \t\n"))
+    # The same scanner for memory-mapped buffers. "\r" is skipped as well, as
+    # "\r\n" and a lone "\r" are read as "\n" in text mode.
+    _SCAN_BYTES = re.compile(_PATTERN.format(r" \t\r\n").encode())
+    _NUMBER = 1
+    _IDENT = 2
+
+    @classmethod
+    def resume(cls, source: SourceMap, pos: int,
+               names: List[str]) -> SliceTokenizer:
+        # Scan source from pos without reading the file, e.g. to relex an
+        # edited region. Identifier ids are taken from names.
+        tokenizer = cls.__new__(cls)
+        tokenizer.file = source.file
+        tokenizer.source = source
+        tokenizer.code = source.code
+        tokenizer.use_mmap = source.is_bytes
+        tokenizer.scan = cls._SCAN_BYTES.match if source.is_bytes \
+            else cls._SCAN.match
+        tokenizer.pos = pos
+
+        # States
+        tokenizer.is_error = False
+        tokenizer.inputSym = None
+        tokenizer.num = None
+        tokenizer.id = None
+
+        # ID - Name mapping
+        tokenizer.id_cnt = len(names)
+        tokenizer.names = dict(enumerate(names))
+        tokenizer.ids = {name: id for id, name in tokenizer.names.items()}
+        return tokenizer
+
+    def _start(self) -> None:
+        self.code = self.fileReader.code
+        self.use_mmap = self.fileReader.use_mmap
+        self.scan = self._SCAN_BYTES.match if self.use_mmap else self._SCAN.match
+        self.pos = 0  # Scan position in the buffer
+
+        if self.fileReader.is_error:
+            self.error(f"Error in file reader {self.fileReader}")
+
+    def create_token(self) -> Token:
+        # Starts at the lookahead char, or at the last char at the end of file,
+        # the same as Tokenizer.create_token()
+        return Token(self.source, min(self.pos, len(self.code) - 1))
+
+    def getNext(self) -> Token:
+        if self.is_error:
+            token = self.create_token()
+            token.type = Token.ERROR
+            return token
+
+        match = self.scan(self.code, self.pos)
+        if match is None:
+            # Only white spaces left
+            self.pos = len(self.code)
+            token = self.create_token()
+            token.type = Token.EOF
+            return token
+
+        group = match.lastindex
+        start = match.start(group)
+        end = match.end()
+        sym = match.group(group)
+        if self.use_mmap:
+            sym = sym.decode(errors="replace")
+
+        if group == self._NUMBER:
+            self.num = int(sym)
+            token = Token(self.source, start, end - start, Token.NUMBER,
+                          self.num)
+
+        elif group == self._IDENT:
+            if sym in Token.RESERVED_WORDS:
+                token = Token(self.source, start, end - start,
+                              Token.RESERVED_WORDS[sym])
+            else:
+                # Add to the tables if neccessary. Set id
+                if sym not in self.ids:
+                    self.add_name(sym)
+                self.id = self.ids[sym]
+                token = Token(self.source, start, end - start, Token.IDENT,
+                              self.id)
+
+        elif sym in Token.SYMBOLS:
+            token = Token(self.source, start, end - start, Token.SYMBOLS[sym])
+
+        else:
+            token = Token(self.source, start, end - start, Token.ERROR)
+            if sym in ["=", "!"]:
+                self.error(f"Fail to parse token: {token}")
+            else:
+                self.error(f"Unknown symbol: {token}")
+
+        self.pos = end
+        return token
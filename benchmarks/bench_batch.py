@@ -0,0 +1,61 @@
+#! /bin/env python3
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import ROOT, scaled_corpus, write_sources, best_of
+import Batch
+
+# What running the compiler once per file costs: the interpreter, the imports
+# and one compilation
+ONE_FILE = "import sys; sys.path.insert(0, sys.argv[1]); " \
+    "from SmplCompiler import SmplCompiler; " \
+    "SmplCompiler(sys.argv[2]).computation()"
+
+
+def one_process_per_file(paths) -> int:
+    for path in paths:
+        subprocess.run([sys.executable, "-c", ONE_FILE, ROOT, path],
+                       stdout=subprocess.DEVNULL, check=True)
+    return len(paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile a directory as a "
+                                     "batch, and one process per file")
+    parser.add_argument("-n", dest="copies", type=int, default=10,
+                        help="copies of each example in the directory")
+    parser.add_argument("-s", dest="scale", type=int, default=5,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-j", dest="jobs", type=int, nargs="+",
+                        default=sorted({1, os.cpu_count()}),
+                        help="numbers of processes to try")
+    parser.add_argument("-r", dest="repeat", type=int, default=1,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    sources = {f"{name}_{i}": code
+               for name, code in scaled_corpus(args.scale).items()
+               for i in range(args.copies)}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_sources(sources, tmp)
+
+        elapsed, cnt = best_of(lambda: one_process_per_file(paths),
+                               args.repeat)
+        print(f"{'per file':>16}: {cnt} files in {elapsed:.3f}s "
+              f"({cnt / elapsed:.1f} files/s)")
+
+        for jobs in args.jobs:
+            elapsed, _ = best_of(
+                lambda: Batch.run([tmp], jobs=jobs, log=io.StringIO()),
+                args.repeat)
+            print(f"{f'batch -j {jobs}':>16}: {cnt} files in {elapsed:.3f}s "
+                  f"({cnt / elapsed:.1f} files/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#! /bin/env python3
+
+import argparse
+
+from common import best_of, quiet
+from SmplCompiler import SmplCompiler
+import SSA
+
+
+PROGRAM = """main
+var a, b, x;
+array[8] arr;
+{{
+    let a <- call InputNum();
+    let x <- a * 2;
+{}
+    call OutputNum(a + b)
+}}.
+"""
+
+
+# Straight-line blocks of size statements
+SHAPES = {
+    "distinct": lambda i: "    let a <- a + x;",
+    "repeated": lambda i: f"    let b <- a * x + {i % 8};",
+    "arrays": lambda i: f"    let arr[{i % 8}] <- arr[{(i + 3) % 8}] + x;",
+}
+
+
+def compile_one(code: str, walk: bool) -> int:
+    smplCompiler = SmplCompiler.from_source(code)
+    smplCompiler.computation()
+    if walk:
+        # Look the common subexpressions up one by one, as before GVN
+        for inst in smplCompiler.ctx.all_ssa:
+            if isinstance(inst, SSA.Inst):
+                inst._get_cs_flag = False
+                inst.vn = None
+    return smplCompiler.dump().count("\n    ")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find the common "
+                                     "subexpressions of a long block")
+    parser.add_argument("-n", dest="sizes", type=int, nargs="+",
+                        default=[1000, 10000],
+                        help="numbers of statements in the block")
+    parser.add_argument("-s", dest="shapes", nargs="+", choices=SHAPES,
+                        default=list(SHAPES),
+                        help="shapes of the statements")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    parser.add_argument("--walk", action="store_true",
+                        help="also walk back the instructions of each op")
+    args = parser.parse_args()
+
+    modes = ["gvn", "walk"] if args.walk else ["gvn"]
+    for size in args.sizes:
+        for shape in args.shapes:
+            code = PROGRAM.format("\n".join(SHAPES[shape](i)
+                                            for i in range(size)))
+            for mode in modes:
+                with quiet():
+                    elapsed, cnt = best_of(
+                        lambda: compile_one(code, mode == "walk"),
+                        args.repeat)
+                print(f"{shape:>10} {mode:>4}: {size} statements, {cnt} "
+                      f"instructions in {elapsed:.3f}s, "
+                      f"{elapsed / size * 1e6:.2f} us per statement")
+
+
+if __name__ == "__main__":
+    main()
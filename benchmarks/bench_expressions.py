@@ -0,0 +1,68 @@
+#! /bin/env python3
+
+import argparse
+import io
+import sys
+
+from common import best_of, quiet
+from SmplCompiler import SmplCompiler, SmplCDebug, JsonTraceWriter
+
+
+PROGRAM = """main
+var a;
+array[4] b;
+function f(x);
+{{ return x + 1 }};
+{{
+    let a <- call InputNum();
+    call OutputNum({})
+}}.
+"""
+
+
+# Expressions nested depth times
+SHAPES = {
+    "parentheses": lambda depth: "(" * depth + "a" + ")" * depth,
+    "call argument": lambda depth: "call f(" * depth + "a" + ")" * depth,
+    "arithmetic": lambda depth: "(a * " * depth + "a" + " - 1)" * depth,
+    "array index": lambda depth: "b[" * depth + "a" + "]" * depth,
+}
+
+
+def compile_one(code: str, trace: bool) -> int:
+    debug = SmplCDebug(writer=JsonTraceWriter(io.StringIO()), tree=False) \
+        if trace else None
+    smplCompiler = SmplCompiler.from_source(code, debug=debug)
+    smplCompiler.computation()
+    return sum(len(bb.get_insts())
+               for bb in smplCompiler.computationBlock.get_bbs())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parse deeply nested "
+                                     "expressions")
+    parser.add_argument("-d", dest="depths", type=int, nargs="+",
+                        default=[10000],
+                        help="nesting depths of the expressions")
+    parser.add_argument("-s", dest="shapes", nargs="+", choices=SHAPES,
+                        default=list(SHAPES),
+                        help="shapes of the expressions")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    parser.add_argument("--trace", action="store_true",
+                        help="also stream a JSON trace")
+    args = parser.parse_args()
+
+    print(f"Python recursion limit: {sys.getrecursionlimit()}")
+    for depth in args.depths:
+        for shape in args.shapes:
+            code = PROGRAM.format(SHAPES[shape](depth))
+            with quiet():
+                elapsed, cnt = best_of(lambda: compile_one(code, args.trace),
+                                       args.repeat)
+            print(f"{shape:>16}: depth {depth}, {cnt} instructions in "
+                  f"{elapsed:.3f}s, {elapsed / depth * 1e6:.2f} us per level")
+
+
+if __name__ == "__main__":
+    main()
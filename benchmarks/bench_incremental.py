@@ -0,0 +1,58 @@
+#! /bin/env python3
+
+import argparse
+import tempfile
+
+from common import function_program, best_of, quiet
+from SmplCompiler import SmplCompiler
+from IncrementalCompiler import IncrementalCompiler
+from IRCache import IRCache
+
+
+def compile_one_pass(code: str) -> None:
+    SmplCompiler.from_source(code).computation()
+
+
+def compile_incremental(code: str, cache: IRCache) -> IncrementalCompiler:
+    compiler = IncrementalCompiler.from_file("<source>", cache, source=code)
+    compiler.compile()
+    return compiler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild a program after "
+                                     "one of its functions changed")
+    parser.add_argument("-f", dest="funcs", type=int, default=100,
+                        help="number of functions in the program")
+    parser.add_argument("-l", dest="loops", type=int, default=4,
+                        help="number of loops in each function")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    code = function_program(args.funcs, args.loops)
+    print(f"{args.funcs} functions of {args.loops} loops, {len(code)} bytes")
+
+    # A new change in the body of the function in the middle for every run
+    middle = args.funcs // 2
+    edits = iter(range(middle + 2, middle + 2 + args.repeat + 1))
+
+    def edit() -> str:
+        return code.replace(f"let s <- y * {middle + 1};",
+                            f"let s <- y * {next(edits)};")
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            quiet():
+        base, _ = best_of(lambda: compile_one_pass(code), args.repeat)
+        cold, _ = best_of(lambda: compile_incremental(code, IRCache(tmp)), 1)
+        warm, compiler = best_of(
+            lambda: compile_incremental(edit(), IRCache(tmp)), args.repeat)
+
+    print(f"{'one pass':>16}: {base:.3f}s")
+    print(f"{'cold cache':>16}: {cold:.3f}s")
+    print(f"{'one changed':>16}: {warm:.3f}s, {base / warm:.2f}x")
+    print(compiler.report()[:200])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#! /bin/env python3
+
+import argparse
+import os
+import tempfile
+
+from common import scaled_corpus, best_of, quiet
+from SmplCompiler import SmplCompiler
+from IRCache import IRCache
+
+
+def compile_all(sources) -> int:
+    for name, code in sources.items():
+        SmplCompiler.from_source(code, name=name).computation()
+    return len(sources)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IR cache hit vs compiling")
+    parser.add_argument("-s", dest="scale", type=int, default=50,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    sources = scaled_corpus(args.scale)
+    with tempfile.TemporaryDirectory() as tmp, \
+            quiet():
+        cache_dir = os.path.join(tmp, "cache")
+
+        compiled, cnt = best_of(lambda: compile_all(sources), args.repeat)
+
+        # The first pass fills the cache
+        cache = IRCache(cache_dir)
+        for name, code in sources.items():
+            cache.compile(name, source=code)
+        report = cache.report()
+        size = cache.size()
+
+        def load():
+            cache = IRCache(cache_dir)
+            return [cache.compile(name, source=code)
+                    for name, code in sources.items()]
+        hit, _ = best_of(load, args.repeat)
+
+    print(report)
+    print(f"{'compile':>16}: {cnt} files in {compiled:.3f}s")
+    print(f"{'cache load':>16}: {hit:.3f}s, {compiled / hit:.2f}x, "
+          f"{size / 1024:.1f} KiB on disk")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#! /bin/env python3
+
+import argparse
+import tempfile
+import tracemalloc
+
+from common import code_examples, scale_program
+from Tokenizer import SliceTokenizer, Token
+
+
+def peak_lexing_memory(path: str, use_mmap: bool) -> int:
+    tracemalloc.start()
+    tokenizer = SliceTokenizer(path, use_mmap=use_mmap)
+    while tokenizer.getNext().type not in [Token.EOF, Token.ERROR]:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def retained_token_memory(path: str) -> int:
+    # Python heap held by all tokens of a file, e.g. in a parse tree
+    tokenizer = SliceTokenizer(path)
+    tracemalloc.start()
+    tokens = []
+    token = tokenizer.getNext()
+    while token.type not in [Token.EOF, Token.ERROR]:
+        tokens.append(token)
+        token = tokenizer.getNext()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, len(tokens)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Peak Python heap while lexing large sources")
+    parser.add_argument("-s", dest="scales", type=int, nargs="+",
+                        default=[1000, 4000, 16000],
+                        help="repeat the example's main body this many times")
+    parser.add_argument("-e", dest="example", type=str, default="while_complex",
+                        help="code example to scale up")
+    args = parser.parse_args()
+
+    code = code_examples()[args.example]
+    for scale in args.scales:
+        with tempfile.NamedTemporaryFile("w", suffix=".smpl") as tmp:
+            tmp.write(scale_program(code, scale))
+            tmp.flush()
+            size = tmp.tell()
+            read = peak_lexing_memory(tmp.name, use_mmap=False)
+            mapped = peak_lexing_memory(tmp.name, use_mmap=True)
+            retained, cnt = retained_token_memory(tmp.name)
+        print(f"{size / 1024:10.0f} KiB source: peak {read / 1024:10.0f} KiB "
+              f"read, {mapped / 1024:6.0f} KiB mmap, "
+              f"{retained / cnt:4.0f} bytes per retained token")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#! /bin/env python3
+
+import argparse
+import sys
+
+from common import best_of, quiet
+from SmplCompiler import SmplCompiler
+from ASTParser import ASTParser
+from Lowering import Lowering
+
+
+PROGRAM = """main
+var a, b, i;
+{{
+    let a <- call InputNum();
+    let i <- 0;
+    {}let b <- a{};
+    call OutputNum(b)
+}}.
+"""
+
+
+# Statements nested depth times, as the head repeated before the innermost
+# statement and the tail after it. Common subexpressions looked up while the
+# blocks are built walk back through the blocks around them, so statements
+# take time quadratic in the depth.
+SHAPES = {
+    "if": ("if a > i then let b <- a + 1;\n", " fi"),
+    "if-else": ("if a > i then let b <- a * 2 else\n", " fi"),
+    "while": ("while i < a do call OutputNum(i);\n", " od"),
+}
+
+
+def compile_one(code: str, ast: bool) -> int:
+    if ast:
+        parser = ASTParser.from_file("<source>", source=code)
+        lowering = Lowering(parser.buffer)
+        return len(lowering.computation(parser.computation()).get_bbs())
+    smplCompiler = SmplCompiler.from_source(code)
+    smplCompiler.computation()
+    return len(smplCompiler.computationBlock.get_bbs())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile deeply nested "
+                                     "statements")
+    parser.add_argument("-d", dest="depths", type=int, nargs="+",
+                        default=[1000, 10000],
+                        help="nesting depths of the statements")
+    parser.add_argument("-s", dest="shapes", nargs="+", choices=SHAPES,
+                        default=["if", "if-else"],
+                        help="shapes of the statements")
+    parser.add_argument("-r", dest="repeat", type=int, default=1,
+                        help="number of runs, the best one is reported")
+    parser.add_argument("--ast", action="store_true",
+                        help="parse to an AST and lower it, as with -j")
+    args = parser.parse_args()
+
+    print(f"Python recursion limit: {sys.getrecursionlimit()}")
+    for depth in args.depths:
+        for shape in args.shapes:
+            head, tail = SHAPES[shape]
+            code = PROGRAM.format(head * depth, tail * depth)
+            with quiet():
+                elapsed, cnt = best_of(lambda: compile_one(code, args.ast),
+                                       args.repeat)
+            print(f"{shape:>16}: depth {depth}, {cnt} blocks in "
+                  f"{elapsed:.3f}s, {elapsed / depth * 1e6:.2f} us per level")
+
+
+if __name__ == "__main__":
+    main()
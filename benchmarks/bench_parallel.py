@@ -0,0 +1,48 @@
+#! /bin/env python3
+
+import argparse
+import os
+
+from common import function_program, best_of, quiet
+from SmplCompiler import SmplCompiler
+from ParallelCompiler import ParallelCompiler
+
+
+def compile_one_pass(code: str) -> None:
+    SmplCompiler.from_source(code).computation()
+
+
+def compile_parallel(code: str, jobs: int) -> None:
+    ParallelCompiler.from_file("<source>", jobs=jobs, source=code).compile()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile the functions of a "
+                                     "program in parallel")
+    parser.add_argument("-f", dest="funcs", type=int, default=400,
+                        help="number of functions in the program")
+    parser.add_argument("-j", dest="jobs", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count()}),
+                        help="numbers of processes to try")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    code = function_program(args.funcs)
+    print(f"{args.funcs} functions, {len(code)} bytes, "
+          f"{os.cpu_count()} cores")
+
+    with quiet():
+        base, _ = best_of(lambda: compile_one_pass(code), args.repeat)
+        results = {jobs: best_of(lambda: compile_parallel(code, jobs),
+                                 args.repeat)[0]
+                   for jobs in args.jobs}
+
+    print(f"{'one pass':>16}: {base:.3f}s")
+    for jobs, elapsed in results.items():
+        print(f"{f'{jobs} processes':>16}: {elapsed:.3f}s "
+              f"({base / elapsed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#! /bin/env python3
+
+import argparse
+import os
+import tempfile
+
+from common import scaled_corpus, best_of, quiet
+from SmplCompiler import SmplCompiler, SmplCDebug, TraceWriter, \
+    JsonTraceWriter
+
+
+def compile_all(sources, get_debug) -> int:
+    cnt = 0
+    with quiet():
+        for name, code in sources.items():
+            debug = get_debug()
+            smplCompiler = SmplCompiler.from_source(code, name=name,
+                                                    debug=debug)
+            smplCompiler.computation()
+            if debug:
+                debug.dump()
+                if debug.writer:
+                    debug.writer.close()
+            cnt += 1
+    return cnt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parse with and without "
+                                     "tracing")
+    parser.add_argument("-s", dest="scale", type=int, default=20,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    sources = scaled_corpus(args.scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        debug_file = os.path.join(tmp, "debug.txt")
+        modes = {
+            "tree": lambda: SmplCDebug(file=debug_file),
+            "text stream": lambda: SmplCDebug(
+                writer=TraceWriter.open(debug_file), tree=False),
+            "json stream": lambda: SmplCDebug(
+                writer=JsonTraceWriter.open(debug_file), tree=False),
+            "no trace": lambda: None,
+        }
+
+        results = {}
+        for mode, get_debug in modes.items():
+            elapsed, cnt = best_of(lambda: compile_all(sources, get_debug),
+                                   args.repeat)
+            results[mode] = elapsed
+            print(f"{mode:>16}: {cnt} programs in {elapsed:.3f}s")
+
+    print(f"{'speedup':>16}: {results['tree'] / results['no trace']:.2f}x "
+          "without tracing")
+
+
+if __name__ == "__main__":
+    main()
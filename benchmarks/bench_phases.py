@@ -0,0 +1,72 @@
+#! /bin/env python3
+
+import argparse
+
+from common import scaled_corpus, best_of, quiet
+from Tokenizer import SliceTokenizer
+from TokenBuffer import TokenBuffer
+from SmplCompiler import SmplCompiler
+from ASTParser import ASTParser
+from Lowering import Lowering
+from Function import PREDEFINED_FUNCTIONS
+import AST
+
+
+def scan_all(sources):
+    buffers = []
+    for name, code in sources.items():
+        tokenizer = SliceTokenizer(name, source=code)
+        for func in PREDEFINED_FUNCTIONS:
+            tokenizer.add_name(func)
+        buffers.append(TokenBuffer.scan(tokenizer))
+    return buffers
+
+
+def parse_all(buffers):
+    return [ASTParser(buffer).computation() for buffer in buffers]
+
+
+def lower_all(buffers, trees) -> int:
+    with quiet():
+        for buffer, tree in zip(buffers, trees):
+            Lowering(buffer).computation(tree)
+    return len(trees)
+
+
+def compile_all(sources) -> int:
+    with quiet():
+        for name, code in sources.items():
+            SmplCompiler.from_source(code, name=name).computation()
+    return len(sources)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time scanning, parsing to "
+                                     "an AST and lowering to SSA separately")
+    parser.add_argument("-s", dest="scale", type=int, default=20,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    sources = scaled_corpus(args.scale)
+
+    scan, buffers = best_of(lambda: scan_all(sources), args.repeat)
+    parse, trees = best_of(lambda: parse_all(buffers), args.repeat)
+    dump, data = best_of(lambda: [AST.dumps(t) for t in trees], args.repeat)
+    load, _ = best_of(lambda: [AST.loads(d) for d in data], args.repeat)
+    lower, cnt = best_of(lambda: lower_all(buffers, trees), args.repeat)
+    direct, _ = best_of(lambda: compile_all(sources), args.repeat)
+
+    size = sum(len(d) for d in data)
+    print(f"{'scan':>16}: {scan:.3f}s")
+    print(f"{'parse to AST':>16}: {parse:.3f}s")
+    print(f"{'AST dumps':>16}: {dump:.3f}s ({size} bytes)")
+    print(f"{'AST loads':>16}: {load:.3f}s")
+    print(f"{'lower to SSA':>16}: {lower:.3f}s")
+    print(f"{'total':>16}: {scan + parse + lower:.3f}s for {cnt} programs")
+    print(f"{'SmplCompiler':>16}: {direct:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#! /bin/env python3
+
+import argparse
+import random
+
+from common import scaled_corpus, best_of
+from Tokenizer import SliceTokenizer, SourceMap
+from TokenBuffer import TokenBuffer
+
+
+def keystrokes(code: str, cnt: int, seed: int = 0):
+    # Edits as typed in an editor: one char inserted or deleted at a time
+    rnd = random.Random(seed)
+    edits = []
+    size = len(code)
+    for _ in range(cnt):
+        offset = rnd.randrange(size)
+        if rnd.random() < 0.5:
+            edits.append((offset, 0, rnd.choice("ab1 ;\n")))
+            size += 1
+        else:
+            edits.append((offset, 1, ""))
+            size -= 1
+    return edits
+
+
+def full(source: SourceMap, edits) -> int:
+    cnt = 0
+    for offset, removed, inserted in edits:
+        code = source.code
+        source = SourceMap(source.file, code[:offset] + inserted +
+                           code[offset + removed:])
+        cnt += len(TokenBuffer.scan(SliceTokenizer.resume(source, 0, [])))
+    return cnt
+
+
+def incremental(buffer: TokenBuffer, edits) -> int:
+    cnt = 0
+    for edit in edits:
+        buffer = buffer.relex(*edit)
+        cnt += buffer.relexed[1] - buffer.relexed[0]
+    return cnt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Relexing after edits")
+    parser.add_argument("-s", dest="scale", type=int, default=50,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-e", dest="edits", type=int, default=100,
+                        help="number of edits per example")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    total_full = total_incremental = 0.0
+    for name, code in scaled_corpus(args.scale).items():
+        source = SourceMap(name, code)
+        buffer = TokenBuffer.scan(SliceTokenizer.resume(source, 0, []))
+        edits = keystrokes(code, args.edits)
+
+        elapsed_full, scanned_full = best_of(lambda: full(source, edits),
+                                             args.repeat)
+        elapsed, scanned = best_of(lambda: incremental(buffer, edits),
+                                   args.repeat)
+        total_full += elapsed_full
+        total_incremental += elapsed
+        print(f"{name:>16}: {scanned_full / args.edits:,.0f} vs "
+              f"{scanned / args.edits:,.1f} tokens scanned per edit, "
+              f"{elapsed_full / elapsed:.1f}x")
+
+    print(f"{'total':>16}: {total_full:.3f}s vs {total_incremental:.3f}s, "
+          f"{total_full / total_incremental:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#! /bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from common import ROOT, scaled_corpus, write_sources, best_of
+from Client import Client
+from Server import CompileServer
+
+# What a cold run of the compiler costs: the interpreter, the imports and one
+# compilation with the outputs of smpl.py
+ONE_FILE = "import sys; sys.path.insert(0, sys.argv[1]); import Batch; " \
+    "Batch.compile_file(sys.argv[2], sys.argv[2], trace='text', dot=True)"
+
+
+def cold(paths) -> int:
+    for path in paths:
+        subprocess.run([sys.executable, "-c", ONE_FILE, ROOT, path],
+                       stdout=subprocess.DEVNULL, check=True)
+    return len(paths)
+
+
+def thin_client(paths, sock: str, cwd: str) -> int:
+    for path in paths:
+        subprocess.run([sys.executable, os.path.join(ROOT, "smplc.py"),
+                        "-i", path, "-s", sock, "--no-render"], cwd=cwd,
+                       stdout=subprocess.DEVNULL, check=True)
+    return len(paths)
+
+
+def in_process(paths, sock: str) -> int:
+    with Client(sock) as client:
+        for path in paths:
+            with open(path) as f:
+                client.compile(f.read(), path, trace="text", dot=True)
+    return len(paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per file latency of a cold "
+                                     "compiler and of the compile server")
+    parser.add_argument("-s", dest="scale", type=int, default=1,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_sources(scaled_corpus(args.scale), tmp)
+        sock = os.path.join(tmp, "smpl.sock")
+
+        with CompileServer(sock, jobs=1) as server:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                for name, run in [
+                        ("cold", lambda: cold(paths)),
+                        ("smplc.py", lambda: thin_client(paths, sock, tmp)),
+                        ("Client", lambda: in_process(paths, sock))]:
+                    elapsed, cnt = best_of(run, args.repeat)
+                    print(f"{name:>10}: {cnt} files in {elapsed:.3f}s "
+                          f"({elapsed / cnt * 1000:.1f}ms per file)")
+            finally:
+                server.shutdown()
+                thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#! /bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from common import ROOT, CODE_EXAMPLE_DIR
+
+# Start-up of smpl.py in the modes that need no graph. Each run is made with
+# -X importtime, and the modules imported at the top level are listed by
+# their cumulative import time. Imports that only a graph or the worker
+# processes need are reported as regressions.
+
+MODES = {
+    "check": ["--check"],
+    "dump-ir": ["--dump-ir", "--no-trace"],
+    "no-vis": ["--no-vis"],
+}
+
+FORBIDDEN = ["graphviz", "IRVis", "multiprocessing", "ParallelCompiler", "Batch"]
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    # {module: cumulative us} of all modules, and of the top level ones
+    modules = {}
+    top = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+        if not name.startswith("  "):
+            top[name.strip()] = int(cumulative)
+    return modules, top
+
+
+def run(args: List[str], cwd: str) -> Tuple[float, str]:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime",
+                           os.path.join(ROOT, "smpl.py")] + args, cwd=cwd,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          text=True, check=True)
+    return time.perf_counter() - start, proc.stderr
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Start-up time and imports "
+                                     "of smpl.py")
+    parser.add_argument("-i", dest="src", type=str,
+                        default=os.path.join(CODE_EXAMPLE_DIR, "array.smpl"),
+                        help="source file to compile")
+    parser.add_argument("-r", dest="repeat", type=int, default=5,
+                        help="number of runs, the best one is reported")
+    parser.add_argument("-n", dest="top", type=int, default=8,
+                        help="number of top level imports to list")
+    parser.add_argument("--max-ms", dest="max_ms", type=float,
+                        help="fail if the imports of a mode take longer")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, mode_args in MODES.items():
+            runs = [run(mode_args + ["-i", args.src], tmp)
+                    for _ in range(args.repeat)]
+            elapsed, stderr = min(runs)
+            modules, top = parse_importtime(stderr)
+            total = sum(top.values()) / 1000
+            print(f"{mode}: {elapsed * 1000:.1f}ms, imports {total:.1f}ms")
+            for name, cumulative in sorted(top.items(), key=lambda x: -x[1]
+                                           )[:args.top]:
+                print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+            unexpected = [name for name in FORBIDDEN if name in modules]
+            if unexpected:
+                print(f"  regression: imports {', '.join(unexpected)}")
+                failed = True
+            if args.max_ms is not None and total > args.max_ms:
+                print(f"  regression: imports take more than {args.max_ms}ms")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#! /bin/env python3
+
+import argparse
+import os
+import tempfile
+
+from common import scaled_corpus, write_sources, best_of
+from Function import PREDEFINED_FUNCTIONS
+from Tokenizer import SliceTokenizer, Token
+from TokenBuffer import TokenCache
+
+
+def drain(tokenizer) -> int:
+    cnt = 0
+    while tokenizer.getNext().type not in [Token.EOF, Token.ERROR]:
+        cnt += 1
+    return cnt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Token cache hit vs relexing")
+    parser.add_argument("-s", dest="scale", type=int, default=200,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_sources(scaled_corpus(args.scale), tmp)
+        cache_dir = os.path.join(tmp, "cache")
+        names = list(PREDEFINED_FUNCTIONS)
+
+        lex, cnt = best_of(
+            lambda: sum(drain(SliceTokenizer(p, use_mmap=True))
+                        for p in paths), args.repeat)
+
+        # The first pass fills the cache
+        cache = TokenCache(cache_dir, names=names)
+        for path in paths:
+            cache.tokenizer(path)
+        print(cache.report())
+
+        def load():
+            cache = TokenCache(cache_dir, names=names)
+            return [cache.tokenizer(path) for path in paths]
+        hit, _ = best_of(load, args.repeat)
+        replay, _ = best_of(lambda: sum(drain(t) for t in load()),
+                            args.repeat)
+
+        print(f"{'lex':>16}: {cnt} tokens in {lex:.3f}s")
+        print(f"{'cache load':>16}: {hit:.3f}s, {lex / hit:.2f}x")
+        print(f"{'load + replay':>16}: {replay:.3f}s, {lex / replay:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#! /bin/env python3
+
+import argparse
+import tempfile
+
+from common import scaled_corpus, write_sources, best_of
+from Tokenizer import Tokenizer, SliceTokenizer, Token
+
+
+def lex(tokenizer_cls, paths) -> int:
+    cnt = 0
+    for path in paths:
+        tokenizer = tokenizer_cls(path)
+        while tokenizer.getNext().type not in [Token.EOF, Token.ERROR]:
+            cnt += 1
+    return cnt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tokenizer throughput")
+    parser.add_argument("-s", dest="scale", type=int, default=200,
+                        help="repeat each example's main body this many times")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_sources(scaled_corpus(args.scale), tmp)
+
+        results = {}
+        for tokenizer_cls in [Tokenizer, SliceTokenizer]:
+            elapsed, cnt = best_of(lambda: lex(tokenizer_cls, paths),
+                                   args.repeat)
+            results[tokenizer_cls.__name__] = elapsed
+            print(f"{tokenizer_cls.__name__:>16}: {cnt} tokens in "
+                  f"{elapsed:.3f}s, {cnt / elapsed:,.0f} tokens/s")
+
+        print(f"{'speedup':>16}: "
+              f"{results['Tokenizer'] / results['SliceTokenizer']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import sys
+import os
+import contextlib
+import glob
+import io
+import time
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+CODE_EXAMPLE_DIR = os.path.join(ROOT, "code_example")
+
+
+def quiet():
+    # Warnings of the programs are not of interest in the benchmarks
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def code_examples() -> Dict[str, str]:
+    # {example name: source code}
+    examples = {}
+    for path in sorted(glob.glob(os.path.join(CODE_EXAMPLE_DIR, "*.smpl"))):
+        with open(path) as f:
+            examples[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return examples
+
+
+def scale_program(code: str, scale: int) -> str:
+    # Repeat the statSequence of the main function scale times. The result is
+    # still a valid program with the same declarations.
+    # The main body is the block closed by the last "}"
+    body_end = code.rindex("}")
+    depth = 0
+    for body_start in range(body_end - 1, -1, -1):
+        if code[body_start] == "}":
+            depth += 1
+        elif code[body_start] == "{":
+            if depth == 0:
+                break
+            depth -= 1
+    body_start += 1
+
+    body = code[body_start:body_end].rstrip().rstrip(";")
+    return code[:body_start] + ";".join([body] * scale) + "\n" + \
+        code[body_end:]
+
+
+def scaled_corpus(scale: int) -> Dict[str, str]:
+    return {name: scale_program(code, scale)
+            for name, code in code_examples().items()}
+
+
+def write_sources(sources: Dict[str, str], directory: str) -> List[str]:
+    paths = []
+    for name, code in sources.items():
+        path = os.path.join(directory, name + ".smpl")
+        with open(path, "w") as f:
+            f.write(code)
+        paths.append(path)
+    return paths
+
+
+def best_of(func: Callable[[], object], repeat: int = 3) -> Tuple[float, object]:
+    # Return the best wall time of repeat runs and the result of the last run
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def function_program(func_cnt: int, loops: int = 1) -> str:
+    # A program of func_cnt functions with local arrays, loops and branches,
+    # each calling the one before, and a main calling them all. Each function
+    # has its loop loops times.
+    funcs = []
+    for i in range(func_cnt):
+        call = f"call f{i - 1}(x, i)" if i else "x"
+        loop = f"""    while i < x do
+        let a[i][1] <- s + i;
+        if a[i][1] > {i} then
+            let s <- s + {call}
+        else
+            let s <- s - a[i - 1][1] * 2
+        fi;
+        let i <- i + 1
+    od;
+"""
+        funcs.append(f"""function f{i}(x, y);
+var i, s;
+array[4][2] a;
+{{
+    let i <- 0;
+    let s <- y * {i + 1};
+{loop * loops}    return s + a[0][1]
+}};
+""")
+    calls = ";\n".join(f"    call OutputNum(call f{i}(a, {i}))"
+                       for i in range(func_cnt))
+    return "main\nvar a;\n" + "".join(funcs) + \
+        "{\n    let a <- call InputNum();\n" + calls + "\n}.\n"
@@ -1,36 +1,188 @@
 #! /bin/env python3
 
-from SmplCompiler import SmplCompiler, SmplCDebug
-from IRVis import IRVis
+from SmplCompiler import SmplCompiler, SmplCDebug, TraceWriter, \
+    JsonTraceWriter
+from TokenBuffer import TokenCache
+from Client import DEFAULT_SOCKET
+from Function import PREDEFINED_FUNCTIONS
 
 import argparse
 import os
+import sys
 
 
 def getArgs():
     parser = argparse.ArgumentParser(description="SMPL compiler")
-    parser.add_argument("-i", dest="src", type=str,
-                        required=True, help="source file")
+    parser.add_argument("-i", dest="src", type=str, nargs="+",
+                        help="source file, - for stdin, or "
+                        "several files and directories to compile as a batch")
     parser.add_argument("-d", dest="debug", type=str,
                         help="debug output from the tokenizer")
     parser.add_argument("-v", action="store_true",
                         dest="verbose", default=False, help="verbose mode")
-    return parser.parse_args()
+    parser.add_argument("--mmap", action="store_true", dest="use_mmap",
+                        default=False,
+                        help="memory-map the source instead of reading it")
+    parser.add_argument("--no-trace", action="store_false", dest="trace",
+                        default=True,
+                        help="do not trace the parse, and skip the debug "
+                        "output")
+    parser.add_argument("--no-vis", action="store_false", dest="vis",
+                        default=True,
+                        help="do not write or render the graph of the IR")
+    parser.add_argument("--dump-ir", action="store_true", dest="dump_ir",
+                        default=False,
+                        help="print the IR as text instead of the graph")
+    parser.add_argument("-O", dest="passes", type=str, nargs="+",
+                        choices=["sccp", "dce"], default=[],
+                        help="optimization passes to run on the IR, in "
+                        "order")
+    parser.add_argument("--check", action="store_true", dest="check",
+                        default=False,
+                        help="only report the errors and warnings, as "
+                        "--no-trace --no-vis")
+    parser.add_argument("--trace-format", dest="trace_format", type=str,
+                        choices=["text", "json", "tree"], default="text",
+                        help="write the debug output as it is parsed, as text "
+                        "or JSON lines, or build the whole tree first")
+    parser.add_argument("--token-cache", dest="token_cache", type=str,
+                        help="directory of cached token streams")
+    parser.add_argument("--ir-cache", dest="ir_cache", type=str,
+                        help="directory of cached IR. The parse is not traced, "
+                        "as with --no-trace.")
+    parser.add_argument("--incremental", action="store_true",
+                        dest="incremental", default=False,
+                        help="with --ir-cache, lower only the functions that "
+                        "changed")
+    parser.add_argument("-j", dest="jobs", type=int,
+                        help="compile the functions in this many processes, "
+                        "without the debug output. For a batch, the files.")
+    parser.add_argument("-o", dest="out", type=str,
+                        help="directory of the IR dumps and diagnostics of a "
+                        "batch")
+    parser.add_argument("--serve", dest="serve", type=str, nargs="?",
+                        const=DEFAULT_SOCKET,
+                        help="run a compile server on this socket for "
+                        f"smplc.py, {DEFAULT_SOCKET} by default. -j limits "
+                        "the files compiled at the same time.")
+    parser.add_argument("--timeout", dest="timeout", type=float,
+                        help="seconds a request to the server may take")
+    args = parser.parse_args()
+    if not args.src and not args.serve:
+        parser.error("the following arguments are required: -i")
+    if args.incremental and not args.ir_cache:
+        parser.error("--incremental needs --ir-cache")
+    if args.check:
+        args.trace = args.vis = False
+    if args.ir_cache:
+        # The trace is made while parsing, which a hit skips
+        args.trace = False
+    if args.dump_ir:
+        args.vis = False
+    return args
+
+
+def getDebug(args) -> SmplCDebug:
+    debug_file = args.debug if args.debug else "debug.txt"
+    if args.trace_format == "tree":
+        return SmplCDebug(file=debug_file)
+
+    # Streamed, without keeping the tree
+    writer_cls = JsonTraceWriter if args.trace_format == "json" \
+        else TraceWriter
+    return SmplCDebug(writer=writer_cls.open(debug_file), tree=False)
+
+
+def getFileCompiler(args, debug: SmplCDebug) -> SmplCompiler:
+    # Replay the tokens if the same source was compiled before
+    tokenizer = None
+    if args.token_cache:
+        cache = TokenCache(args.token_cache, names=list(PREDEFINED_FUNCTIONS))
+        tokenizer = cache.tokenizer(args.src)
+        if args.verbose:
+            print(cache.report(), file=sys.stderr)
+
+    return SmplCompiler(args.src, debug=debug, use_mmap=args.use_mmap,
+                        tokenizer=tokenizer)
 
 
 def main() -> None:
     # Get args
     args = getArgs()
-    debug = args.debug if args.debug else "debug.txt"
 
-    # Run compiler
-    smplCompiler = SmplCompiler(args.src, debug=SmplCDebug(file=debug))
-    smplCompiler.computation()
-    smplCompiler.debug.dump()
+    # Modules that are not needed for every run are imported where they are
+    # used, to keep the start-up short
+    if args.serve:
+        import Server
+        Server.serve(args.serve, jobs=args.jobs, request_timeout=args.timeout)
+        return
+
+    # Many files in one process, without the debug output and graphs
+    if len(args.src) > 1 or os.path.isdir(args.src[0]):
+        import Batch
+        failed = Batch.run(args.src, jobs=args.jobs, out_dir=args.out,
+                           use_mmap=args.use_mmap, verbose=args.verbose)
+        sys.exit(1 if failed else 0)
+    args.src = args.src[0]
+    debug = getDebug(args) if args.trace and not args.jobs else None
+
+    # Read from a pipe without a temporary file
+    if args.src == "-":
+        source = sys.stdin.buffer.read()
+        src_name = "stdin"
+    else:
+        source = None
+        src_name = os.path.splitext(os.path.basename(args.src))[0]
+
+    if args.ir_cache:
+        from IRCache import IRCache
+        cache = IRCache(args.ir_cache)
+        smplCompiler = cache.compile(src_name if source else args.src,
+                                     source=source, jobs=args.jobs,
+                                     incremental=args.incremental)
+        if args.verbose:
+            print(cache.report(), file=sys.stderr)
+        if args.incremental:
+            from IncrementalCompiler import IncrementalCompiler
+            if isinstance(smplCompiler, IncrementalCompiler):
+                print(smplCompiler.report(), file=sys.stderr)
+    elif args.jobs:
+        from ParallelCompiler import ParallelCompiler
+        smplCompiler = ParallelCompiler.from_file(
+            src_name if source else args.src, jobs=args.jobs,
+            use_mmap=args.use_mmap, source=source)
+        smplCompiler.compile()
+    else:
+        if source:
+            smplCompiler = SmplCompiler.from_source(source, name=src_name,
+                                                    debug=debug)
+        else:
+            smplCompiler = getFileCompiler(args, debug)
+        try:
+            smplCompiler.computation()
+        finally:
+            if debug:
+                debug.dump()
+                if debug.writer:
+                    debug.writer.close()
+
+    for name in args.passes:
+        before = smplCompiler.inst_counts()
+        removed = getattr(smplCompiler, name)()
+        if args.verbose:
+            print(f"{name}: {removed} instructions removed", file=sys.stderr)
+            for (func, count), (_, after) in zip(
+                    before, smplCompiler.inst_counts()):
+                print(f"  {func}: {count} -> {after}", file=sys.stderr)
+
+    if args.dump_ir:
+        print(smplCompiler.dump(), end="")
+    if not args.vis:
+        return
 
     # Visualiation of blocks
-    vis_file = os.path.join(
-        "graph", os.path.splitext(os.path.basename(args.src))[0] + ".dot")
+    from IRVis import IRVis
+    vis_file = os.path.join("graph", src_name + ".dot")
     vis = IRVis(filename=vis_file, debug=args.verbose)
     smplCompiler.vis(vis)
     vis.render()
@@ -0,0 +1,86 @@
+#! /bin/env python3
+
+# Compile through a running compile server (smpl.py --serve), with the
+# arguments and outputs of smpl.py: the debug output, the warnings and the
+# graph of the IR. Only the standard library is loaded here.
+
+from Client import Client, DEFAULT_SOCKET
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="SMPL compiler client")
+    parser.add_argument("-i", dest="src", type=str,
+                        required=True, help="source file, - for stdin")
+    parser.add_argument("-d", dest="debug", type=str,
+                        help="debug output from the tokenizer")
+    parser.add_argument("-v", action="store_true",
+                        dest="verbose", default=False, help="verbose mode")
+    parser.add_argument("--mmap", action="store_true", dest="use_mmap",
+                        default=False, help="accepted for smpl.py, the "
+                        "source is sent to the server")
+    parser.add_argument("--no-trace", action="store_false", dest="trace",
+                        default=True,
+                        help="do not trace the parse, and skip the debug "
+                        "output")
+    parser.add_argument("--trace-format", dest="trace_format", type=str,
+                        choices=["text", "json", "tree"], default="text",
+                        help="format of the debug output")
+    parser.add_argument("-s", dest="socket", type=str, default=DEFAULT_SOCKET,
+                        help="socket of the compile server")
+    parser.add_argument("--timeout", dest="timeout", type=float,
+                        help="seconds to wait for the compilation")
+    parser.add_argument("--no-render", action="store_false", dest="render",
+                        default=True, help="write the graph without "
+                        "rendering it")
+    return parser.parse_args()
+
+
+def render(dot_file: str) -> None:
+    # What graphviz does for IRVis.render()
+    try:
+        subprocess.run(["dot", "-Kdot", "-Tpdf", "-O", dot_file], check=True)
+    except FileNotFoundError:
+        sys.exit("failed to execute 'dot', make sure the Graphviz "
+                 "executables are on your systems' PATH")
+
+
+def main() -> None:
+    args = getArgs()
+
+    if args.src == "-":
+        source = sys.stdin.buffer.read()
+        name = src_name = "stdin"
+    else:
+        with open(args.src, "rb") as f:
+            source = f.read()
+        name = args.src
+        src_name = os.path.splitext(os.path.basename(args.src))[0]
+
+    with Client(args.socket) as client:
+        reply = client.compile(
+            source, name, trace=args.trace_format if args.trace else None,
+            dot=True, verbose=args.verbose, timeout=args.timeout)
+
+    if reply["trace"] is not None:
+        with open(args.debug if args.debug else "debug.txt", "w") as f:
+            f.write(reply["trace"])
+    print(reply["diagnostics"], end="")
+    if not reply["ok"]:
+        sys.exit(1)
+
+    # Visualiation of blocks
+    vis_file = os.path.join("graph", src_name + ".dot")
+    os.makedirs("graph", exist_ok=True)
+    with open(vis_file, "w") as f:
+        f.write(reply["dot"])
+    if args.render:
+        render(vis_file)
+
+
+if __name__ == "__main__":
+    main()
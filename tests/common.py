@@ -0,0 +1,251 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import contextlib
+import io
+import random
+import unittest
+from typing import Dict, List, Optional
+from SmplCompiler import SmplCompiler
+import SSA
+from Block import BasicBlock, BranchBB, JoinBB, SuperBlock
+from Function import FuncType
+
+
+ROOT = os.path.dirname(os.path.realpath(__file__)) + "/.."
+
+
+def quiet():
+    # Warnings of the programs are not of interest in the tests
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def compile_program(code: str) -> SmplCompiler:
+    with quiet():
+        smplCompiler = SmplCompiler.from_source(code)
+        smplCompiler.computation()
+    return smplCompiler
+
+
+def insts(smplCompiler: SmplCompiler) -> List[SSA.Inst]:
+    # The instructions in the IR, not removed by a pass
+    return [inst for inst in smplCompiler.ctx.all_ssa
+            if isinstance(inst, SSA.Inst) and inst.bb is not None]
+
+
+def check_users(test: unittest.TestCase, smplCompiler: SmplCompiler) -> None:
+    # The instructions left use no removed or unreachable instruction, and are
+    # the users of what they use
+    uses = {}
+    for inst in insts(smplCompiler):
+        operands = inst.call_args if isinstance(inst, SSA.CallInst) \
+            else [inst.x, inst.y]
+        for operand in operands:
+            if isinstance(operand, SSA.Inst):
+                test.assertIsNotNone(operand.original.bb)
+                test.assertFalse(operand.original.bb.unreachable)
+            if isinstance(operand, SSA.SSAValue):
+                uses.setdefault(id(operand.original), []).append(inst.id)
+    for inst in insts(smplCompiler):
+        test.assertEqual(sorted(user.id for user in inst.get_users()),
+                         sorted(uses.get(id(inst), [])))
+
+
+def check_output(test: unittest.TestCase, code: str, passes: List[str],
+                 inputs: List[int]) -> None:
+    # The program writes the same after the passes, e.g. ["sccp", "dce"], as
+    # before
+    expected = IRInterpreter(compile_program(code), inputs).run()
+    smplCompiler = compile_program(code)
+    for name in passes:
+        getattr(smplCompiler, name)()
+    test.assertEqual(IRInterpreter(smplCompiler, inputs).run(), expected,
+                     code)
+
+
+def random_program(rng: random.Random, size: int = 12) -> str:
+    # A program of scalars a to d and an array x, with ifs, loops that count
+    # up to small bounds, copies, reads and writes. Indices stay in bounds.
+    scalars = "abcd"
+
+    def expression(depth: int) -> str:
+        choice = rng.randrange(6 if depth else 3)
+        if choice == 0:
+            num = rng.randrange(-3, 6)
+            return str(num) if num >= 0 else f"(0 - {-num})"
+        if choice == 1:
+            return rng.choice(scalars)
+        if choice == 2:
+            return f"x[{rng.randrange(4)}]"
+        if choice == 3:
+            return "call InputNum()"
+        op = rng.choice("+-*/")
+        # Dividing by 0 does what it does, and dead code may not do it
+        right = str(rng.randrange(1, 5)) if op == "/" else \
+            expression(depth - 1)
+        return f"({expression(depth - 1)} {op} {right})"
+
+    def statements(count: int, loops: int) -> List[str]:
+        stats = []
+        for _ in range(count):
+            choice = rng.randrange(7)
+            if choice < 2:
+                stats.append(f"let {rng.choice(scalars)} <- {expression(2)}")
+            elif choice == 2:
+                stats.append(f"let x[{rng.randrange(4)}] <- {expression(2)}")
+            elif choice == 3:
+                stats.append(f"call OutputNum({expression(2)})")
+            elif choice == 4:
+                body = "; ".join(statements(rng.randrange(1, 4), loops))
+                rel = f"{expression(1)} {rng.choice(['<', '>', '==', '!='])}" \
+                    f" {expression(1)}"
+                if rng.randrange(2):
+                    other = "; ".join(statements(rng.randrange(1, 3), loops))
+                    stats.append(f"if {rel} then {body} else {other} fi")
+                else:
+                    stats.append(f"if {rel} then {body} fi")
+            elif loops:
+                # Counters of their own, only counted up by the loop
+                i = f"i{loops}"
+                body = statements(rng.randrange(1, 4), loops - 1)
+                body.append(f"let x[{i}] <- {expression(1)}"
+                            if rng.randrange(2) else "call OutputNewLine()")
+                stats.append(f"let {i} <- 0; while {i} < "
+                             f"{rng.randrange(1, 4)} do "
+                             f"{'; '.join(body)}; let {i} <- {i} + 1 od")
+            else:
+                stats.append(f"let {rng.choice(scalars)} <- "
+                             f"{rng.choice(scalars)}")
+        return stats
+
+    return "main var a, b, c, d, i1, i2; array[4] x; {\n    " + \
+        ";\n    ".join(statements(size, 2)) + "\n}.\n"
+
+
+class IRInterpreter:
+    # Runs the IR of a compilation as printed, without the common
+    # subexpressions, to compare what a program computes before and after a
+    # pass. Reads the numbers of inputs in turn, and returns what it writes,
+    # with "error" for a division by zero or a program that runs too long.
+    #
+    # A block goes on to its next block, or from a BranchBB whose branch is
+    # not taken to its branch block, the else body. Phis take their first
+    # operand coming from the joining block. Each call has its own frame of
+    # memory, which starts as 0s.
+
+    FRAME = 1 << 20  # Addresses of one frame
+
+    def __init__(self, smplCompiler: SmplCompiler, inputs: List[int],
+                 steps: int = 100000):
+        self.main = smplCompiler.computationBlock
+        self.funcs: Dict[str, SuperBlock] = {
+            _type.func_name: _type.superBlock
+            for _type in smplCompiler.mainFuncCtx.identType.values()
+            if isinstance(_type, FuncType)}
+        self.inputs = list(inputs)
+        self.steps = steps
+        self.memory: Dict[int, int] = {}
+        self.frames = 0
+        self.output = []
+
+    def run(self) -> List[object]:
+        try:
+            self.call(self.main, [])
+        except (ZeroDivisionError, RecursionError, TimeoutError):
+            self.output.append("error")
+        return self.output
+
+    @staticmethod
+    def target(operand: SSA.BaseSSA) -> BasicBlock:
+        if isinstance(operand, SSA.NextBlockFirstSSA):
+            return operand.block.next_bb()
+        block = operand.block
+        return block.get_firstbb() if isinstance(block, SuperBlock) \
+            else block
+
+    def call(self, superBlock: SuperBlock, args: List[int]) -> Optional[int]:
+        self.frames += 1
+        frame = self.frames * self.FRAME
+        values: Dict[int, int] = {}
+
+        def value(operand: SSA.BaseSSA) -> int:
+            if isinstance(operand, SSA.Const):
+                return operand.num
+            if isinstance(operand, SSA.FramePointer):
+                return frame
+            return values[operand.get_id()]
+
+        pred, bb = None, superBlock.get_firstbb()
+        while bb is not None:
+            insts = [inst for inst in bb.get_insts()
+                     if isinstance(inst, SSA.Inst)]
+            if isinstance(bb, JoinBB):
+                first = pred is bb.last_bb_join()
+                assert first or pred is bb.prev_bb(), \
+                    f"{bb} entered from {pred}"
+                values.update({phi.id: value(phi.x if first else phi.y)
+                               for phi in insts if phi.op == SSA.OP.PHI})
+            next = bb.next_bb_branch() if isinstance(bb, BranchBB) and \
+                bb.branchBlock is not None else bb.next_bb()
+            for inst in insts:
+                self.steps -= 1
+                if self.steps < 0:
+                    raise TimeoutError
+                op = inst.op
+                if op in (SSA.OP.PHI, SSA.OP.NOP):
+                    continue
+                if op == SSA.OP.BRA:
+                    next = self.target(inst.x)
+                    break
+                if op in SSA.OP.BRANCH_OP:
+                    cond = value(inst.x)
+                    if {SSA.OP.BEQ: cond == 0, SSA.OP.BNE: cond != 0,
+                            SSA.OP.BLT: cond < 0, SSA.OP.BLE: cond <= 0,
+                            SSA.OP.BGT: cond > 0, SSA.OP.BGE: cond >= 0}[op]:
+                        next = self.target(inst.y)
+                        break
+                    continue
+                if op == SSA.OP.RET:
+                    return value(inst.x) if inst.x is not None else None
+                if op == SSA.OP.END:
+                    return None
+                values[inst.id] = self.execute(inst, value, args)
+            pred, bb = bb, next
+        return None
+
+    def execute(self, inst: SSA.Inst, value, args: List[int]) -> int:
+        op = inst.op
+        if op == SSA.OP.CALL:
+            return self.call(self.funcs[inst.func_name],
+                             [value(arg) for arg in inst.call_args])
+        if op == SSA.OP.ARG:
+            return args[inst.x.num]
+        if op == SSA.OP.READ:
+            return self.inputs.pop(0) if self.inputs else 0
+        if op == SSA.OP.WRITE:
+            self.output.append(value(inst.x))
+            return None
+        if op == SSA.OP.WRITENL:
+            self.output.append("\n")
+            return None
+        if op == SSA.OP.LOAD:
+            return self.memory.get(value(inst.x), 0)
+        if op == SSA.OP.STORE:
+            self.memory[value(inst.y)] = value(inst.x)
+            return None
+        x, y = value(inst.x), value(inst.y)
+        if op in (SSA.OP.ADD, SSA.OP.ADDA):
+            return x + y
+        if op == SSA.OP.SUB:
+            return x - y
+        if op == SSA.OP.MUL:
+            return x * y
+        if op == SSA.OP.DIV:
+            if y == 0:
+                raise ZeroDivisionError
+            return abs(x) // abs(y) * (1 if (x < 0) == (y < 0) else -1)
+        if op == SSA.OP.CMP:
+            return (x > y) - (x < y)
+        raise AssertionError(f"Cannot run {inst}")
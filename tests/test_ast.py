@@ -0,0 +1,146 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import contextlib
+import io
+import marshal
+from typing import List
+from Tokenizer import Token
+from SmplCompiler import SmplCompiler
+from ASTParser import ASTParser
+from Lowering import Lowering
+import AST
+
+
+CODE = """
+main
+var a, b;
+array[4] c;
+function add(x, y);
+{
+    return x + y
+};
+void function show(x);
+var i;
+{
+    let i <- 0;
+    while i < x do
+        call OutputNum(i);
+        let i <- i + 1
+    od
+};
+{
+    let a <- call InputNum();
+    let b <- call add(a, 2 * (a - 1));
+    let c[a] <- b;
+    if a > b then
+        let a <- c[a] / 2
+    else
+        call show(a)
+    fi;
+    call OutputNum(a)
+}.
+"""
+
+
+class TestAST(unittest.TestCase):
+    def test_tree(self):
+        tree = ASTParser.from_file("test.smpl", source=CODE).computation()
+
+        self.assertIsInstance(tree, AST.Computation)
+        self.assertEqual(len(tree.decls), 2)
+        self.assertIsNone(tree.decls[0].dims)
+        self.assertEqual(tree.decls[1].dims, [4])
+        self.assertEqual([f.is_void for f in tree.funcs], [False, True])
+        self.assertEqual(len(tree.funcs[1].params), 1)
+
+        # Left associative, "*" binds tighter
+        call = tree.body[1].value
+        self.assertIsInstance(call, AST.Call)
+        self.assertEqual(call.args[1].op, Token.TIMES)
+        self.assertIsInstance(call.args[1].right, AST.BinOp)
+
+        if_node = tree.body[3]
+        self.assertIsInstance(if_node, AST.If)
+        self.assertIsInstance(if_node.cond, AST.Relation)
+        self.assertIsInstance(if_node.orelse[0], AST.Call)
+
+    def test_serialize(self):
+        tree = ASTParser.from_file("test.smpl", source=CODE).computation()
+        data = AST.dumps(tree)
+        self.assertEqual(AST.loads(data), tree)
+
+        with self.assertRaises(ValueError):
+            AST.loads(marshal.dumps((AST.VERSION + 1, AST.encode(tree))))
+
+    def test_lowering(self):
+        def inst_cnts(block) -> List[int]:
+            return sorted(len(bb.get_insts()) for bb in block.get_bbs())
+
+        # Warnings of uninitialized variables are printed the same way
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            smplCompiler = SmplCompiler.from_source(CODE, name="test.smpl")
+            smplCompiler.computation()
+        expected = out.getvalue()
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            parser = ASTParser.from_file("test.smpl", source=CODE)
+            tree = AST.loads(AST.dumps(parser.computation()))
+            lowering = Lowering(parser.buffer)
+            block = lowering.computation(tree)
+        self.assertEqual(out.getvalue(), expected)
+
+        self.assertEqual(inst_cnts(block),
+                         inst_cnts(smplCompiler.computationBlock))
+        for name in ["add", "show"]:
+            funcs = [lowering.funcCtx.identType,
+                     smplCompiler.funcCtx.identType]
+            ids = [lowering.names.index(name),
+                   smplCompiler.tokenizer.string2id(name)]
+            self.assertEqual(*(inst_cnts(f[id].superBlock)
+                               for f, id in zip(funcs, ids)))
+
+    def test_deep(self):
+        # Nesting is not limited by the Python stack, in the parser, the
+        # serialized tree or the lowering
+        code = "main\nvar a;\narray[4] c;\nfunction f(x, y);\n" \
+            "{ return x - y };\n{\n    let a <- call InputNum();\n" \
+            "    call OutputNum(a)\n}.\n"
+        depth = 3000
+        for nested in ["(" * depth + "a" + ")" * depth,
+                       "c[" * depth + "a" + "][0]" * depth,
+                       "call f(" * depth + "a" + ", 1)" * depth,
+                       "a - (" * depth + "a" + " * 2)" * depth]:
+            source = code.replace("call OutputNum(a)",
+                                  f"call OutputNum({nested})")
+            parser = ASTParser.from_file("test.smpl", source=source)
+            data = AST.dumps(parser.computation())
+            # Trees this deep are compared by their serialized form
+            self.assertEqual(AST.dumps(AST.loads(data)), data)
+
+            # The same instructions are made. They are compared by op, as
+            # printing them looks for common subexpressions, which is slow
+            # on chains this long.
+            lowering = Lowering(parser.buffer)
+            lowering.computation(AST.loads(data))
+            smplCompiler = SmplCompiler.from_source(source, name="test.smpl")
+            smplCompiler.computation()
+            self.assertEqual(
+                [getattr(inst, "op", None) for inst in lowering.ctx.all_ssa],
+                [getattr(inst, "op", None)
+                 for inst in smplCompiler.ctx.all_ssa])
+
+    def test_error(self):
+        code = CODE.replace("let c[a] <- b", "let c[a] <- ")
+        with self.assertRaises(Exception) as cm:
+            ASTParser.from_file("test.smpl", source=code).computation()
+        self.assertIn("test.smpl:21:17", str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
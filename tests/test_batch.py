@@ -0,0 +1,98 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import io
+import mmap
+import tempfile
+from unittest import mock
+from SmplCompiler import SmplCompiler
+import Batch
+
+
+GOOD = "main\nvar a;\n{\n    let a <- call InputNum();\n" \
+    "    call OutputNum(a + 1)\n}.\n"
+WARNING = "main\nvar a, b;\n{\n    let a <- b + 1;\n    call OutputNum(a)\n}.\n"
+BAD = "main\nvar a;\n{\n    let a <- \n}.\n"
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        os.makedirs(os.path.join(self.dir, "src", "sub"))
+        self.files = {}
+        for name, code in [("src/good.smpl", GOOD),
+                           ("src/sub/warning.smpl", WARNING),
+                           ("src/sub/bad.smpl", BAD),
+                           ("src/notes.txt", "")]:
+            path = os.path.join(self.dir, name)
+            with open(path, "w") as f:
+                f.write(code)
+            self.files[name] = path
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find_sources(self):
+        sources = Batch.find_sources([os.path.join(self.dir, "src"),
+                                      self.files["src/good.smpl"]])
+        self.assertEqual([name for _, name in sources],
+                         ["good.smpl", "sub/bad.smpl", "sub/warning.smpl",
+                          "good.smpl"])
+
+    def test_compile_batch(self):
+        sources = Batch.find_sources([os.path.join(self.dir, "src")])
+        for jobs in [1, 2]:
+            results = list(Batch.compile_batch(sources, jobs=jobs))
+            self.assertEqual([r.ok for r in results], [True, False, True])
+
+            good, bad, warning = results
+            smplCompiler = SmplCompiler.from_source(GOOD)
+            smplCompiler.computation()
+            self.assertEqual(good.ir, smplCompiler.dump())
+            self.assertEqual(good.diagnostics, "")
+            self.assertIsNone(bad.ir)
+            self.assertIn("bad.smpl", bad.diagnostics)
+            self.assertIn("WARNING", warning.diagnostics)
+
+    def test_mmap_released(self):
+        # The mapping of each file is closed when its result is made
+        mappings = []
+
+        class Mapping(mmap.mmap):
+            def __new__(cls, *args, **kargs):
+                mappings.append(super().__new__(cls, *args, **kargs))
+                return mappings[-1]
+
+        with mock.patch("mmap.mmap", Mapping):
+            for name in ["src/good.smpl", "src/sub/bad.smpl"]:
+                Batch.compile_file(self.files[name], name, use_mmap=True)
+        self.assertEqual(len(mappings), 2)
+        self.assertTrue(all(mapping.closed for mapping in mappings))
+
+    def test_run(self):
+        out_dir = os.path.join(self.dir, "out")
+        log = io.StringIO()
+        failed = Batch.run([os.path.join(self.dir, "src"),
+                            os.path.join(self.dir, "missing.smpl")],
+                           jobs=2, out_dir=out_dir, log=log)
+        self.assertEqual(failed, 2)
+
+        lines = log.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("ok     "))
+        self.assertIn("FAILED", lines[1])
+        self.assertIn("4 files, 2 failed", lines[-1])
+        self.assertIn("files/s", lines[-1])
+
+        self.assertTrue(os.path.exists(os.path.join(out_dir, "good.ir")))
+        self.assertTrue(os.path.exists(os.path.join(out_dir, "sub",
+                                                    "warning.log")))
+        self.assertFalse(os.path.exists(os.path.join(out_dir, "sub",
+                                                     "bad.ir")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import gc
+import threading
+import weakref
+from typing import List
+from CompilationContext import CompilationContext
+from SmplCompiler import SmplCompiler
+from Tokenizer import SliceTokenizer
+from Function import PREDEFINED_FUNCTIONS
+from Block import BasicBlock, SimpleBB
+import SSA
+
+
+CODE = "main\nvar a;\narray[2] b;\n{\n    let a <- call InputNum();\n" \
+    "    let b[a] <- a;\n    if a > 0 then let a <- b[0] fi;\n" \
+    "    call OutputNum(a + 1)\n}.\n"
+
+
+def insts(smplCompiler: SmplCompiler) -> List[str]:
+    return [str(inst) for bb in sorted(smplCompiler.computationBlock.get_bbs(),
+                                       key=lambda bb: bb.bbid)
+            for inst in bb.get_insts(cse=False)]
+
+
+class TestCompilationContext(unittest.TestCase):
+    def test_numbering(self):
+        ctx = CompilationContext()
+        cnt = SSA.BaseSSA.CNT
+        with ctx:
+            self.assertIs(CompilationContext.current(), ctx)
+            bb = SimpleBB()
+            const = SSA.Const(1)
+            with CompilationContext():
+                self.assertEqual(SSA.Const(2).id, 0)
+            inst = SSA.Inst(SSA.OP.ADD, const, const)
+            self.assertIs(SSA.BaseSSA.get_inst(1), inst)
+            self.assertIs(SSA.FramePointer(), SSA.FramePointer())
+        self.assertIsNone(CompilationContext.current())
+
+        self.assertEqual((bb.bbid, const.id, inst.id), (0, 0, 1))
+        self.assertEqual(ctx.all_bb, [bb])
+        self.assertEqual(ctx.ssa_cnt, 3)
+        # The globals are untouched
+        self.assertEqual(SSA.BaseSSA.CNT, cnt)
+
+    def test_repeated(self):
+        # Every compilation is numbered from 0
+        first = SmplCompiler.from_source(CODE)
+        first.computation()
+        second = SmplCompiler.from_source(CODE)
+        second.computation()
+        self.assertEqual(insts(first), insts(second))
+        self.assertEqual(first.ctx.all_ssa[0].id, 0)
+        self.assertIsNot(first.ctx.frame_pointer, second.ctx.frame_pointer)
+
+    def test_threads(self):
+        expected = SmplCompiler.from_source(CODE)
+        expected.computation()
+
+        results = []
+
+        def compile():
+            smplCompiler = SmplCompiler.from_source(CODE)
+            smplCompiler.computation()
+            results.append(insts(smplCompiler))
+
+        threads = [threading.Thread(target=compile) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [insts(expected)] * 4)
+
+    def test_predefined(self):
+        # The ids of the predefined functions are kept per compilation. Here
+        # they differ, and the compilations are interleaved.
+        tokenizer = SliceTokenizer("test.smpl", source=CODE)
+        for name in ["x", "y"]:
+            tokenizer.add_name(name)
+        shifted = SmplCompiler("test.smpl", tokenizer=tokenizer)
+        smplCompiler = SmplCompiler.from_source(CODE)
+        self.assertEqual(sorted(shifted.predefined), [2, 3, 4])
+        self.assertEqual(sorted(smplCompiler.predefined), [0, 1, 2])
+
+        shifted.computation()
+        smplCompiler.computation()
+        self.assertEqual(insts(shifted), insts(smplCompiler))
+        self.assertEqual(PREDEFINED_FUNCTIONS["OutputNum"], (SSA.OP.WRITE, 1))
+
+    def test_release(self):
+        smplCompiler = SmplCompiler.from_source(CODE)
+        smplCompiler.computation()
+        ref = weakref.ref(smplCompiler.ctx.all_bb[0])
+        bb_cnt = len(BasicBlock.ALL_BB)
+
+        del smplCompiler
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(len(BasicBlock.ALL_BB), bb_cnt)
+
+
+if __name__ == '__main__':
+    unittest.main()
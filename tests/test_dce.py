@@ -0,0 +1,123 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import glob
+import random
+from tests.common import ROOT, compile_program, insts, check_users, \
+    check_output, random_program
+import SSA
+
+
+CODE = """
+main
+var a, b, c, i;
+array[4] arr;
+{
+    let a <- call InputNum();
+    let b <- a * 4;
+    let c <- arr[2];
+    if a > 10 then
+        let b <- b - 1;
+        let c <- a + 1
+    fi;
+    let i <- 0;
+    while i < a do
+        let arr[1] <- i;
+        let c <- c * 2;
+        let i <- i + 1
+    od;
+    call OutputNum(i)
+}.
+"""
+
+
+class TestDCE(unittest.TestCase):
+    def test_dce(self):
+        smplCompiler = compile_program(CODE)
+        before = sum(count for _, count in smplCompiler.inst_counts())
+        removed = smplCompiler.dce()
+        check_users(self, smplCompiler)
+        self.assertGreater(removed, 0)
+        self.assertEqual(sum(count for _, count in smplCompiler.inst_counts()),
+                         before - removed)
+
+        # b and c are never read: their arithmetic, the load of arr[2] and
+        # the phis of the if and the loop go. The loop counter stays, and so
+        # does the store in the loop.
+        ops = [inst.op for inst in insts(smplCompiler)]
+        self.assertNotIn(SSA.OP.MUL, ops)
+        self.assertNotIn(SSA.OP.SUB, ops)
+        self.assertNotIn(SSA.OP.LOAD, ops)
+        self.assertEqual(ops.count(SSA.OP.PHI), 1)
+        self.assertEqual(ops.count(SSA.OP.STORE), 1)
+        for op in (SSA.OP.READ, SSA.OP.WRITE, SSA.OP.END, SSA.OP.BGT,
+                   SSA.OP.BLT, SSA.OP.BRA):
+            self.assertIn(op, ops)
+
+        # Nothing left to do. Dumping adds instructions to empty blocks, so
+        # the dumps are of the second one.
+        smplCompiler.dump()
+        dump = smplCompiler.dump()
+        self.assertEqual(smplCompiler.dce(), 0)
+        self.assertEqual(smplCompiler.dump(), dump)
+
+    def test_func(self):
+        # Per function: the unused value goes, the return stays
+        smplCompiler = compile_program("""
+main
+function f(x, y); var z; {
+    let z <- x * y;
+    return x + 1
+};
+{
+    call OutputNum(call f(1, 2))
+}.
+""")
+        counts = dict(smplCompiler.inst_counts())
+        smplCompiler.dce()
+        check_users(self, smplCompiler)
+        after = dict(smplCompiler.inst_counts())
+        self.assertEqual(after.keys(), counts.keys())
+        func = next(name for name in counts if name != "main")
+        self.assertLess(after[func], counts[func])
+        ops = [inst.op for inst in insts(smplCompiler)]
+        self.assertNotIn(SSA.OP.MUL, ops)
+        self.assertIn(SSA.OP.RET, ops)
+        self.assertIn(SSA.OP.CALL, ops)
+
+    def test_examples(self):
+        for file in sorted(glob.glob(ROOT + "/code_example/*.smpl")):
+            for passes in (["dce"], ["sccp", "dce"]):
+                with open(file) as f:
+                    smplCompiler = compile_program(f.read())
+                for name in passes:
+                    getattr(smplCompiler, name)()
+                check_users(self, smplCompiler)
+                smplCompiler.dump()
+                dump = smplCompiler.dump()
+                self.assertEqual(smplCompiler.dce(), 0)
+                self.assertEqual(smplCompiler.dump(), dump)
+
+    def test_output(self):
+        # What the examples and random programs write, for some inputs
+        for file in sorted(glob.glob(ROOT + "/code_example/*.smpl")):
+            with open(file) as f:
+                code = f.read()
+            for inputs in ([], [3, -2, 5, 7, 1, 4], [0, 9, 0, 2, -6, 1]):
+                check_output(self, code, ["dce"], inputs)
+                check_output(self, code, ["sccp", "dce"], inputs)
+        for inputs in ([4], [12]):
+            check_output(self, CODE, ["dce"], inputs)
+        rng = random.Random(25)
+        for _ in range(60):
+            code = random_program(rng)
+            inputs = [rng.randrange(-5, 10) for _ in range(20)]
+            check_output(self, code, ["dce"], inputs)
+            check_output(self, code, ["sccp", "dce"], inputs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import glob
+from tests.common import ROOT, compile_program
+from SmplCompiler import SmplCompiler
+from Block import BranchBB, JoinBB
+
+
+CODE = """
+main
+var a, b;
+function f(x); {
+    while x > 0 do
+        let x <- x - 1
+    od;
+    return x
+};
+{
+    let a <- call InputNum();
+    if a > 0 then
+        let b <- 1
+    else
+        let b <- 2
+    fi;
+    while b < a do
+        if b > 3 then
+            let b <- b + 2
+        fi;
+        let b <- b + 1
+    od;
+    call OutputNum(call f(b))
+}.
+"""
+
+
+class TestDominance(unittest.TestCase):
+    def reachable(self, dominance, without=None) -> set:
+        if dominance.entry is without:
+            return set()
+        seen = {dominance.entry}
+        stack = [dominance.entry]
+        while stack:
+            for succ in dominance.succs[stack.pop()]:
+                if succ is not without and succ not in seen:
+                    seen.add(succ)
+                    stack.append(succ)
+        return seen
+
+    def check(self, smplCompiler: SmplCompiler) -> None:
+        # Against the definitions: a dominates b if b is not reachable without
+        # a, and the frontier of a is where its dominance ends
+        for _, superBlock in smplCompiler.func_blocks():
+            dominance = smplCompiler.dominance(superBlock)
+            bbs = superBlock.get_bbs()
+            reachable = self.reachable(dominance)
+            self.assertEqual(set(dominance.rpo), reachable)
+
+            for a in bbs:
+                for b in dominance.succs[a]:
+                    self.assertIn(a, dominance.preds[b])
+                for b in dominance.preds[a]:
+                    self.assertIn(a, dominance.succs[b])
+
+            dominated = {a: reachable - self.reachable(dominance, a)
+                         for a in reachable}
+            for a in reachable:
+                for b in reachable:
+                    self.assertEqual(dominance.dominates(a, b),
+                                     b in dominated[a])
+                frontier = {b for b in reachable
+                            if any(p in dominated[a]
+                                   for p in dominance.preds[b])
+                            and (b is a or b not in dominated[a])}
+                self.assertEqual(dominance.frontiers[a], frontier)
+
+                # The blocks common subexpressions are looked up in, which
+                # GVN scopes its table by, are the dominator tree
+                if a is not dominance.entry:
+                    self.assertIs(a.get_prev_cs_bb(), dominance.get_idom(a))
+
+    def test_dominance(self):
+        smplCompiler = compile_program(CODE)
+        self.check(smplCompiler)
+
+        main = smplCompiler.computationBlock
+        dominance = smplCompiler.dominance(main)
+        self.assertIs(smplCompiler.dominance(main), dominance)
+        self.assertIsNone(dominance.get_idom(dominance.entry))
+        self.assertEqual(dominance.tree_preorder()[0], dominance.entry)
+
+        joins = sorted((bb for bb in main.get_bbs() if isinstance(bb, JoinBB)),
+                       key=lambda bb: bb.bbid)
+        ifJoin, whileJoin, innerJoin = joins
+        # The if statement joins the else body and the if body, in the order
+        # of the phi operands
+        self.assertEqual(dominance.preds[ifJoin],
+                         [ifJoin.last_bb_join(), ifJoin.prev_bb()])
+        self.assertIsInstance(dominance.get_idom(ifJoin), BranchBB)
+        for pred in dominance.preds[ifJoin]:
+            self.assertEqual(dominance.frontiers[pred], {ifJoin})
+
+        # The loop header joins the end of the body and the block before
+        body = whileJoin.last_bb_join()
+        self.assertEqual(dominance.preds[whileJoin], [body, ifJoin])
+        self.assertTrue(dominance.dominates(whileJoin, body))
+        self.assertIn(whileJoin, dominance.frontiers[body])
+        self.assertIn(whileJoin, dominance.frontiers[whileJoin])
+        self.assertIn(whileJoin, dominance.frontiers[innerJoin])
+
+        smplCompiler.invalidate_dominance()
+        self.assertIsNot(smplCompiler.dominance(main), dominance)
+
+    def test_func_blocks(self):
+        # Main and its functions, whichever context is current
+        smplCompiler = compile_program(CODE)
+        blocks = [superBlock for _, superBlock in smplCompiler.func_blocks()]
+        self.assertEqual(len(blocks), 2)
+        smplCompiler.funcCtx = smplCompiler.func_contexts()[1][1]
+        self.assertEqual(
+            [superBlock for _, superBlock in smplCompiler.func_blocks()],
+            blocks)
+        self.assertEqual(
+            [superBlock for superBlock, _ in smplCompiler.func_contexts()],
+            blocks)
+
+    def test_examples(self):
+        for file in sorted(glob.glob(ROOT + "/code_example/*.smpl")):
+            with open(file) as f:
+                self.check(compile_program(f.read()))
+
+    def test_nesting(self):
+        # Not recursive
+        depth = 1500
+        smplCompiler = compile_program(
+            "main var a; {\n    let a <- call InputNum();\n" +
+            "    if a > 0 then let a <- a - 1 else\n" * depth +
+            "    let a <- a - 2" + " fi" * depth + "\n}.\n")
+        dominance = smplCompiler.dominance(smplCompiler.computationBlock)
+        self.assertEqual(len(dominance.rpo),
+                         len(smplCompiler.computationBlock.get_bbs()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,11 +4,32 @@ import os
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
 
 import unittest
-from Tokenizer import FileReader
+from Tokenizer import FileReader, SliceTokenizer, Token
+from SmplCompiler import SmplCompiler
 import io
 import tempfile
 
 
+def positions(reader: FileReader):
+    ret = []
+    sym = reader.getNext()
+    while sym != FileReader.EOF:
+        if sym not in [" ", "\t", "\n"]:
+            ret.append((sym, reader.debug_info()))
+        sym = reader.getNext()
+    ret.append((sym, reader.debug_info()))
+    return ret
+
+
+def tokens(tokenizer: SliceTokenizer):
+    ret = []
+    token = tokenizer.getNext()
+    while token.type != Token.EOF:
+        ret.append((token.sym, token.line, token.col))
+        token = tokenizer.getNext()
+    return ret
+
+
 class TestFileReader(unittest.TestCase):
     def test_filereader(self):
         code = "i - 5"
@@ -57,3 +78,53 @@ class TestFileReader(unittest.TestCase):
         self.assertEqual(reader.idx, 5)
 
         sys.stderr = sys.__stderr__
+
+    def test_filereader_mmap(self):
+        # Tabs are only expanded when a column is reported. The positions must
+        # be the same as reading the expanded file.
+        code = "main\n\tvar a;\n\t{ let\ta <- 1 }.\n"
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(code)
+            reader = FileReader(tmp.name)
+            mmapReader = FileReader(tmp.name, use_mmap=True)
+        self.assertEqual(bytes(mmapReader.code), code.encode())
+
+        self.assertEqual(positions(mmapReader), positions(reader))
+        self.assertEqual(mmapReader.debug_info(), (tmp.name, 3, 22))
+
+    def test_cr(self):
+        # Lines may end with "\r\n" or a lone "\r", which are read as "\n"
+        # in text mode. The positions must be the same in both modes.
+        code = b"main\rvar a;\r\t{ let a <- 1;\r\n  let a <- a * 2 }.\r"
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "wb") as f:
+                f.write(code)
+            self.assertEqual(positions(FileReader(tmp.name, use_mmap=True)),
+                             positions(FileReader(tmp.name)))
+            expected = tokens(SliceTokenizer(tmp.name))
+            tokenizer = SliceTokenizer(tmp.name, use_mmap=True)
+            self.assertEqual(tokens(tokenizer), expected)
+            # And the lines quoted in diagnostics
+            self.assertEqual(tokenizer.source.line_cnt(), 5)
+            self.assertEqual(tokenizer.source.line_text(2), "var a;\n")
+            tokenizer.close()
+        self.assertEqual(expected[-3:], [("2", 4, 16), ("}", 4, 18),
+                                         (".", 4, 19)])
+
+    def test_close_mmap(self):
+        # The mapping is released when the tokenizer or compiler is done with
+        # the file, not when it is collected
+        code = "main\nvar a;\n{\n    let a <- 1;\n    call OutputNum(a)\n}.\n"
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(code)
+            with SliceTokenizer(tmp.name, use_mmap=True) as tokenizer:
+                while tokenizer.getNext().type != Token.EOF:
+                    pass
+                self.assertFalse(tokenizer.source.code.closed)
+            self.assertTrue(tokenizer.source.code.closed)
+
+            with SmplCompiler(tmp.name, use_mmap=True) as smplCompiler:
+                smplCompiler.computation()
+            self.assertTrue(smplCompiler.tokenizer.source.code.closed)
@@ -0,0 +1,118 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import glob
+from tests.common import ROOT, compile_program
+import SSA
+
+
+CODE = """
+main
+var a, b, x;
+array[4] c;
+{
+    let a <- call InputNum();
+    let b <- a * 2 + 1;
+    let x <- c[a];
+    let c[b] <- a * 2 + 1;
+    if a > b then
+        let x <- c[a] + (2 * a + 1);
+        let c[a] <- x
+    else
+        let b <- c[b] + x
+    fi;
+    while b < a * 2 + 1 do
+        let b <- b + 1;
+        let x <- c[a] + x;
+        let c[b] <- c[a];
+        let c[b] <- c[a]
+    od;
+    call OutputNum(c[a] + x * (a * 2 + 1) + b)
+}.
+"""
+
+
+class TestGVN(unittest.TestCase):
+    def check_walk(self, code: str) -> None:
+        # The same common subexpressions as walking back the instructions of
+        # each op one by one. Dumping adds instructions to empty blocks, so
+        # the dumps are of two compilations.
+        dump = compile_program(code).dump()
+        smplCompiler = compile_program(code)
+        insts = [inst for inst in smplCompiler.ctx.all_ssa
+                 if isinstance(inst, SSA.Inst)]
+        numbered = [inst.get_cs() for inst in insts]
+        for inst in insts:
+            inst._get_cs_flag = False
+            inst.vn = None
+        with smplCompiler.ctx:
+            self.assertEqual([inst.get_cs() for inst in insts], numbered)
+        self.assertEqual(smplCompiler.dump(), dump)
+
+    def test_walk(self):
+        smplCompiler = compile_program(CODE)
+        self.assertIn(SSA.OP.MUL, [inst.op for inst in
+                                   smplCompiler.ctx.all_ssa
+                                   if isinstance(inst, SSA.Inst) and
+                                   inst.get_cs() is not None])
+        self.check_walk(CODE)
+
+        for file in sorted(glob.glob(ROOT + "/code_example/*.smpl")):
+            with open(file) as f:
+                self.check_walk(f.read())
+
+    def test_copies(self):
+        # Value tables keep copies of the instructions, which find the common
+        # subexpression of the instruction
+        smplCompiler = compile_program(CODE)
+        constBlock = smplCompiler.funcCtx.constBlock
+        values = [smplCompiler.computationBlock.get_lastbb()
+                  .lookup_value_table(id) for id in
+                  constBlock.get_value_table().get_ids()]
+        for value in values:
+            if isinstance(value, SSA.Inst):
+                inst = smplCompiler.ctx.all_ssa[value.id]
+                self.assertIsNot(value, inst)
+                self.assertEqual(value.get_id(), inst.get_id())
+
+    def test_killed_loads(self):
+        # A load after a store to the array, in either branch of an if or in
+        # between, is not the load before it, also when read into a variable
+        for stmt in ("if a > 0 then let x[1] <- a else let a <- 1 fi",
+                     "if a > 0 then let a <- 1 else let x[1] <- a fi",
+                     "let x[1] <- a"):
+            for output in ("call OutputNum(x[1])",
+                           "let b <- x[1]; call OutputNum(b)"):
+                code = "main var a, b; array[2] x; {\n" \
+                    "    let a <- call InputNum();\n" \
+                    "    let b <- x[1];\n" \
+                    f"    {stmt};\n    {output}\n}}.\n"
+                smplCompiler = compile_program(code)
+                insts = [inst for inst in smplCompiler.ctx.all_ssa
+                         if isinstance(inst, SSA.Inst)]
+                loads = [inst for inst in insts if inst.op == SSA.OP.LOAD]
+                write = next(inst for inst in insts
+                             if inst.op == SSA.OP.WRITE)
+                self.assertIsNone(loads[1].get_cs())
+                self.assertEqual(write.x.get_id(), loads[1].id)
+                self.check_walk(code)
+
+    def test_long_block(self):
+        # Linear in the size of the block
+        size = 20000
+        smplCompiler = compile_program(
+            "main var a, b; {\n    let a <- call InputNum();\n" +
+            "    let b <- a * 2 + b;\n" * size +
+            "    call OutputNum(b)\n}.\n")
+        insts = [inst for inst in smplCompiler.ctx.all_ssa
+                 if isinstance(inst, SSA.Inst) and inst.op == SSA.OP.MUL]
+        self.assertEqual(len(insts), size)
+        self.assertEqual(set(inst.get_id() for inst in insts),
+                         {insts[0].id})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import contextlib
+import io
+import tempfile
+from typing import List
+from SmplCompiler import SmplCompiler
+from IncrementalCompiler import IncrementalCompiler
+from IRCache import IRCache
+
+
+CODE = """
+main
+var a, b;
+array[2] c;
+function add(x, y);
+array[3] d;
+{
+    let d[x] <- y;
+    return x + d[1]
+};
+void function show(x);
+var i;
+{
+    while i < x do
+        call OutputNum(call add(i, x));
+        let i <- i + 1
+    od
+};
+function twice(x);
+{
+    if x > 0 then
+        call show(x)
+    fi;
+    return call add(x, 2)
+};
+{
+    let a <- call InputNum();
+    let c[a] <- call twice(a);
+    call show(c[0] + b)
+}.
+"""
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = IRCache(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check(self, code: str, rebuilt: List[str],
+              jobs: int = 1) -> IncrementalCompiler:
+        # Same IR and warnings as in one pass
+        expected = io.StringIO()
+        with contextlib.redirect_stdout(expected):
+            compiler = SmplCompiler.from_source(code, name="test.smpl")
+            compiler.computation()
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            incremental = IncrementalCompiler.from_file(
+                "test.smpl", self.cache, jobs=jobs, source=code)
+            incremental.compile()
+        self.assertEqual(out.getvalue(), expected.getvalue())
+        self.assertEqual(incremental.dump(), compiler.dump())
+        self.assertEqual(incremental.rebuilt, rebuilt)
+        self.assertEqual(incremental.reused,
+                         [f for f in ["add", "show", "twice"]
+                          if f not in rebuilt])
+        return incremental
+
+    def test_rebuild(self):
+        self.check(CODE, ["add", "show", "twice"], jobs=2)
+        self.check(CODE, [])
+
+        # Only the body that changed
+        code = CODE.replace("return call add(x, 2)", "return call add(x, 3)")
+        self.check(code, ["twice"])
+
+        # An array moves the frame pointer offset of the functions after it
+        code = code.replace("array[3] d;", "array[4] d;")
+        self.check(code, ["add", "show", "twice"], jobs=2)
+
+        # The signature of a function called
+        code = code.replace("void function show(x);", "function show(x);") \
+            .replace("    od\n};", "    od;\n    return 0\n};")
+        self.check(code, ["show", "twice"])
+
+        # The warnings of show would point at the old lines
+        incremental = self.check("\n" + code, ["show"])
+        self.assertTrue(incremental.report().startswith(
+            "Rebuilt 1 of 3 functions: show. Reused 2"))
+
+    def test_deep(self):
+        # Nesting is not limited by the Python stack, when the function is
+        # lowered or when its IR is taken from the cache
+        depth = 3000
+        nested = "call add(" * depth + "x" + ", 1)" * depth
+        code = CODE.replace("return call add(x, 2)", f"return {nested}")
+        self.check(code, ["add", "show", "twice"], jobs=2)
+        self.check(code, [])
+
+    def test_errors(self):
+        self.check(CODE, ["add", "show", "twice"])
+        code = CODE.replace("return x + d[1]", "return x + z")
+        with self.assertRaises(Exception) as cm:
+            self.check(code, [])
+        self.assertIn("test.smpl(9:16)", str(cm.exception))
+
+        # Functions with errors are not cached
+        self.check(code.replace("x + z", "x + d[2]"), ["add"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import contextlib
+import io
+import tempfile
+import time
+from SmplCompiler import SmplCompiler
+from IRCache import IRCache, CachedIR
+from IRVis import IRVis
+
+
+WARNING = "main\nvar a, b;\nfunction f(x); { return x * 2 };\n" \
+    "{\n    let a <- call f(b + 1);\n    call OutputNum(a)\n}.\n"
+BAD = "main\nvar a;\n{\n    let a <- \n}.\n"
+
+
+class TestIRCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compile(self, cache: IRCache, source: str, name: str = "test.smpl"):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ir = cache.compile(name, source=source)
+        return ir, out.getvalue()
+
+    def test_hit(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            expected = SmplCompiler.from_source(WARNING, name="test.smpl")
+            expected.computation()
+        vis = IRVis()
+        expected.vis(vis)
+
+        cache = IRCache(self.dir)
+        ir, diagnostics = self.compile(cache, WARNING)
+        self.assertNotIsInstance(ir, CachedIR)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        # A new cache object, as in the next run
+        cache = IRCache(self.dir)
+        ir, diagnostics = self.compile(cache, WARNING)
+        self.assertIsInstance(ir, CachedIR)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual(diagnostics, out.getvalue())
+        self.assertIn("WARNING", diagnostics)
+        self.assertEqual(ir.dump(), expected.dump())
+        cached_vis = IRVis()
+        ir.vis(cached_vis)
+        self.assertEqual(cached_vis.source(), vis.source())
+        self.assertEqual(ir.id2string(expected.tokenizer.string2id("x")), "x")
+
+    def test_key(self):
+        cache = IRCache(self.dir)
+        self.compile(cache, WARNING)
+        self.compile(cache, WARNING + "\n")
+        self.compile(IRCache(self.dir, options={"opt": 1}), WARNING)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache.entries()), 3)
+
+        # Errors are not cached
+        with self.assertRaises(Exception):
+            self.compile(cache, BAD)
+        self.assertEqual(len(cache.entries()), 3)
+
+    def test_broken(self):
+        cache = IRCache(self.dir)
+        self.compile(cache, WARNING)
+        with open(cache.entries()[0].path, "r+b") as f:
+            f.write(b"broken")
+
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            ir, _ = self.compile(cache, WARNING)
+        self.assertIn("Ignore broken IR cache", err.getvalue())
+        self.assertNotIsInstance(ir, CachedIR)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_evict(self):
+        cache = IRCache(self.dir)
+        sources = [WARNING + "\n" * i for i in range(4)]
+        for source in sources:
+            self.compile(cache, source)
+            time.sleep(0.01)
+        size = cache.entries()[0].stat().st_size
+
+        # The first one is used again, the second one is evicted first
+        self.compile(cache, sources[0])
+        cache.max_size = size * 3
+        cache.evict()
+        self.assertEqual(cache.evictions, 1)
+        self.compile(cache, sources[0])
+        self.compile(cache, sources[1])
+        self.assertEqual((cache.hits, cache.misses), (2, 5))
+
+        # The new entry is always kept
+        cache.max_size = 0
+        self.compile(cache, sources[2])
+        self.assertEqual(len(cache.entries()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import contextlib
+import io
+from typing import List
+from SmplCompiler import SmplCompiler
+from ParallelCompiler import ParallelCompiler
+from Function import FuncType
+from Block import SimpleBB
+import SSA
+import IRSerial
+
+
+CODE = """
+main
+var a, b;
+array[2] c;
+function add(x, y);
+array[3] d;
+{
+    let d[x] <- y;
+    return x + d[1]
+};
+void function show(x);
+var i;
+{
+    while i < x do
+        call OutputNum(call add(i, x));
+        let i <- i + 1
+    od
+};
+function twice(x);
+array[2][2] e;
+{
+    let e[1][x] <- x;
+    if x > 0 then
+        call show(x)
+    fi;
+    return call add(x, e[0][0])
+};
+{
+    let a <- call InputNum();
+    let c[a] <- call twice(a);
+    call show(c[0] + b)
+}.
+"""
+
+
+def dump(compiler) -> str:
+    # Instructions of main and of the functions, and what was printed
+    blocks = [compiler.computationBlock] + \
+        [t.superBlock for t in compiler.funcCtx.identType.values()
+         if isinstance(t, FuncType)]
+    return "\n".join(str(inst) for block in blocks
+                     for bb in sorted(block.get_bbs(), key=lambda bb: bb.bbid)
+                     for inst in bb.get_insts(cse=False))
+
+
+def compile(code: str, jobs: int = 0) -> List[str]:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        if jobs:
+            compiler = ParallelCompiler.from_file("test.smpl", jobs=jobs,
+                                                  source=code)
+            compiler.compile()
+        else:
+            compiler = SmplCompiler.from_source(code, name="test.smpl")
+            compiler.computation()
+    return [out.getvalue(), dump(compiler)]
+
+
+class TestParallel(unittest.TestCase):
+    def test_same_ir(self):
+        # Numbered and printed as in one pass, uninitialized variable
+        # warnings included
+        expected = compile(CODE)
+        self.assertIn("WARNING", expected[0])
+        self.assertEqual(compile(CODE, jobs=2), expected)
+        self.assertEqual(compile(CODE, jobs=1), expected)
+
+    def test_users(self):
+        # Uses of the frame pointer by the functions lowered in the workers
+        # are kept by the one of main
+        with contextlib.redirect_stdout(io.StringIO()):
+            compiler = ParallelCompiler.from_file("test.smpl", jobs=2,
+                                                  source=CODE)
+            compiler.compile()
+        fp = compiler.ctx.frame_pointer
+        uses = [inst for inst in compiler.ctx.all_ssa
+                if isinstance(inst, SSA.Inst) and
+                not isinstance(inst, SSA.CallInst) and
+                (inst.x is fp or inst.y is fp)]
+        funcBBs = set().union(*(superBlock.get_bbs() for _, superBlock
+                                in compiler.func_blocks()[1:]))
+        self.assertTrue(any(inst.bb in funcBBs for inst in uses))
+        self.assertEqual(sorted(map(id, fp.get_users())),
+                         sorted(map(id, uses)))
+
+    def test_errors(self):
+        # The first error in the source is reported
+        code = CODE.replace("return x + d[1]", "return x + z") \
+            .replace("let e[1][x] <- x", "let e[1][x] <- ")
+        with self.assertRaises(Exception) as cm:
+            compile(code, jobs=2)
+        self.assertIn("test.smpl(9:16)", str(cm.exception))
+
+        code = CODE.replace("call show(c[0] + b)", "call show(c[0] + )") \
+            .replace("let e[1][x] <- x", "let e[1][x] <- ")
+        with self.assertRaises(Exception) as cm:
+            compile(code, jobs=2)
+        self.assertIn("test.smpl:22:", str(cm.exception))
+
+        # A function calling one declared after it
+        code = CODE.replace("call OutputNum(call add(i, x))",
+                            "call OutputNum(call twice(i))")
+        with self.assertRaises(Exception) as cm:
+            compile(code, jobs=2)
+        self.assertIn("undefined function", str(cm.exception))
+
+    def test_deep(self):
+        # Nesting is not limited by the Python stack. The calls are parsed
+        # and lowered in a worker.
+        depth = 3000
+        nested = "call add(" * depth + "x" + ", 1)" * depth
+        code = CODE.replace("return call add(x, e[0][0])",
+                            f"return {nested}")
+        self.assertEqual(compile(code, jobs=2), compile(code))
+
+    def test_serial(self):
+        bb = SimpleBB()
+        const = SSA.Const(3)
+        inst = SSA.Inst(SSA.OP.ADD, const, const)
+        bb.add_inst(const)
+        bb.add_inst(inst)
+        bb.killStores.add(inst)
+        bb.set_prev(bb)
+
+        data = IRSerial.dumps(bb, lambda obj: "ctx" if obj is bb.ctx else None)
+
+        def renumber(objects):
+            for obj in objects:
+                if isinstance(obj, SSA.BaseSSA):
+                    obj.id += 100
+
+        loaded = IRSerial.loads(data, lambda key: bb.ctx, renumber)
+        self.assertIs(loaded.prev, loaded)
+        self.assertIs(loaded.ctx, bb.ctx)
+        self.assertEqual([i.id for i in loaded.insts],
+                         [const.id + 100, inst.id + 100])
+        self.assertIs(loaded.insts[1].op, SSA.OP.ADD)
+        self.assertIs(loaded.insts[1].x, loaded.insts[0])
+        # Sets are filled with the new ids
+        self.assertEqual(loaded.killStores, {loaded.insts[1]})
+        self.assertIn(loaded.insts[1], loaded.killStores)
+
+
+if __name__ == '__main__':
+    unittest.main()
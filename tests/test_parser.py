@@ -6,6 +6,10 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
 import unittest
 from SmplCompiler import *
 import tempfile
+import io
+import json
+from ASTParser import ASTParser
+from Lowering import Lowering
 
 
 class TestParser(unittest.TestCase):
@@ -198,3 +202,179 @@ var in;
             self.check_NT(computation[1], "varDecl")
             self.check_NT(computation[2], "funcDecl")
             self.check_NT(computation[3], "funcDecl")
+
+    def test_from_source(self):
+        code = "main\nvar a;\n{\n\tlet a <- call InputNum();\r\n" \
+            "\tcall OutputNum(a + 1)\n}.\n"
+
+        def parse(source) -> str:
+            debug = SmplCDebug()
+            smplCompiler = SmplCompiler.from_source(source, name="test.smpl",
+                                                    debug=debug)
+            smplCompiler.computation()
+            return debug.toStr(debug.root)
+
+        expected = parse(code)
+        self.assertIn("test.smpl:4:5", expected)
+        self.assertEqual(parse(code.encode()), expected)
+        self.assertEqual(parse(memoryview(code.encode())), expected)
+
+        # Diagnostics are taken from the buffer
+        with self.assertRaises(Exception) as cm:
+            SmplCompiler.from_source(code.replace("let a", "let b")) \
+                .computation()
+        self.assertEqual(str(cm.exception).splitlines()[:3], [
+            "<source>(4:9)", "    let b <- call InputNum();", "        ^"])
+
+    def test_no_trace(self):
+        code = "main\nvar a;\n{\n    let a <- call InputNum();\n" \
+            "    call OutputNum(a + 1)\n}.\n"
+
+        # Without a debug tree, grammar methods are called directly
+        smplCompiler = SmplCompiler.from_source(code)
+        self.assertIs(smplCompiler.expression.__func__,
+                      SmplCompiler.expression.__wrapped__)
+        self.assertIs(smplCompiler.computation.__func__,
+                      SmplCompiler.computation)
+        smplCompiler.computation()
+
+        traced = SmplCompiler.from_source(code, debug=SmplCDebug())
+        self.assertIs(traced.expression.__func__, SmplCompiler.expression)
+        traced.computation()
+
+        def inst_cnts(smplCompiler: SmplCompiler) -> List[int]:
+            return sorted(len(bb.get_insts())
+                          for bb in smplCompiler.computationBlock.get_bbs())
+        self.assertEqual(inst_cnts(smplCompiler), inst_cnts(traced))
+
+    def test_trace_writer(self):
+        code = "main\nvar a;\n{\n    let a <- call InputNum();\n" \
+            "    call OutputNum(a + 1)\n}.\n"
+
+        debug = SmplCDebug()
+        SmplCompiler.from_source(code, debug=debug).computation()
+
+        # Streamed as parsed, in the same format, without the tree
+        out = io.StringIO()
+        streamed = SmplCDebug(writer=TraceWriter(out), tree=False)
+        SmplCompiler.from_source(code, debug=streamed).computation()
+        self.assertEqual(out.getvalue(), debug.toStr(debug.root))
+        self.assertEqual(streamed.root, [])
+
+        out = io.StringIO()
+        streamed = SmplCDebug(writer=JsonTraceWriter(out), tree=False)
+        SmplCompiler.from_source(code, debug=streamed).computation()
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[:3], [
+            {"enter": "computation", "depth": 0},
+            {"token": "MAIN", "sym": "main", "line": 1, "col": 1, "depth": 1},
+            {"enter": "varDecl", "depth": 1}])
+        self.assertEqual(records[-1], {"exit": "computation", "depth": 0})
+
+    def test_expression(self):
+        code = "main\nvar a, b;\narray[3][4] c;\nfunction f(x, y);\n" \
+            "{ return x - y };\n{\n    let a <- call InputNum();\n" \
+            "    let b <- (a + 2) * c[a - 1][(a)] / call f(a, 1 - a * 2) - " \
+            "(((a)) + a / 2 * a - call InputNum) * 3;\n" \
+            "    call OutputNum(b + a)\n}.\n"
+
+        # The same IR as from the tree of the AST parser
+        smplCompiler = SmplCompiler.from_source(code)
+        smplCompiler.computation()
+        parser = ASTParser.from_file("<source>", source=code)
+        lowering = Lowering(parser.buffer)
+        lowering.computation(parser.computation())
+        self.assertEqual(smplCompiler.dump(), lowering.dump())
+
+        # And the same trace as when parsed recursively
+        debug = SmplCDebug()
+        SmplCompiler.from_source(code, debug=debug).computation()
+        trace = [line.strip("| ") for line in
+                 debug.toStr(debug.root).splitlines()]
+        start = trace.index('"/" (DIV) <source>:8:38')
+        self.assertEqual(trace[start:start + 15], [
+            '"/" (DIV) <source>:8:38', "NT:factor", "NT:funcCall",
+            '"call" (CALL) <source>:8:40', '"f" (IDENT) <source>:8:45',
+            '"(" (OPENPAREN) <source>:8:46', "NT:expression", "NT:term",
+            "NT:factor", "NT:designator", '"a" (IDENT) <source>:8:47',
+            '"," (COMMA) <source>:8:48', "NT:expression", "NT:term",
+            "NT:factor"])
+
+        # Nesting is not limited by the Python stack
+        depth = 10000
+        for nested in ["(" * depth + "a" + ")" * depth,
+                       "c[" * depth + "a" + "][0]" * depth,
+                       "call f(" * depth + "a" + ", 1)" * depth]:
+            SmplCompiler.from_source(code.replace(
+                "call OutputNum(b + a)", f"call OutputNum({nested})")) \
+                .computation()
+
+    def test_fold(self):
+        code = "main var a, b; array[3][4] c; {\n" \
+            "    let a <- call InputNum();\n" \
+            "    let b <- c[2][3] + (2 + 3) * 4 - 7 / 2;\n" \
+            "    let b <- (a + 0) * 1 + a * 0 + (a - a) + b / 1;\n" \
+            "    let b <- b / (1 - 1);\n" \
+            "    call OutputNum(b)\n}.\n"
+        smplCompiler = SmplCompiler.from_source(code)
+        smplCompiler.computation()
+        lines = smplCompiler.dump().splitlines()
+
+        # Constants are folded, the offset of c[2][3] too. The identities use
+        # their operand, but division by zero is left to run.
+        insts = dict(line.strip().split(": ", 1) for line in lines
+                     if ": " in line)
+        self.assertEqual(sorted(inst.split()[0] for inst in insts.values()
+                                if inst.split()[0] not in ("const", "FP")), [
+            "add", "add", "add", "adda", "div", "end", "load", "read", "sub",
+            "write"])
+        adda = next(inst for inst in insts.values() if inst.startswith("adda"))
+        self.assertEqual(insts[adda.split()[2].strip("()")], "const #44")
+
+    def test_loop_copies(self):
+        # Variables copied and swapped in loops take the values from before
+        # the iteration
+        code = "main var a, b, c, i; {\n" \
+            "    let a <- call InputNum(); let b <- 3; let i <- 0;\n" \
+            "    while i < 2 do let c <- a; let a <- b; let b <- c;\n" \
+            "        let i <- i + 1 od;\n" \
+            "    call OutputNum(a); call OutputNum(b)\n}.\n"
+        smplCompiler = SmplCompiler.from_source(code)
+        smplCompiler.computation()
+        phis = {inst.identifier: inst for inst in smplCompiler.ctx.all_ssa
+                if isinstance(inst, SSA.Inst) and inst.op == SSA.OP.PHI}
+        a, b, c = (smplCompiler.tokenizer.string2id(name)
+                   for name in "abc")
+        self.assertIs(phis[a].x, phis[b])
+        self.assertIs(phis[b].x, phis[a])
+        self.assertIs(phis[c].x, phis[a])
+
+    def test_nesting(self):
+        code = "main var a; {\n    let a <- call InputNum();\n" \
+            "    while a > 0 do if a > 1 then let a <- a - 1 fi od;\n" \
+            "    call OutputNum(a)\n}.\n"
+
+        # Statements run as generators are traced as when called recursively
+        debug = SmplCDebug()
+        SmplCompiler.from_source(code, debug=debug).computation()
+        trace = [line for line in debug.toStr(debug.root).splitlines()
+                 if "Statement" in line or "statSequence" in line]
+        self.assertEqual(trace, [
+            "| NT:statSequence", "| | | NT:whileStatement",
+            "| | | | NT:statSequence", "| | | | | | NT:ifStatement",
+            "| | | | | | | NT:statSequence"])
+
+        # Nesting is not limited by the Python stack, on either path
+        depth = 1200
+        code = "main var a, b; {\n    let a <- call InputNum();\n    " + \
+            "if a > 0 then let b <- a * 2 else " * depth + "let b <- a" + \
+            " fi" * depth + ";\n    call OutputNum(b)\n}.\n"
+        SmplCompiler.from_source(code).computation()
+        parser = ASTParser.from_file("<source>", source=code)
+        Lowering(parser.buffer).computation(parser.computation())
+
+        # Nor are loops, which update the operands of their bodies
+        code = "main var a; {\n    let a <- call InputNum();\n    " + \
+            "while a > 0 do " * depth + "let a <- a - 1" + " od" * depth + \
+            ";\n    call OutputNum(a)\n}.\n"
+        SmplCompiler.from_source(code).computation()
@@ -0,0 +1,159 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import glob
+import random
+from tests.common import ROOT, compile_program, insts, check_users, \
+    check_output, random_program, IRInterpreter
+from SCCP import SCCP
+import SSA
+
+
+CODE = """
+main
+var a, b, c, i;
+array[4] arr;
+{
+    let a <- 2 + 3;
+    let b <- a * 4 - 7 / 2;
+    if b > 10 then
+        let c <- b - 1
+    else
+        let c <- call InputNum()
+    fi;
+    let i <- 0;
+    while i < 3 do
+        let i <- i + 1;
+        let arr[1] <- c
+    od;
+    if a == 5 then
+        call OutputNum(c)
+    fi;
+    call OutputNum(i)
+}.
+"""
+
+
+class TestSCCP(unittest.TestCase):
+    def test_sccp(self):
+        smplCompiler = compile_program(CODE)
+        before = len(insts(smplCompiler))
+        removed = smplCompiler.sccp()
+        check_users(self, smplCompiler)
+        self.assertEqual(len(insts(smplCompiler)), before - removed)
+
+        # Constants: 5, 20 - 3 and the value of c
+        ops = [inst.op for inst in insts(smplCompiler)]
+        self.assertNotIn(SSA.OP.SUB, ops)
+        self.assertNotIn(SSA.OP.DIV, ops)
+        self.assertNotIn(SSA.OP.READ, ops)
+        self.assertEqual(ops.count(SSA.OP.CMP), 1)  # Of the loop
+        writes = [inst for inst in insts(smplCompiler)
+                  if inst.op == SSA.OP.WRITE]
+        self.assertIsInstance(writes[0].x, SSA.Const)
+        self.assertEqual(writes[0].x.num, 16)
+
+        # The loop counter is not a constant
+        phis = [inst for inst in insts(smplCompiler)
+                if inst.op == SSA.OP.PHI]
+        self.assertEqual(len(phis), 1)
+        self.assertIs(writes[1].x.original, phis[0])
+
+        # The else body is never reached, the branches are not conditional
+        unreachable = [bb for bb in smplCompiler.ctx.all_bb if bb.unreachable]
+        self.assertEqual(len(unreachable), 1)
+        self.assertEqual(unreachable[0].get_insts(cse=False), [])
+        branches = [inst.op for inst in insts(smplCompiler)
+                    if inst.op in SSA.OP.BRANCH_OP]
+        # The loop, its exit and its back edge, and a jump for each if
+        self.assertEqual(branches.count(SSA.OP.BLT), 1)
+        self.assertEqual(branches.count(SSA.OP.BRA), 4)
+        self.assertEqual(len(branches), 5)
+
+        # Nothing left to do. Dumping adds instructions to empty blocks, so
+        # the dumps are of the second one.
+        smplCompiler.dump()
+        dump = smplCompiler.dump()
+        self.assertEqual(smplCompiler.sccp(), 0)
+        self.assertEqual(smplCompiler.dump(), dump)
+
+    def test_fold(self):
+        self.assertEqual(SCCP.fold(SSA.OP.DIV, 7, 2), 3)
+        self.assertEqual(SCCP.fold(SSA.OP.DIV, -7, 2), -3)
+        self.assertEqual(SCCP.fold(SSA.OP.DIV, 7, -2), -3)
+        self.assertEqual(SCCP.fold(SSA.OP.DIV, 7, 0), "bottom")
+        self.assertEqual(SCCP.fold(SSA.OP.CMP, 2, 5), -1)
+        self.assertEqual(SCCP.fold(SSA.OP.CMP, 5, 5), 0)
+
+    def test_loop(self):
+        # Constant along the paths that are taken only
+        smplCompiler = compile_program("""
+main var a, b, i; {
+    let a <- 1;
+    let b <- call InputNum();
+    let i <- 0;
+    while i < b do
+        if a != 1 then let a <- a + 1 fi;
+        let i <- i + 1
+    od;
+    call OutputNum(a)
+}.
+""")
+        smplCompiler.sccp()
+        check_users(self, smplCompiler)
+        write = next(inst for inst in insts(smplCompiler)
+                     if inst.op == SSA.OP.WRITE)
+        self.assertIsInstance(write.x, SSA.Const)
+        self.assertEqual(write.x.num, 1)
+        self.assertEqual(len([inst for inst in insts(smplCompiler)
+                              if inst.op == SSA.OP.PHI]), 1)
+
+    def test_examples(self):
+        for file in sorted(glob.glob(ROOT + "/code_example/*.smpl")):
+            with open(file) as f:
+                smplCompiler = compile_program(f.read())
+            smplCompiler.sccp()
+            check_users(self, smplCompiler)
+            smplCompiler.dump()
+            dump = smplCompiler.dump()
+            self.assertEqual(smplCompiler.sccp(), 0)
+            self.assertEqual(smplCompiler.dump(), dump)
+
+    def test_interpreter(self):
+        # The reference the outputs are compared with
+        for code, inputs, output in [
+            ("main var a, b, c, i; { let a <- call InputNum(); let b <- 3; "
+             "let i <- 0; while i < 3 do let c <- a; let a <- b; "
+             "let b <- c; let i <- i + 1 od; call OutputNum(a); "
+             "call OutputNum(b) }.", [10], [3, 10]),
+            ("main function fib(n); var a, b, t; { let a <- 0; let b <- 1; "
+             "while n > 0 do let t <- a + b; let a <- b; let b <- t; "
+             "let n <- n - 1 od; return a }; { call OutputNum(call fib(10)); "
+             "call OutputNewLine() }.", [], [55, "\n"]),
+            ("main var i; array[5] a; { let i <- 0; while i < 5 do "
+             "let a[i] <- i * i; let i <- i + 1 od; if a[2] > 3 then "
+             "call OutputNum(a[4]) else call OutputNum(a[1]) fi; "
+             "call OutputNum((0 - a[3]) / 2); call OutputNum(1 / 0) }.",
+             [], [16, -4, "error"])]:
+            self.assertEqual(
+                IRInterpreter(compile_program(code), inputs).run(), output)
+
+    def test_output(self):
+        # What the examples and random programs write, for some inputs
+        for file in sorted(glob.glob(ROOT + "/code_example/*.smpl")):
+            with open(file) as f:
+                code = f.read()
+            for inputs in ([], [3, -2, 5, 7, 1, 4], [0, 9, 0, 2, -6, 1]):
+                check_output(self, code, ["sccp"], inputs)
+        check_output(self, CODE, ["sccp"], [4])
+        rng = random.Random(23)
+        for _ in range(60):
+            check_output(self, random_program(rng), ["sccp"],
+                         [rng.randrange(-5, 10) for _ in range(20)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+import socket
+import tempfile
+import threading
+from Server import CompileServer
+from Client import Client
+import Batch
+
+
+GOOD = "main\nvar a, b;\n{\n    let a <- b + 1;\n    call OutputNum(a)\n}.\n"
+BAD = "main\nvar a;\n{\n    let a <- \n}.\n"
+# Takes far longer than the timeout of test_timeout
+SLOW = "main\nvar a, b;\n{\n" + "    let a <- a + b * 2;\n" * 3000 + \
+    "    call OutputNum(a)\n}.\n"
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "smpl.sock")
+        self.server = CompileServer(self.path, jobs=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_compile(self):
+        expected = Batch.compile_file("test.smpl", "test.smpl", source=GOOD,
+                                      trace="text")
+        with Client(self.path) as client:
+            self.assertTrue(client.ping())
+
+            # Several requests on one connection
+            for _ in range(2):
+                reply = client.compile(GOOD, "test.smpl", trace="text",
+                                       dot=True)
+                self.assertTrue(reply["ok"])
+                self.assertEqual(reply["ir"], expected.ir)
+                self.assertEqual(reply["diagnostics"], expected.diagnostics)
+                self.assertEqual(reply["trace"], expected.trace)
+                self.assertIn("digraph", reply["dot"])
+
+            reply = client.compile(BAD.encode(), "bad.smpl")
+            self.assertFalse(reply["ok"])
+            self.assertIsNone(reply["ir"])
+            self.assertIn("bad.smpl", reply["diagnostics"])
+
+    def test_timeout(self):
+        with Client(self.path) as client:
+            reply = client.compile(SLOW, "slow.smpl", timeout=0.01)
+            self.assertFalse(reply["ok"])
+            self.assertIn("timed out", reply["diagnostics"])
+
+            # The server goes on
+            self.assertTrue(client.compile(GOOD, "test.smpl")["ok"])
+
+    def test_shutdown(self):
+        # A running server is not replaced
+        with self.assertRaises(OSError):
+            CompileServer(self.path, jobs=1)
+
+        with Client(self.path) as client:
+            client.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_stale_socket(self):
+        path = os.path.join(self.tmp.name, "stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.close()
+
+        server = CompileServer(path, jobs=1)
+        server.server_close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
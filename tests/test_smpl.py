@@ -0,0 +1,66 @@
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(ROOT)
+
+import unittest
+import subprocess
+import tempfile
+import Batch
+
+
+WARNING = "main\nvar a, b;\n{\n    let a <- b + 1;\n    call OutputNum(a)\n}.\n"
+
+
+class TestSmpl(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "warning.smpl")
+        with open(self.src, "w") as f:
+            f.write(WARNING)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def smpl(self, *args) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, "-X", "importtime",
+                               os.path.join(ROOT, "smpl.py"), "-i", self.src]
+                              + list(args), cwd=self.tmp.name,
+                              capture_output=True, text=True, check=True)
+
+    def test_check(self):
+        proc = self.smpl("--check")
+        self.assertIn("uninitialized variable", proc.stdout)
+        self.assertEqual(os.listdir(self.tmp.name), ["warning.smpl"])
+        # graphviz, IRVis and the worker processes are not loaded
+        self.assertNotIn("graphviz", proc.stderr)
+        self.assertNotIn("IRVis", proc.stderr)
+        self.assertNotIn("multiprocessing", proc.stderr)
+
+    def test_dump_ir(self):
+        expected = Batch.compile_file(self.src, self.src)
+        proc = self.smpl("--dump-ir", "--no-trace")
+        self.assertEqual(proc.stdout, expected.diagnostics + expected.ir)
+        self.assertNotIn("graphviz", proc.stderr)
+        self.assertNotIn("IRVis", proc.stderr)
+
+        # The debug output, without the graph
+        self.smpl("--no-vis")
+        self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                         ["debug.txt", "warning.smpl"])
+
+    def test_ir_cache(self):
+        # The cache is used without --no-trace, and nothing is traced
+        expected = self.smpl("--dump-ir", "--no-trace")
+        for _ in range(2):
+            proc = self.smpl("--ir-cache", "cache", "--dump-ir")
+            self.assertEqual(proc.stdout, expected.stdout)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                         ["cache", "warning.smpl"])
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name,
+                                                     "cache"))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
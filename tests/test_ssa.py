@@ -4,6 +4,8 @@ import os
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
 
 from SSA import *
+from SmplCompiler import SmplCompiler
+import copy
 import unittest
 
 
@@ -41,3 +43,63 @@ class TestSSA(unittest.TestCase):
         self.assertEqual(i1.common_subexpression, None)
         self.assertEqual(i5.common_subexpression, i3)
 
+
+    def test_users(self):
+        i1 = Inst(OP.READ)
+        c = Const(3)
+        i2 = Inst(OP.ADD, i1, c)
+        self.assertEqual([id(u) for u in i1.get_users()], [id(i2)])
+        self.assertEqual([id(u) for u in c.get_users()], [id(i2)])
+
+        # Copies, e.g. in the value tables, share the users of the original
+        v = copy.copy(i1)
+        v.identifier = 5
+        i3 = Inst(OP.MUL, v, v)
+        self.assertIs(v.get_users(), i1.get_users())
+        self.assertEqual([id(u) for u in i1.get_users()],
+                         [id(i2), id(i3), id(i3)])
+
+        # Setting an operand moves the use
+        i3.y = c
+        self.assertEqual([id(u) for u in i1.get_users()], [id(i2), id(i3)])
+        self.assertEqual([id(u) for u in c.get_users()], [id(i2), id(i3)])
+
+        # Only the uses as the given copies, by the given blocks, are replaced
+        phi = Inst(OP.PHI, i2, v)
+        call = CallInst("f", [v, i1])
+        for inst in (i2, i3, call):
+            inst.bb = "loop"
+        v.replace_uses(phi, {id(v)}, {"loop"})
+        self.assertIs(i3.x, phi)
+        self.assertIs(i2.x, i1)
+        self.assertEqual(call.call_args, [phi, i1])
+        self.assertEqual([id(u) for u in i1.get_users()],
+                         [id(i2), id(phi), id(call)])
+        self.assertEqual([id(u) for u in phi.get_users()],
+                         [id(i3), id(call)])
+
+    def test_loop_uses(self):
+        smplCompiler = SmplCompiler.from_source(
+            "main var i; function f(x); { return x + 1 }; {\n"
+            "    let i <- 0;\n"
+            "    while i < 3 do call OutputNum(call f(i)); let i <- i + 1 od\n"
+            "}.\n")
+        smplCompiler.computation()
+        insts = [inst for inst in smplCompiler.ctx.all_ssa
+                 if isinstance(inst, Inst)]
+        phi, = [inst for inst in insts if inst.op == OP.PHI]
+        call, = [inst for inst in insts if isinstance(inst, CallInst)]
+        self.assertIs(call.call_args[0].original, phi)
+
+        # The users are the operands of the instructions, once per operand
+        uses = {}
+        for inst in insts:
+            operands = inst.call_args if isinstance(inst, CallInst) \
+                else (inst.x, inst.y)
+            for operand in operands:
+                if isinstance(operand, SSAValue):
+                    uses.setdefault(id(operand.original), []).append(id(inst))
+        for value in smplCompiler.ctx.all_ssa:
+            if isinstance(value, SSAValue):
+                self.assertEqual(sorted(id(u) for u in value.get_users()),
+                                 sorted(uses.get(id(value), [])))
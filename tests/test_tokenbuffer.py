@@ -0,0 +1,123 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+import unittest
+from Tokenizer import SliceTokenizer, Token, SourceMap
+from TokenBuffer import TokenBuffer, ReplayTokenizer, TokenCache
+import tempfile
+
+
+class TestTokenBuffer(unittest.TestCase):
+    code = "main\nvar a;\n{\tlet a <- 12345678901234567890 + a;\n" \
+        "call OutputNum(a)\n}.\n"
+
+    def tokens(self, tokenizer):
+        ret = []
+        while True:
+            token = tokenizer.getNext()
+            ret.append((token.type, token.value, token.sym, token.line,
+                        token.col))
+            if token.type in [Token.EOF, Token.ERROR]:
+                return ret
+
+    def test_replay(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(self.code)
+            expected = self.tokens(SliceTokenizer(tmp.name, use_mmap=True))
+
+            buffer = TokenBuffer.scan(SliceTokenizer(tmp.name, use_mmap=True))
+            self.assertEqual(buffer.names, ["a", "OutputNum"])
+            self.assertEqual(self.tokens(ReplayTokenizer(buffer)), expected)
+
+            # The same stream after a round trip through the binary format
+            code = buffer.source.code
+            loaded = TokenBuffer.from_bytes(buffer.to_bytes(), tmp.name, code)
+            replay = ReplayTokenizer(loaded)
+            self.assertEqual(self.tokens(replay), expected)
+            self.assertEqual(replay.string2id("OutputNum"), 1)
+
+            # The last token is repeated
+            self.assertEqual(replay.getNext().type, Token.EOF)
+
+            with self.assertRaises(ValueError):
+                TokenBuffer.from_bytes(b"X" * 64, tmp.name, code)
+
+    def test_token_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "a.smpl")
+            with open(src, "w") as f:
+                f.write(self.code)
+            # Names of the cache are added before scanning
+            names = ["InputNum", "OutputNum"]
+            tokenizer = SliceTokenizer(src)
+            for name in names:
+                tokenizer.add_name(name)
+            expected = self.tokens(tokenizer)
+
+            cache = TokenCache(os.path.join(tmp, "cache"), names=names)
+            tokenizer = cache.tokenizer(src)
+            self.assertEqual((cache.hits, cache.misses), (0, 1))
+            self.assertEqual(tokenizer.string2id("OutputNum"), 1)
+            self.assertEqual(self.tokens(tokenizer), expected)
+
+            tokenizer = cache.tokenizer(src)
+            self.assertIsInstance(tokenizer, ReplayTokenizer)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(self.tokens(tokenizer), expected)
+
+            # Keyed by the content
+            with open(src, "a") as f:
+                f.write("\n")
+            cache.tokenizer(src)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(len(os.listdir(cache.directory)), 2)
+
+    def test_relex(self):
+        # Tabs are kept in the buffer, as with a memory-mapped file
+        source = SourceMap("a.smpl", self.code)
+        buffer = TokenBuffer.scan(SliceTokenizer.resume(source, 0, []))
+
+        def check(buffer: TokenBuffer, offset, removed, inserted):
+            new = buffer.relex(offset, removed, inserted)
+            # Scan the whole source again, with the ids known before the edit
+            tokenizer = SliceTokenizer.resume(new.source, 0, buffer.names)
+            expected = TokenBuffer.scan(tokenizer)
+            self.assertEqual(self.tokens(ReplayTokenizer(new)),
+                             self.tokens(ReplayTokenizer(expected)))
+            return new
+
+        # Rename a in "let a": only that token is scanned again
+        offset = self.code.index("a <-")
+        new = check(buffer, offset, 1, "b")
+        self.assertEqual(new.relexed, (6, 7))
+        self.assertEqual(new.names, ["a", "OutputNum", "b"])
+        self.assertEqual(new.source.code, self.code.replace("a <-", "b <-"))
+
+        # Merge "a" and "OutputNum" into "aOutputNum" by removing the call.
+        # Ids of untouched identifiers do not change.
+        offset = self.code.index("call")
+        new = check(new, offset - 2, 7, "")
+        self.assertEqual(new.names, ["a", "OutputNum", "b", "aOutputNum"])
+        self.assertEqual(new.token(new.relexed[0]).sym, "aOutputNum")
+        self.assertEqual(new.token(2).value, 0)
+
+        # New lines and tabs before the first token. Nothing is scanned again.
+        new = check(new, 0, 0, "\n\t")
+        self.assertEqual(new.relexed, (0, 0))
+        self.assertEqual(new.source.line_cnt(), 6)
+        self.assertEqual((new.token(1).line, new.token(1).col), (3, 1))
+
+        # Append to the last identifier or number, which grows
+        for code, last in [("let a <- b", "b2"), ("let a <- 1", "12"),
+                           ("let a <- b ", "2")]:
+            buffer = TokenBuffer.scan(SliceTokenizer.resume(
+                SourceMap("a.smpl", code), 0, []))
+            new = check(buffer, len(code), 0, "2")
+            self.assertEqual(new.token(len(new) - 2).sym, last)
+
+        # Remove everything
+        new = check(new, 0, len(new.source.code), "")
+        self.assertEqual(len(new), 1)
@@ -4,7 +4,7 @@ import os
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
 
 import unittest
-from Tokenizer import Tokenizer, Token
+from Tokenizer import Tokenizer, SliceTokenizer, Token, SourceMap
 import io
 import tempfile
 
@@ -150,3 +150,105 @@ class TestTokennizer(unittest.TestCase):
         self.assertEqual((token.line, token.col), (3, 1))
         self.assertEqual(token.type, Token.PERIOD)
         self.assertEqual(token.sym, ".")
+
+    def test_slice_tokenizer(self):
+        # The slice-based scanner must produce the same token stream as the
+        # per-character tokenizer
+        code = """main
+	var a, b;
+{
+	let a <- call InputNum();
+	if a >= 10 then let b <- a * 2 fi;
+	while b != a do let b <- b - 1 od;
+	call OutputNum(b)
+}.
+"""
+
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(code)
+            tokenizer = Tokenizer(tmp.name)
+            sliceTokenizer = SliceTokenizer(tmp.name)
+
+        while True:
+            token = tokenizer.getNext()
+            sliceToken = sliceTokenizer.getNext()
+            self.assertEqual(str(sliceToken), str(token))
+            if token.type == Token.NUMBER:
+                self.assertEqual(sliceTokenizer.num, tokenizer.num)
+            if token.type == Token.IDENT:
+                self.assertEqual(sliceTokenizer.id, tokenizer.id)
+            if token.type == Token.EOF:
+                break
+        self.assertEqual(sliceTokenizer.names, tokenizer.names)
+
+    def test_slice_tokenizer_error(self):
+        code = "let a <- b = c"
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(code)
+            tokenizer = SliceTokenizer(tmp.name)
+
+        for _type in [Token.LET, Token.IDENT, Token.BECOMES, Token.IDENT]:
+            self.assertEqual(tokenizer.getNext().type, _type)
+
+        sys.stderr = io.StringIO()
+        token = tokenizer.getNext()
+        self.assertEqual(token.type, Token.ERROR)
+        self.assertEqual((token.line, token.col, token.sym), (1, 12, "="))
+        self.assertTrue(tokenizer.is_error)
+        self.assertEqual(sys.stderr.getvalue(),
+                         f"Tokenizer error: Fail to parse token: {token}\n")
+        self.assertEqual(tokenizer.getNext().type, Token.ERROR)
+        sys.stderr = sys.__stderr__
+
+    def test_source_map(self):
+        code = "main\n\tvar a;\n{ let a <- 1 }.\n"
+        source = SourceMap("test.smpl", code.expandtabs(4))
+
+        self.assertEqual(list(source.line_starts), [0, 5, 16, 32])
+        self.assertEqual(source.line_col(0), (1, 1))
+        self.assertEqual(source.line_col(4), (1, 5))
+        self.assertEqual(source.line_col(9), (2, 5))
+        self.assertEqual(source.line_col(22), (3, 7))
+        self.assertEqual(source.line_text(2), "    var a;\n")
+        self.assertEqual(source.source_loc(3, 7, 1),
+                         "test.smpl(3:7)\n{ let a <- 1 }.\n      ^")
+
+        # Tabs are expanded on demand for unexpanded buffers
+        source = SourceMap("test.smpl", code.encode())
+        self.assertEqual(source.line_col(6), (2, 5))
+        self.assertEqual(source.line_text(2), "    var a;\n")
+
+    def test_source_loc(self):
+        # Diagnostics resolve from the tokenizer's source map, the file is not
+        # read again
+        code = "var1 <- 32 ;\n\tvar2 <-15;"
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(code)
+            tokenizer = SliceTokenizer(tmp.name)
+
+        for _ in range(6):
+            token = tokenizer.getNext()
+        self.assertEqual(token.sym, "<-")
+        self.assertEqual(token.source_loc(),
+                         f"{tmp.name}(2:10)\n    var2 <-15;         ^^")
+
+    def test_token_lazy_position(self):
+        code = "main\n  var  abc;"
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, "w") as f:
+                f.write(code)
+            tokenizer = SliceTokenizer(tmp.name)
+
+        tokenizer.getNext()
+        tokenizer.getNext()
+        token = tokenizer.getNext()
+
+        # Only type, offset, length and value are stored
+        self.assertFalse(hasattr(token, "__dict__"))
+        self.assertEqual((token.type, token.offset, token.length, token.value),
+                         (Token.IDENT, 12, 3, tokenizer.string2id("abc")))
+        self.assertEqual((token.file, token.line, token.col, token.sym),
+                         (tmp.name, 2, 8, "abc"))